@@ -1,58 +1,152 @@
 """Python Segment Anything Model 2 (pysam)."""
 
-from dataclasses import dataclass
-from enum import Enum
-from typing import Type
+import json
+import os
+import posixpath
+from enum import StrEnum
 
 import ray
 import typer
 from rich.console import Console
 from rich.table import Table
 
+import py_sam.bench
+import py_sam.cache
+import py_sam.checkpoint
+import py_sam.concurrency
+import py_sam.dedup
+import py_sam.discovery
+import py_sam.execution
 import py_sam.model.context
+import py_sam.onnx_backend
+import py_sam.output
+import py_sam.profiles
+import py_sam.profiling
+import py_sam.prompting
+import py_sam.tiling
+import py_sam.video
 from py_sam import fbr_sam
 from py_sam.model import Model
 
 
-@dataclass(frozen=True)
-class FileFormatEnum(str, Enum):
+class FileFormatEnum(StrEnum):
     """ray.data.Dataset.write_images supported file formats."""
 
     PNG = "PNG"
     JPEG = "JPEG"
 
 
-app = typer.Typer(
-    add_completion=False, help="Python Segment-Anything Model CLI toolkit."
-)
+class OutputModeEnum(StrEnum):
+    """SAM 2 mask output modes."""
+
+    OVERLAY = "overlay"
+    COCO_RLE = "coco_rle"
+    NPZ = "npz"
+    PARQUET = "parquet"
+
+
+class VideoOutputModeEnum(StrEnum):
+    """SAM 2 video frame mask output modes."""
+
+    OVERLAY = "overlay"
+    COCO_RLE = "coco_rle"
+    NPZ = "npz"
+
+
+class ServeOutputModeEnum(StrEnum):
+    """Segmentation service response formats."""
+
+    COCO_RLE = "coco_rle"
+    NPZ = "npz"
+
+
+class ProfileEnum(StrEnum):
+    """SAM 2 mask generation performance profiles."""
+
+    FAST = "fast"
+    BALANCED = "balanced"
+    QUALITY = "quality"
+
+
+class PrecisionEnum(StrEnum):
+    """SAM 2 model execution precisions."""
+
+    FP32 = "fp32"
+    BF16 = "bf16"
+
+
+class EngineEnum(StrEnum):
+    """SAM 2 model inference engines."""
+
+    TORCH = "torch"
+    ONNX = "onnx"
+
+
+class DownloadEnum(StrEnum):
+    """Pre-trained weight downloads."""
+
+    HIERA_B = "hiera_b"
+    HIERA_L = "hiera_l"
+    HIERA_S = "hiera_s"
+    HIERA_T = "hiera_t"
+    ALL = "all"
+
+
+class ProfilerEnum(StrEnum):
+    """Actor profilers."""
+
+    TORCH = "torch"
+    CPROFILE = "cprofile"
+
+
+app = typer.Typer(add_completion=False, help="Python Segment-Anything Model CLI toolkit.")
 
 fbr_app = typer.Typer(add_completion=False, help="Facebook Research SAM 2 interface.")
 app.add_typer(fbr_app, name="fbr")
 
 
+def model_weight(model_type: py_sam.model.context.FbrSamEnum | None) -> type[Model]:
+    """Return the pre-trained weight of the `--model` option, `hiera_l` if not set."""
+    return py_sam.model.context.FbrSam[(model_type or py_sam.model.context.FbrSamEnum.HIERA_L).name].value
+
+
+def parse_mask_settings(mask_setting: list[str] | None) -> dict | None:
+    """Parse the mask generator setting overrides of the `--mask-setting` options."""
+    try:
+        return py_sam.profiles.parse_overrides(mask_setting or []) or None
+    except ValueError as err:
+        raise typer.BadParameter(str(err), param_hint="--mask-setting") from err
+
+
 @fbr_app.command("models")
 def models(
-    download: py_sam.model.context.FbrSamEnum = typer.Option(  # noqa: B008
+    download: DownloadEnum = typer.Option(  # noqa: B008
         None,
-        help="Download Facebook Research pre-trained weight.",
+        help="Download a Facebook Research pre-trained weight, or all of them in parallel.",
         show_choices=True,
         show_default=False,
     ),
-    weights_list: bool = typer.Option(
-        False, "--list", help="List local Facebook Research SAM 2 weights."
+    export_onnx: py_sam.model.context.FbrSamEnum = typer.Option(  # noqa: B008
+        None,
+        "--export-onnx",
+        help="Export the ONNX graphs of a pre-trained weight into the model cache.",
+        show_choices=True,
+        show_default=False,
     ),
+    weights_list: bool = typer.Option(False, "--list", help="List local Facebook Research SAM 2 weights."),
 ) -> None:
     """Facebook Research SAM 2 actions."""
     console = Console()
 
-    if download == "hiera_b":
-        py_sam.model.context.FbrSam.HIERA_B.value().download()
-    elif download == "hiera_l":
-        py_sam.model.context.FbrSam.HIERA_L.value().download()
-    elif download == "hiera_s":
-        py_sam.model.context.FbrSam.HIERA_S.value().download()
-    elif download == "hiera_t":
-        py_sam.model.context.FbrSam.HIERA_T.value().download()
+    if download is not None:
+        py_sam.checkpoint.fetch([
+            weight.value()
+            for weight in py_sam.model.context.FbrSam
+            if download in (DownloadEnum.ALL, weight.name.lower())
+        ])
+
+    if export_onnx is not None:
+        py_sam.onnx_backend.export(py_sam.model.context.FbrSam[export_onnx.name].value())
     weights_list = True
 
     if weights_list:
@@ -66,11 +160,25 @@ def models(
 
 
 @fbr_app.command("predict")
-def fbr_predict(
+def fbr_predict(  # noqa: PLR0913, PLR0917 - typer maps each command line option to a parameter
     input_path: str = typer.Option(
+        None,
         help="Source resource to feed into the Facebook Research SAM 2 predictor.",
         show_default=False,
     ),
+    input_manifest: str = typer.Option(
+        None,
+        help=(
+            "Text file (one image URI per line) or Parquet dataset (path column) of the "
+            "source images (default: PY_SAM__INPUT_MANIFEST)."
+        ),
+        show_default=False,
+    ),
+    streaming_discovery: bool = typer.Option(
+        False,
+        "--streaming-discovery",
+        help="Page through the input path listing as the pipeline runs (default: PY_SAM__STREAMING_DISCOVERY).",
+    ),
     model_type: py_sam.model.context.FbrSamEnum = typer.Option(  # noqa: B008
         None,
         "--model",
@@ -91,27 +199,630 @@ def fbr_predict(
         show_choices=True,
         show_default=True,
     ),
+    output_mode: OutputModeEnum = typer.Option(  # noqa: B008
+        OutputModeEnum.OVERLAY.value,
+        "--output-mode",
+        help="Write rendered overlay images, or the raw masks as COCO RLE JSON, packed NPZ or Parquet rows.",
+        show_choices=True,
+        show_default=True,
+    ),
+    incremental: bool = typer.Option(
+        False,
+        "--incremental",
+        help="Skip source images already recorded in the manifest or with an existing output file.",
+    ),
+    manifest_path: str = typer.Option(
+        None,
+        "--manifest-path",
+        help="Incremental run manifest location (default: <output-path>/_manifest).",
+        show_default=False,
+    ),
+    cache_path: str = typer.Option(
+        None,
+        "--cache-path",
+        help="Mask result cache location, local or s3:// (default: PY_SAM__CACHE_PATH).",
+        show_default=False,
+    ),
+    cache_max_bytes: int = typer.Option(
+        None,
+        "--cache-max-bytes",
+        help="Mask result cache size limit with LRU eviction (default: PY_SAM__CACHE_MAX_BYTES).",
+        min=1,
+        show_default=False,
+    ),
+    batch_size: int = typer.Option(
+        None,
+        "--batch-size",
+        help="Run the image encoder over batches of this many images (default: one image at a time).",
+        min=1,
+        show_default=False,
+    ),
+    tile_size: int = typer.Option(
+        None,
+        "--tile-size",
+        help="Generate masks over overlapping tiles of this size for images with a longer side.",
+        min=64,
+        show_default=False,
+    ),
+    tile_overlap: int = typer.Option(
+        128,
+        "--tile-overlap",
+        help="Number of pixels shared by neighbouring tiles.",
+        min=0,
+        show_default=True,
+    ),
+    max_side: int = typer.Option(
+        None,
+        "--max-side",
+        help="Decode source images with the longer side capped at this size (masks are written at source size).",
+        min=64,
+        show_default=False,
+    ),
+    dedup_distance: int = typer.Option(
+        None,
+        "--dedup-distance",
+        help=(
+            "Generate masks once per group of near-duplicate images within this "
+            "perceptual hash Hamming distance (default: PY_SAM__DEDUP_DISTANCE)."
+        ),
+        min=0,
+        max=64,
+        show_default=False,
+    ),
+    dedup_window: int = typer.Option(
+        None,
+        "--dedup-window",
+        help=(
+            "Number of recent representative images each actor matches near-duplicates "
+            "against (default: PY_SAM__DEDUP_WINDOW or 8)."
+        ),
+        min=1,
+        show_default=False,
+    ),
+    profile: ProfileEnum = typer.Option(  # noqa: B008
+        None,
+        "--profile",
+        help="Mask generation profile trading quality for throughput (default: PY_SAM__PROFILE or balanced).",
+        show_choices=True,
+        show_default=False,
+    ),
+    mask_setting: list[str] = typer.Option(  # noqa: B008
+        None,
+        "--mask-setting",
+        help="Override a mask generator setting of the profile as NAME=VALUE (repeatable).",
+        show_default=False,
+    ),
+    precision: PrecisionEnum = typer.Option(  # noqa: B008
+        None,
+        "--precision",
+        help="Model precision, bf16 runs under bfloat16 autocast (default: PY_SAM__PRECISION or fp32).",
+        show_choices=True,
+        show_default=False,
+    ),
+    compile_encoder: bool = typer.Option(
+        False,
+        "--compile-encoder",
+        help="Compile the image encoder with torch.compile at actor start (default: PY_SAM__COMPILE_ENCODER).",
+    ),
+    inference_mode: bool = typer.Option(
+        False,
+        "--inference-mode",
+        help="Run mask generation under torch.inference_mode (default: PY_SAM__INFERENCE_MODE).",
+    ),
+    quantize: bool = typer.Option(
+        False,
+        "--quantize",
+        help="Run a dynamic INT8 quantized model on CPU (default: PY_SAM__QUANTIZE).",
+    ),
+    engine: EngineEnum = typer.Option(  # noqa: B008
+        None,
+        "--engine",
+        help="Model inference engine, onnx runs on ONNX Runtime CPU (default: PY_SAM__ENGINE or torch).",
+        show_choices=True,
+        show_default=False,
+    ),
+    profiler: ProfilerEnum = typer.Option(  # noqa: B008
+        None,
+        "--profiler",
+        help="Profile the first images in each actor with torch.profiler or cProfile (default: PY_SAM__PROFILER).",
+        show_choices=True,
+        show_default=False,
+    ),
+    profile_images: int = typer.Option(
+        None,
+        min=1,
+        help="Number of images to profile in each actor (default: PY_SAM__PROFILE_IMAGES or 1).",
+        show_default=False,
+    ),
+    profile_path: str = typer.Option(
+        None,
+        help="Profile trace location, local or s3:// (default: PY_SAM__PROFILE_PATH or <output-path>/_profiles).",
+        show_default=False,
+    ),
+    read_concurrency: int = typer.Option(
+        None,
+        min=1,
+        help="Number of concurrent read tasks (default: PY_SAM__READ_CONCURRENCY).",
+        show_default=False,
+    ),
+    inference_concurrency: int = typer.Option(
+        None,
+        min=1,
+        help="Minimum size of the inference actor pool (default: PY_SAM__INFERENCE_CONCURRENCY).",
+        show_default=False,
+    ),
+    inference_max_concurrency: int = typer.Option(
+        None,
+        "--max-inference-actors",
+        min=1,
+        help="Autoscale the inference actor pool up to this size (default: PY_SAM__INFERENCE_MAX_CONCURRENCY).",
+        show_default=False,
+    ),
+    write_concurrency: int = typer.Option(
+        None,
+        min=1,
+        help="Number of concurrent write tasks (default: PY_SAM__WRITE_CONCURRENCY).",
+        show_default=False,
+    ),
+    auto_concurrency: bool = typer.Option(
+        False,
+        "--auto-concurrency",
+        help="Size the unset stage concurrency from the cluster CPUs/GPUs (default: PY_SAM__AUTO_CONCURRENCY).",
+    ),
 ) -> None:
     """Facebook Research SAM 2 predict."""
     console = Console()
 
-    model: Type[py_sam.model.Model] = py_sam.model.context.FbrSam.HIERA_L.value
-    if model_type == "hiera_t":
-        model = py_sam.model.context.FbrSam.HIERA_T.value
-    elif model_type == "hiera_s":
-        model = py_sam.model.context.FbrSam.HIERA_S.value
-    elif model_type == "hiera_b":
-        model = py_sam.model.context.FbrSam.HIERA_B.value
+    if input_path is not None and input_manifest is not None:
+        msg = "Use one of --input-path or --input-manifest"
+        raise typer.BadParameter(msg, param_hint="--input-manifest")
+    if input_path is None and not (input_manifest or os.environ.get("PY_SAM__INPUT_MANIFEST")):
+        msg = "Missing --input-path or --input-manifest"
+        raise typer.BadParameter(msg, param_hint="--input-path")
+    if output_path is None:
+        msg = "Missing --output-path"
+        raise typer.BadParameter(msg, param_hint="--output-path")
 
+    tiling = None
+    if tile_size is not None:
+        try:
+            tiling = py_sam.tiling.TileSettings(tile_size, overlap=tile_overlap, batch_size=batch_size or 1)
+        except ValueError as err:
+            raise typer.BadParameter(str(err), param_hint="--tile-overlap") from err
+
+    mask_settings = parse_mask_settings(mask_setting)
+    model = model_weight(model_type)
     console.print(f"📐 Model pre-trained weight: {model}")
 
+    model_type_name = model().model_type
+    try:
+        settings = fbr_sam.FbrSamSettings.from_environment(
+            model_type_name,
+            output_mode=output_mode.value,
+            batch_size=batch_size,
+            profile=profile.value if profile is not None else None,
+            mask_settings=mask_settings,
+            execution=py_sam.execution.ExecutionSettings.from_environment(
+                model_type_name,
+                precision=precision.value if precision is not None else None,
+                compile_encoder=compile_encoder or None,
+                inference_mode=inference_mode or None,
+                quantize=quantize or None,
+                engine=engine.value if engine is not None else None,
+            ),
+            cache=py_sam.cache.CacheSettings.from_environment(cache_path, cache_max_bytes),
+            tiling=tiling,
+            profiler=py_sam.profiling.ProfilerSettings.from_environment(
+                profiler.value if profiler is not None else None,
+                profile_images,
+                profile_path,
+                default_path=posixpath.join(output_path, py_sam.profiling.PROFILES_DIRNAME),
+            ),
+            dedup=py_sam.dedup.DedupSettings.from_environment(dedup_distance, dedup_window),
+        )
+    except ValueError as err:
+        raise typer.BadParameter(str(err)) from err
+
     ray.init()
     fbr_sam.FbrSam.process(
-        source_data_path=input_path,
+        py_sam.discovery.SourceSettings.from_environment(
+            input_path, input_manifest, streaming_discovery or None, max_side
+        ),
+        py_sam.output.OutputSettings(
+            output_path,
+            flatten=flatten_output,
+            file_format=output_file_format.value,
+            incremental=incremental,
+            manifest_path=manifest_path,
+        ),
+        model=model,
+        settings=settings,
+        concurrency=py_sam.concurrency.ConcurrencySettings(
+            read=read_concurrency,
+            inference_min=inference_concurrency,
+            inference_max=inference_max_concurrency,
+            write=write_concurrency,
+            auto=auto_concurrency or None,
+        ),
+    )
+
+
+@fbr_app.command("predict-video")
+def fbr_predict_video(  # noqa: PLR0913, PLR0917 - typer maps each command line option to a parameter
+    input_path: str = typer.Option(
+        ...,
+        help="Source video file or directory, local or s3://.",
+        show_default=False,
+    ),
+    output_path: str = typer.Option(
+        ...,
+        help="Directory to write out the SAM 2 frame masks (<output-path>/<video>/<frame>).",
+        show_default=False,
+    ),
+    model_type: py_sam.model.context.FbrSamEnum = typer.Option(  # noqa: B008
+        None,
+        "--model",
+        help="The model pre-trained weights to use for predictions (default: hiera_l).",
+        show_choices=True,
+        show_default=False,
+    ),
+    output_mode: VideoOutputModeEnum = typer.Option(  # noqa: B008
+        VideoOutputModeEnum.OVERLAY.value,
+        "--output-mode",
+        help="Write rendered overlay frames, or the raw frame masks as COCO RLE JSON or packed NPZ.",
+        show_choices=True,
+        show_default=True,
+    ),
+    output_file_format: FileFormatEnum = typer.Option(  # noqa: B008
+        FileFormatEnum.PNG.value,
+        "--output-file-format",
+        help="The image file format of overlay frames.",
+        show_choices=True,
+        show_default=True,
+    ),
+    chunk_frames: int = typer.Option(
+        py_sam.video.DEFAULT_CHUNK_FRAMES,
+        "--chunk-frames",
+        min=1,
+        help="Split videos into chunks of this many frames, segmented in parallel.",
+    ),
+    max_objects: int = typer.Option(
+        py_sam.video.DEFAULT_MAX_OBJECTS,
+        "--max-objects",
+        min=1,
+        help="Most objects from the first frame of each chunk to track.",
+    ),
+    profile: ProfileEnum = typer.Option(  # noqa: B008
+        None,
+        "--profile",
+        help="First frame mask generation profile (default: PY_SAM__PROFILE or balanced).",
+        show_choices=True,
+        show_default=False,
+    ),
+    mask_setting: list[str] = typer.Option(  # noqa: B008
+        None,
+        "--mask-setting",
+        help="Override a mask generator setting of the profile as NAME=VALUE (repeatable).",
+        show_default=False,
+    ),
+    precision: PrecisionEnum = typer.Option(  # noqa: B008
+        None,
+        "--precision",
+        help="Model precision, bf16 runs under bfloat16 autocast (default: PY_SAM__PRECISION or fp32).",
+        show_choices=True,
+        show_default=False,
+    ),
+    inference_mode: bool = typer.Option(
+        False,
+        "--inference-mode",
+        help="Run under torch.inference_mode (default: PY_SAM__INFERENCE_MODE).",
+    ),
+    read_concurrency: int = typer.Option(
+        None,
+        min=1,
+        help="Number of concurrent video probe tasks (default: PY_SAM__READ_CONCURRENCY).",
+        show_default=False,
+    ),
+    inference_concurrency: int = typer.Option(
+        None,
+        min=1,
+        help="Minimum size of the video actor pool (default: PY_SAM__INFERENCE_CONCURRENCY).",
+        show_default=False,
+    ),
+    inference_max_concurrency: int = typer.Option(
+        None,
+        "--max-inference-actors",
+        min=1,
+        help="Autoscale the video actor pool up to this size (default: PY_SAM__INFERENCE_MAX_CONCURRENCY).",
+        show_default=False,
+    ),
+    auto_concurrency: bool = typer.Option(
+        False,
+        "--auto-concurrency",
+        help="Size the unset concurrency from the cluster CPUs/GPUs (default: PY_SAM__AUTO_CONCURRENCY).",
+    ),
+) -> None:
+    """Facebook Research SAM 2 video predict."""
+    console = Console()
+
+    mask_settings = parse_mask_settings(mask_setting)
+    model = model_weight(model_type)
+    console.print(f"📐 Model pre-trained weight: {model}")
+
+    try:
+        settings = py_sam.video.VideoSettings.from_environment(
+            output_mode=output_mode.value,
+            file_format=output_file_format.value,
+            chunk_frames=chunk_frames,
+            max_objects=max_objects,
+            profile=profile.value if profile is not None else None,
+            mask_settings=mask_settings,
+            precision=precision.value if precision is not None else None,
+            inference_mode=inference_mode or None,
+        )
+    except ValueError as err:
+        raise typer.BadParameter(str(err)) from err
+
+    ray.init()
+    summary = py_sam.video.VideoSam.process(
+        input_path,
+        output_path,
+        model=model,
+        settings=settings,
+        concurrency=py_sam.concurrency.ConcurrencySettings(
+            read=read_concurrency,
+            inference_min=inference_concurrency,
+            inference_max=inference_max_concurrency,
+            auto=auto_concurrency or None,
+        ),
+    )
+    console.print(
+        f"🎞️  Segmented {sum(row['frames'] for row in summary)} frame(s) over "
+        f"{len(summary)} chunk(s) of {len({row['path'] for row in summary})} video(s)"
+    )
+
+
+@fbr_app.command("bench")
+def fbr_bench(  # noqa: PLR0913, PLR0917 - typer maps each command line option to a parameter
+    model_types: list[py_sam.model.context.FbrSamEnum] = typer.Option(  # noqa: B008
+        None,
+        "--model",
+        help="Pre-trained weight to benchmark (repeatable, default: all).",
+        show_choices=True,
+        show_default=False,
+    ),
+    resolutions: list[int] = typer.Option(  # noqa: B008
+        None,
+        "--resolution",
+        help="Longer side of the benchmark images (repeatable, default: 512 and 1024).",
+        min=64,
+        show_default=False,
+    ),
+    input_path: str = typer.Option(
+        None,
+        help="Local directory of source images (default: a synthetic image).",
+        show_default=False,
+    ),
+    output_mode: OutputModeEnum = typer.Option(  # noqa: B008
+        OutputModeEnum.COCO_RLE,
+        help="Output mode of the encode stage.",
+        show_choices=True,
+    ),
+    output_file_format: FileFormatEnum = typer.Option(  # noqa: B008
+        FileFormatEnum.PNG.value,
+        "--output-file-format",
+        help="The image file format of the encode stage in overlay output mode.",
+        show_choices=True,
+        show_default=True,
+    ),
+    profile: ProfileEnum = typer.Option(  # noqa: B008
+        ProfileEnum.BALANCED,
+        help="Mask generation profile.",
+        show_choices=True,
+    ),
+    mask_setting: list[str] = typer.Option(  # noqa: B008
+        None,
+        "--mask-setting",
+        help="Override a mask generator setting of the profile as NAME=VALUE (repeatable).",
+        show_default=False,
+    ),
+    engine: EngineEnum = typer.Option(  # noqa: B008
+        EngineEnum.TORCH,
+        help="Model inference engine.",
+        show_choices=True,
+    ),
+    in_process: bool = typer.Option(
+        False,
+        "--in-process",
+        help="Benchmark every pre-trained weight in this process (peak RSS is then shared).",
+    ),
+    output: str = typer.Option(
+        None,
+        help="File to write the JSON benchmark report to (default: stdout).",
+        show_default=False,
+    ),
+) -> None:
+    """Facebook Research SAM 2 per-stage pipeline benchmarks."""
+    # The JSON report goes to stdout when no output file is given, so keep the table apart.
+    console = Console(stderr=output is None)
+
+    mask_settings = parse_mask_settings(mask_setting)
+    models = [
+        py_sam.model.context.FbrSam[model_type.name].value
+        for model_type in model_types or list(py_sam.model.context.FbrSamEnum)
+    ]
+    report = py_sam.bench.run(
+        models,
+        input_path=input_path,
+        resolutions=tuple(resolutions or py_sam.bench.DEFAULT_RESOLUTIONS),
+        isolate=not in_process,
+        file_format=output_file_format.value,
+        output_mode=output_mode.value,
+        profile=profile.value,
+        mask_settings=mask_settings,
+        execution=py_sam.execution.ExecutionSettings(engine=engine.value),
+    )
+
+    table = Table(title="Facebook Research SAM 2 benchmark (seconds)")
+    for column in (
+        "Model",
+        "Resolution",
+        "Build",
+        *(stage.capitalize() for stage in py_sam.bench.STAGES),
+        "Masks",
+        "Images/s",
+        "Peak RSS (MB)",
+    ):
+        table.add_column(column, justify="right")
+    for result in report["models"]:
+        for resolution in result["resolutions"]:
+            table.add_row(
+                result["model_type"],
+                str(resolution["resolution"]),
+                f"{result['build_seconds']:.2f}",
+                *(f"{value:.3f}" for value in resolution["seconds"].values()),
+                str(resolution["masks"]),
+                f"{resolution['images_per_second'] or 0:.3f}",
+                f"{result['peak_rss_bytes'] / 2**20:.0f}",
+            )
+    console.print(table)
+
+    document = json.dumps(report, indent=2)
+    if output is None:
+        print(document)
+    else:
+        with open(output, "w", encoding="utf-8") as file:
+            file.write(document)
+        console.print(f"📊 Benchmark report written to {output}")
+
+
+@fbr_app.command("serve")
+def fbr_serve(  # noqa: PLR0913, PLR0917 - typer maps each command line option to a parameter
+    model_type: py_sam.model.context.FbrSamEnum = typer.Option(  # noqa: B008
+        None,
+        "--model",
+        help="The model pre-trained weights to serve (default: hiera_l).",
+        show_choices=True,
+        show_default=False,
+    ),
+    host: str = typer.Option("127.0.0.1", help="HTTP listen address."),
+    port: int = typer.Option(8000, min=1, max=65535, help="HTTP listen port."),
+    replicas: int = typer.Option(1, min=1, help="Number of warm SAM 2 replicas behind the endpoint."),
+    max_batch_size: int = typer.Option(8, min=1, help="Maximum number of concurrent requests in each batch."),
+    batch_wait_timeout: float = typer.Option(
+        0.01,
+        min=0.0,
+        help="Longest wait in seconds for a batch to fill.",
+    ),
+    output_mode: ServeOutputModeEnum = typer.Option(  # noqa: B008
+        ServeOutputModeEnum.COCO_RLE.value,
+        "--output-mode",
+        help="Respond with the masks as COCO RLE JSON or packed NPZ.",
+        show_choices=True,
+        show_default=True,
+    ),
+    max_side: int = typer.Option(
+        None,
+        "--max-side",
+        help="Decode request images with the longer side capped at this size (masks are returned at source size).",
+        min=64,
+        show_default=False,
+    ),
+    profile: ProfileEnum = typer.Option(  # noqa: B008
+        None,
+        "--profile",
+        help="Mask generation profile trading quality for latency (default: balanced).",
+        show_choices=True,
+        show_default=False,
+    ),
+    mask_setting: list[str] = typer.Option(  # noqa: B008
+        None,
+        "--mask-setting",
+        help="Override a mask generator setting of the profile as NAME=VALUE (repeatable).",
+        show_default=False,
+    ),
+    precision: PrecisionEnum = typer.Option(  # noqa: B008
+        None,
+        "--precision",
+        help="Model precision, bf16 runs under bfloat16 autocast (default: fp32).",
+        show_choices=True,
+        show_default=False,
+    ),
+    engine: EngineEnum = typer.Option(  # noqa: B008
+        None,
+        "--engine",
+        help="Model inference engine, onnx runs on ONNX Runtime CPU (default: torch).",
+        show_choices=True,
+        show_default=False,
+    ),
+    uri_root: str = typer.Option(
+        None,
+        "--uri-root",
+        help=(
+            "Directory or s3:// prefix that JSON image uri requests may read from "
+            "(default: PY_SAM__SERVE_URI_ROOT, uploads only if unset)."
+        ),
+        show_default=False,
+    ),
+    embedding_cache_bytes: int = typer.Option(
+        None,
+        "--embedding-cache-bytes",
+        help=(
+            "Memory budget of the image embeddings kept for prompted requests "
+            "(default: PY_SAM__EMBEDDING_CACHE_BYTES or 1 GiB)."
+        ),
+        min=1,
+        show_default=False,
+    ),
+) -> None:
+    """Facebook Research SAM 2 segmentation service."""
+    console = Console()
+
+    mask_settings = parse_mask_settings(mask_setting)
+    try:
+        import py_sam.serve as service  # noqa: PLC0415 - the serve extra is optional
+    except ImportError as err:
+        console.print(f"Install the serve extra to run the service: {err}")
+        raise typer.Exit(code=1) from err
+
+    model = model_weight(model_type)
+    console.print(f"📐 Model pre-trained weight: {model}")
+
+    num_cpus = os.environ.get("PY_SAM__NUM_CPUS")
+    num_gpus = os.environ.get("PY_SAM__NUM_GPUS")
+    if embedding_cache_bytes is None:
+        embedding_cache_bytes = int(
+            os.environ.get("PY_SAM__EMBEDDING_CACHE_BYTES") or py_sam.prompting.DEFAULT_EMBEDDING_CACHE_BYTES
+        )
+
+    try:
+        settings = fbr_sam.FbrSamSettings(
+            output_mode=output_mode.value,
+            profile=(profile or ProfileEnum.BALANCED).value,
+            mask_settings=mask_settings,
+            execution=py_sam.execution.ExecutionSettings(
+                precision=(precision or PrecisionEnum.FP32).value, engine=(engine or EngineEnum.TORCH).value
+            ),
+            embedding_cache_bytes=embedding_cache_bytes,
+        )
+    except ValueError as err:
+        raise typer.BadParameter(str(err)) from err
+
+    ray.init()
+    service.run(
         model=model,
-        output_path=output_path,
-        flatten_output=flatten_output,
-        file_format=output_file_format,
+        settings=settings,
+        service=service.ServiceSettings(
+            host=host,
+            port=port,
+            num_replicas=replicas,
+            num_cpus=float(num_cpus) if num_cpus else None,
+            num_gpus=float(num_gpus) if num_gpus else None,
+            max_batch_size=max_batch_size,
+            batch_wait_timeout_s=batch_wait_timeout,
+            max_side=max_side,
+            uri_root=uri_root or os.environ.get("PY_SAM__SERVE_URI_ROOT"),
+        ),
     )
 
 
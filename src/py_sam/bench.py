@@ -0,0 +1,250 @@
+"""Per-stage pipeline benchmarks across the SAM 2 pre-trained weights."""
+
+import dataclasses
+import io
+import multiprocessing
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+from PIL import Image
+
+import py_sam.incremental
+import py_sam.model
+import py_sam.output
+from py_sam.decode import decode_image
+from py_sam.fbr_sam import FbrSam, FbrSamSettings
+from py_sam.logging_config import log
+
+STAGES = ("decode", "generate", "render", "encode")
+
+DEFAULT_RESOLUTIONS = (512, 1024)
+
+SYNTHETIC_SHAPES = 12
+
+# Chance of each synthetic shape being a rectangle rather than a disc.
+RECTANGLE_CHANCE = 0.5
+
+
+def synthetic_image(size: int, seed: int = 0) -> np.ndarray:
+    """Square RGB test image of filled rectangles and discs over a gradient background.
+
+    The image has distinct objects for the mask generator to find, and is the same for a
+    given `size` and `seed`.
+
+    Parameters:
+        size: Image height and width.
+        seed: Random generator seed for the shapes and colours.
+
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:size, 0:size]
+    gradient = ((rows + cols) * 255 // max(1, 2 * (size - 1))).astype(np.uint8)
+    image = np.stack([gradient, gradient[::-1], np.full_like(gradient, 128)], axis=-1)
+
+    for _ in range(SYNTHETIC_SHAPES):
+        top, left = rng.integers(0, size, 2)
+        extent = int(rng.integers(size // 16 + 1, size // 4 + 2))
+        colour = rng.integers(0, 256, 3, dtype=np.uint8)
+        if rng.random() < RECTANGLE_CHANCE:
+            image[top : top + extent, left : left + extent] = colour
+        else:
+            disc = (rows - top) ** 2 + (cols - left) ** 2 <= (extent // 2) ** 2
+            image[disc] = colour
+
+    return image
+
+
+def load_sources(input_path: str | None = None) -> list[tuple[str, np.ndarray]]:
+    """Benchmark source images.
+
+    Parameters:
+        input_path: Local directory of source images. A synthetic image is used if not set.
+
+    Returns:
+        The source image names and RGB images.
+
+    """
+    if input_path is None:
+        return [("synthetic", synthetic_image(1024))]
+
+    sources = [
+        (path.name, FbrSam.image_convert(path))
+        for path in sorted(Path(input_path).rglob("*"))
+        if path.suffix.lower().lstrip(".") in py_sam.incremental.IMAGE_EXTENSIONS
+    ]
+    if not sources:
+        msg = f"No source images found under {input_path}"
+        raise ValueError(msg)
+
+    return sources
+
+
+def encode_source(image: np.ndarray, resolution: int) -> bytes:
+    """PNG encoding of `image` resized to `resolution` along the longer side.
+
+    Parameters:
+        image: The source RGB image.
+        resolution: Longer side of the benchmark image.
+
+    """
+    height, width = image.shape[:2]
+    scale = resolution / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    buffer = io.BytesIO()
+    Image.fromarray(image).resize(size, Image.Resampling.BILINEAR).save(buffer, format="PNG")
+
+    return buffer.getvalue()
+
+
+def peak_rss() -> int:
+    """Peak resident set size of the current process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes.
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
+def bench_model(
+    model: type[py_sam.model.Model],
+    sources: list[tuple[str, np.ndarray]],
+    resolutions: tuple[int, ...] = DEFAULT_RESOLUTIONS,
+    file_format: str = "PNG",
+    **kwargs: Any,
+) -> dict[str, Any]:
+    """Time each pipeline stage of one pre-trained weight over the source images.
+
+    Every source image is encoded at each resolution and then decoded, passed through mask
+    generation, rendered as an overlay and encoded as per the output mode, one image at a
+    time. In `overlay` output mode, the encode stage is the overlay image file encoding of
+    the datasink. Stage times are summed over the images of a resolution.
+
+    Parameters:
+        model: The pre-trained weight.
+        sources: The source image names and RGB images.
+        resolutions: Longer side of the benchmark images.
+        file_format: The image file format of overlays in `overlay` output mode.
+        kwargs: `FbrSamSettings` (for example, `output_mode` or `profile`).
+
+    Returns:
+        The model build time, per resolution stage times, mask count and throughput, and
+        the peak resident set size of the process.
+
+    """
+    fbr_sam = FbrSam(model=model, settings=FbrSamSettings(**kwargs))
+    fbr_sam.model.download()
+    start = time.perf_counter()
+    fbr_sam.load()
+    build = time.perf_counter() - start
+
+    results = []
+    for resolution in resolutions:
+        encoded = [(name, encode_source(image, resolution)) for name, image in sources]
+        timings = dict.fromkeys(STAGES, 0.0)
+        mask_count = 0
+        for name, data in encoded:
+            start = time.perf_counter()
+            image, _, _ = decode_image(data)
+            timings["decode"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            masks = fbr_sam.predict([image], [name])[0]
+            timings["generate"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            overlay = fbr_sam.render(image, masks)
+            timings["render"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            if fbr_sam.output_mode == py_sam.output.OVERLAY:
+                py_sam.output.encode_overlay(overlay, file_format)
+            else:
+                fbr_sam.encode(image, masks, name)
+            timings["encode"] += time.perf_counter() - start
+
+            mask_count += len(masks)
+
+        total = sum(timings.values())
+        results.append({
+            "resolution": resolution,
+            "images": len(encoded),
+            "masks": mask_count,
+            "seconds": timings,
+            "images_per_second": len(encoded) / total if total else None,
+        })
+        log.info(
+            f"Benchmark {fbr_sam.model.model_type} at {resolution}: "
+            + " | ".join(f"{stage}: {value:.3f}s" for stage, value in timings.items())
+        )
+
+    return {
+        "model_type": fbr_sam.model.model_type,
+        "device": fbr_sam.device,
+        "build_seconds": build,
+        "peak_rss_bytes": peak_rss(),
+        "resolutions": results,
+    }
+
+
+def run(
+    models: list[type[py_sam.model.Model]],
+    input_path: str | None = None,
+    resolutions: tuple[int, ...] = DEFAULT_RESOLUTIONS,
+    isolate: bool = True,
+    file_format: str = "PNG",
+    **kwargs: Any,
+) -> dict[str, Any]:
+    """Benchmark each pre-trained weight.
+
+    Parameters:
+        models: The pre-trained weights to benchmark.
+        input_path: Local directory of source images. A synthetic image is used if not set.
+        resolutions: Longer side of the benchmark images.
+        isolate: Benchmark each pre-trained weight in a fresh process, so the peak RSS and
+            the model build time are its own. Otherwise, the peak RSS is the high-water mark
+            of the current process.
+        file_format: The image file format of overlays in `overlay` output mode.
+        kwargs: `FbrSamSettings` (for example, `output_mode` or `profile`).
+
+    Returns:
+        The benchmark report, as a JSON serialisable document.
+
+    """
+    sources = load_sources(input_path)
+    report: dict[str, Any] = {
+        "version": version(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "sources": [name for name, _ in sources],
+        "settings": {
+            "resolutions": list(resolutions),
+            "isolate": isolate,
+            "file_format": file_format,
+            **dataclasses.asdict(FbrSamSettings(**kwargs)),
+        },
+        "models": [],
+    }
+
+    for model in models:
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(bench_model, model, sources, resolutions, file_format, **kwargs).result()
+        else:
+            result = bench_model(model, sources, resolutions, file_format, **kwargs)
+        report["models"].append(result)
+
+    return report
+
+
+def version() -> str | None:
+    """Read the py_sam package version."""
+    version_file = Path(__file__).resolve().parent / "VERSION"
+
+    return version_file.read_text().strip() if version_file.is_file() else None
@@ -0,0 +1,247 @@
+"""Content-addressed SAM 2 mask result cache."""
+
+import hashlib
+import json
+import os
+import posixpath
+import zlib
+from dataclasses import dataclass
+from typing import Any
+
+import fsspec  # type: ignore[import-untyped]
+import numpy as np
+
+import py_sam.output
+from py_sam.logging_config import log
+
+ENTRY_SUFFIX = ".json.z"
+
+
+def modified(info: dict[str, Any]) -> float:
+    """Modification timestamp from an `fsspec` file info structure."""
+    value = info.get("mtime", info.get("LastModified", 0))
+
+    return value.timestamp() if hasattr(value, "timestamp") else float(value)
+
+
+@dataclass(frozen=True)
+class CacheSettings:
+    """Mask result cache settings.
+
+    Parameters:
+        path: Location (local or `s3://`) of the cache.
+        max_bytes: Total cache size limit. Unbounded if not set.
+
+    """
+
+    path: str
+    max_bytes: int | None = None
+
+    @classmethod
+    def from_environment(cls, path: str | None = None, max_bytes: int | None = None) -> "CacheSettings | None":
+        """Resolve the mask result cache settings, with unset values from the environment.
+
+        Falls back to the `PY_SAM__CACHE_PATH` and `PY_SAM__CACHE_MAX_BYTES` environment
+        variables. No caching (`None`) if no cache path is set.
+
+        Parameters:
+            path: Location (local or `s3://`) of the cache.
+            max_bytes: Total cache size limit.
+
+        """
+        path = path or os.environ.get("PY_SAM__CACHE_PATH")
+        if path is None:
+            return None
+        if max_bytes is None and os.environ.get("PY_SAM__CACHE_MAX_BYTES"):
+            max_bytes = int(os.environ["PY_SAM__CACHE_MAX_BYTES"])
+
+        return cls(path, max_bytes=max_bytes)
+
+
+class MaskCache:
+    """Persistent cache of SAM 2 mask records keyed by image content and model settings.
+
+    Entries hold the mask records with uncompressed RLE segmentations, so one entry serves
+    every output mode. The cache lives on any `fsspec` filesystem (local disk or S3). When
+    `max_bytes` is set, the least recently used entries are evicted once the cache grows
+    beyond it. Recency is the entry modification time, which is refreshed on every hit.
+
+    """
+
+    def __init__(
+        self,
+        location: str,
+        filesystem: fsspec.AbstractFileSystem,
+        max_bytes: int | None = None,
+        evict_interval: int = 100,
+    ) -> None:
+        """Initialise a MaskCache instance.
+
+        Parameters:
+            location: Cache root prefix.
+            filesystem: The `fsspec` filesystem that hosts `location`.
+            max_bytes: Total cache size limit. Unbounded if not set.
+            evict_interval: Number of cache writes between size checks (at least 1).
+
+        """
+        if evict_interval < 1:
+            msg = f"Mask cache eviction interval must be at least 1: {evict_interval}"
+            raise ValueError(msg)
+
+        self.__location = filesystem._strip_protocol(location).rstrip("/")
+        self.__filesystem = filesystem
+        self.__max_bytes = max_bytes
+        self.__evict_interval = evict_interval
+        self.__hits = 0
+        self.__misses = 0
+        self.__puts = 0
+
+    @property
+    def location(self) -> str:
+        """Cache root prefix getter."""
+        return self.__location
+
+    @property
+    def filesystem(self) -> fsspec.AbstractFileSystem:
+        """Cache filesystem getter."""
+        return self.__filesystem
+
+    @property
+    def max_bytes(self) -> int | None:
+        """Cache size limit getter."""
+        return self.__max_bytes
+
+    @property
+    def hits(self) -> int:
+        """Cache hit counter getter."""
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """Cache miss counter getter."""
+        return self.__misses
+
+    @staticmethod
+    def key(image: np.ndarray, model_type: str, settings: dict[str, Any]) -> str:
+        """Cache key for a decoded image, model and mask generator settings.
+
+        Parameters:
+            image: The decoded image.
+            model_type: The `py_sam.model.Model.model_type` of the pre-trained weights.
+            settings: The mask generator settings.
+
+        """
+        image_digest = hashlib.sha256(np.ascontiguousarray(image).tobytes())
+        image_digest.update(f"{image.shape}{image.dtype}".encode())
+        document = {
+            "image": image_digest.hexdigest(),
+            "model_type": model_type,
+            "settings": settings,
+        }
+
+        return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        """Entry path for `key`."""
+        return posixpath.join(self.location, key[:2], f"{key}{ENTRY_SUFFIX}")
+
+    def get(self, key: str, image_name: str = "") -> list[dict[str, Any]] | None:
+        """Look up the cached mask records for `key`, with uncompressed RLE segmentations.
+
+        Parameters:
+            key: The cache key.
+            image_name: Source image reference for logging.
+
+        """
+        path = self.path(key)
+        try:
+            data = self.filesystem.cat_file(path)
+        except FileNotFoundError:
+            self.__misses += 1
+            log.info(f"Mask cache miss for {image_name} (hits: {self.hits} | misses: {self.misses})")
+            return None
+
+        try:
+            masks = json.loads(zlib.decompress(data))
+        except (zlib.error, ValueError):
+            log.warning(f"Mask cache entry {path} is unreadable. Treating as a miss.")
+            self.__misses += 1
+            return None
+
+        self.__hits += 1
+        log.info(f"Mask cache hit for {image_name} (hits: {self.hits} | misses: {self.misses})")
+        self.touch(path, data)
+
+        return masks
+
+    def put(self, key: str, masks: list[dict[str, Any]]) -> None:
+        """Store mask records under `key`.
+
+        Parameters:
+            key: The cache key.
+            masks: Mask records from the SAM 2 generator with either binary mask or
+                uncompressed RLE segmentations.
+
+        """
+        records = [
+            {
+                **mask,
+                "segmentation": (
+                    py_sam.output.mask_to_rle(mask["segmentation"])
+                    if isinstance(mask["segmentation"], np.ndarray)
+                    else mask["segmentation"]
+                ),
+            }
+            for mask in masks
+        ]
+        path = self.path(key)
+        self.filesystem.makedirs(posixpath.dirname(path), exist_ok=True)
+        self.filesystem.pipe_file(path, zlib.compress(json.dumps(records).encode()))
+
+        self.__puts += 1
+        if self.max_bytes is not None and self.__puts % self.__evict_interval == 0:
+            self.evict()
+
+    def touch(self, path: str, data: bytes) -> None:
+        """Mark the entry at `path` as recently used.
+
+        Object stores that cannot update the modification time in place get the entry
+        rewritten instead.
+
+        """
+        if self.max_bytes is None:
+            return
+
+        try:
+            self.filesystem.touch(path, truncate=False)
+        except (NotImplementedError, ValueError):
+            self.filesystem.pipe_file(path, data)
+
+    def evict(self) -> int:
+        """Evict least recently used entries until the cache fits within `max_bytes`.
+
+        Returns:
+            The number of entries evicted.
+
+        """
+        if self.max_bytes is None or not self.filesystem.exists(self.location):
+            return 0
+
+        entries = sorted(
+            (modified(info), path, info["size"])
+            for path, info in self.filesystem.find(self.location, detail=True).items()
+            if path.endswith(ENTRY_SUFFIX)
+        )
+        total = sum(size for _, _, size in entries)
+        evicted = []
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            evicted.append(path)
+            total -= size
+
+        if evicted:
+            self.filesystem.rm(evicted)
+            log.info(f"Mask cache evicted {len(evicted)} entries ({total} of {self.max_bytes} bytes in use)")
+
+        return len(evicted)
@@ -0,0 +1,102 @@
+"""Memory mapped SAM 2 checkpoints shared by the actors of a node."""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from filelock import FileLock
+from sam2.build_sam import (  # type: ignore[import-untyped]
+    build_sam2,
+    build_sam2_video_predictor,
+)
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+
+import py_sam.model
+from py_sam.logging_config import log
+
+
+def export(model: py_sam.model.Model, overwrite: bool = False) -> None:
+    """Cache the memory mappable copy of a pre-trained weight checkpoint.
+
+    The copy holds the bare model state dict of `Model.checkpoint` as contiguous tensors,
+    saved at `Model.mmap_checkpoint` in the `torch.save` zip format that `torch.load` can
+    memory map. Concurrent exports (for example, by every actor of a cold node) are
+    serialised by a file lock next to the copy, and waiting processes then skip the export.
+
+    Parameters:
+        model: The pre-trained weight.
+        overwrite: Export even if the copy already exists.
+
+    """
+    if not overwrite and model.mmap_checkpoint.is_file():
+        log.info(f'Checkpoint "{model.mmap_checkpoint}" exists. Skipping export.')
+        return
+
+    model.download()
+
+    with FileLock(model.export_lock(model.mmap_checkpoint)):
+        if not overwrite and model.mmap_checkpoint.is_file():
+            log.info(f'Checkpoint "{model.mmap_checkpoint}" exported by another process.')
+            return
+
+        start = time.perf_counter()
+        state = torch.load(model.checkpoint, map_location="cpu", weights_only=True)["model"]
+
+        staging = model.mmap_checkpoint.with_name(f"{model.mmap_checkpoint.name}.{os.getpid()}.tmp")
+        torch.save({name: tensor.contiguous() for name, tensor in state.items()}, staging)
+        os.replace(staging, model.mmap_checkpoint)
+
+    log.info(f"Memory mappable checkpoint cached at {model.mmap_checkpoint} in {time.perf_counter() - start:.2f}s")
+
+
+def fetch(models: list[py_sam.model.Model]) -> None:
+    """Download pre-trained weights and cache their memory mappable copies in parallel.
+
+    Parameters:
+        models: The pre-trained weights.
+
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(models))) as executor:
+        for future in [executor.submit(export, model) for model in models]:
+            future.result()
+
+
+def build_mmap(
+    model: py_sam.model.Model,
+    device: str = "cpu",
+    video_predictor: type[SAM2Base] | None = None,
+) -> SAM2Base:
+    """Build the SAM 2 model with its weights memory mapped from the model cache.
+
+    The model parameters are assigned the tensors mapped from `Model.mmap_checkpoint`
+    rather than copied into process memory, so every actor on a node reads the same page
+    cache pages. The copy is exported on first use (see `export`). Parameters are copied
+    on to other devices as usual.
+
+    Parameters:
+        model: The pre-trained weight.
+        device: Device to run the model on.
+        video_predictor: Build this `SAM2VideoPredictor` implementation (with the SAM 2
+            video post-processing) rather than the image model.
+
+    """
+    export(model)
+    start = time.perf_counter()
+    if video_predictor is not None:
+        sam = build_sam2_video_predictor(
+            model.model_cfg,
+            None,
+            device="cpu",
+            hydra_overrides_extra=[f"++model._target_={video_predictor.__module__}.{video_predictor.__qualname__}"],
+        )
+    else:
+        sam = build_sam2(model.model_cfg, None, device="cpu", apply_postprocessing=False)
+    sam.load_state_dict(
+        torch.load(model.mmap_checkpoint, map_location="cpu", weights_only=True, mmap=True),
+        assign=True,
+    )
+    sam = sam.to(device).eval()
+    log.info(f"Memory mapped checkpoint {model.mmap_checkpoint} loaded in {time.perf_counter() - start:.2f}s")
+
+    return sam
@@ -0,0 +1,197 @@
+"""Per stage concurrency of the Ray SAM 2 pipeline."""
+
+import os
+from dataclasses import dataclass
+
+import ray
+
+from py_sam.logging_config import log
+
+
+class StageConcurrency:
+    """Concurrency of the read, inference and write pipeline stages.
+
+    Reading and writing are I/O bound and run as Ray tasks. Inference is compute bound and
+    runs in an actor pool that autoscales between `inference_min` and `inference_max`
+    actors.
+
+    """
+
+    def __init__(
+        self,
+        read: int = 1,
+        inference_min: int = 1,
+        inference_max: int | None = None,
+        write: int = 1,
+    ) -> None:
+        """Initialise a StageConcurrency instance.
+
+        Parameters:
+            read: Number of concurrent read tasks.
+            inference_min: Minimum size of the inference actor pool.
+            inference_max: Maximum size of the inference actor pool. A fixed size pool of
+                `inference_min` actors if not set.
+            write: Number of concurrent write tasks.
+
+        """
+        inference_max = inference_max or inference_min
+        if min(read, inference_min, write) < 1:
+            msg = "Stage concurrency must be at least 1"
+            raise ValueError(msg)
+        if inference_max < inference_min:
+            msg = f"Inference max concurrency {inference_max} must not be less than the min concurrency {inference_min}"
+            raise ValueError(msg)
+
+        self.__read = read
+        self.__inference_min = inference_min
+        self.__inference_max = inference_max
+        self.__write = write
+
+    @property
+    def read(self) -> int:
+        """Read task concurrency getter."""
+        return self.__read
+
+    @property
+    def inference_min(self) -> int:
+        """Minimum inference actor pool size getter."""
+        return self.__inference_min
+
+    @property
+    def inference_max(self) -> int:
+        """Maximum inference actor pool size getter."""
+        return self.__inference_max
+
+    @property
+    def write(self) -> int:
+        """Write task concurrency getter."""
+        return self.__write
+
+    @property
+    def inference(self) -> int | tuple[int, int]:
+        """Inference actor pool `concurrency` for `ray.data.Dataset.map`.
+
+        A fixed pool size, or the `(min, max)` bounds of an autoscaling pool.
+
+        """
+        if self.inference_min == self.inference_max:
+            return self.inference_min
+
+        return self.inference_min, self.inference_max
+
+    def __repr__(self) -> str:
+        """Stage concurrency summary."""
+        return f"read: {self.read} | inference: {self.inference_min}-{self.inference_max} | write: {self.write}"
+
+
+def auto_size(
+    resources: dict[str, float],
+    num_cpus: float | None = None,
+    num_gpus: float | None = None,
+) -> StageConcurrency:
+    """Size the stage concurrency from the cluster resources.
+
+    On a GPU cluster, the inference actor pool scales up to one actor per `num_gpus` GPUs
+    and every CPU is left to reading and writing. On a CPU cluster, a quarter of the CPUs
+    are set aside for reading and writing and the inference actor pool scales up to one
+    actor per `num_cpus` of the remaining CPUs. The pool starts with one actor.
+
+    Parameters:
+        resources: The cluster resources (as per `ray.cluster_resources`).
+        num_cpus: CPUs reserved for each inference actor. Defaults to 1.
+        num_gpus: GPUs reserved for each inference actor. Defaults to 1 on a GPU cluster.
+
+    """
+    cpus = int(resources.get("CPU", 1))
+    gpus = int(resources.get("GPU", 0))
+
+    if gpus:
+        io = max(1, cpus // 2)
+        inference_max = max(1, int(gpus // (num_gpus or 1)))
+    else:
+        io = max(1, cpus // 4)
+        inference_max = max(1, int((cpus - io) // (num_cpus or 1)))
+
+    concurrency = StageConcurrency(read=io, inference_min=1, inference_max=inference_max, write=io)
+    log.info(f"Stage concurrency sized from {cpus} CPU(s) and {gpus} GPU(s): {concurrency}")
+
+    return concurrency
+
+
+@dataclass(frozen=True)
+class ConcurrencySettings:
+    """Requested concurrency of the pipeline stages, resolved by `resolve`.
+
+    Parameters:
+        read: Number of concurrent read tasks.
+        inference_min: Minimum size of the inference actor pool.
+        inference_max: Maximum size of the inference actor pool.
+        write: Number of concurrent write tasks.
+        auto: Size unset stages from the cluster resources.
+
+    """
+
+    read: int | None = None
+    inference_min: int | None = None
+    inference_max: int | None = None
+    write: int | None = None
+    auto: bool | None = None
+
+
+def resolve(
+    settings: ConcurrencySettings | None = None,
+    num_cpus: float | None = None,
+    num_gpus: float | None = None,
+) -> StageConcurrency:
+    """Resolve the stage concurrency from the settings, environment and cluster.
+
+    Each stage takes its setting, then its environment variable
+    (`PY_SAM__READ_CONCURRENCY`, `PY_SAM__INFERENCE_CONCURRENCY`,
+    `PY_SAM__INFERENCE_MAX_CONCURRENCY` and `PY_SAM__WRITE_CONCURRENCY`). With `auto` (or
+    `PY_SAM__AUTO_CONCURRENCY=true`), stages that are still unset are sized from
+    `ray.cluster_resources()`. Otherwise, they fall back to `PY_SAM__CONCURRENCY`, then 1.
+
+    Parameters:
+        settings: The requested stage concurrency. Every stage is unset if not given.
+        num_cpus: CPUs reserved for each inference actor.
+        num_gpus: GPUs reserved for each inference actor.
+
+    """
+    settings = settings or ConcurrencySettings()
+    read = _setting(settings.read, "PY_SAM__READ_CONCURRENCY")
+    inference_min = _setting(settings.inference_min, "PY_SAM__INFERENCE_CONCURRENCY")
+    inference_max = _setting(settings.inference_max, "PY_SAM__INFERENCE_MAX_CONCURRENCY")
+    write = _setting(settings.write, "PY_SAM__WRITE_CONCURRENCY")
+    auto = settings.auto
+    if auto is None:
+        auto = os.environ.get("PY_SAM__AUTO_CONCURRENCY") == "true"
+
+    if auto:
+        sized = auto_size(ray.cluster_resources(), num_cpus, num_gpus)
+        default_read, default_min, default_max, default_write = (
+            sized.read,
+            sized.inference_min,
+            sized.inference_max,
+            sized.write,
+        )
+        if inference_min is not None:
+            default_max = max(default_max, inference_min)
+    else:
+        default = int(os.environ.get("PY_SAM__CONCURRENCY", "1"))
+        default_read = default_min = default_write = default
+        default_max = None
+
+    return StageConcurrency(
+        read=read or default_read,
+        inference_min=inference_min or default_min,
+        inference_max=inference_max or default_max,
+        write=write or default_write,
+    )
+
+
+def _setting(value: int | None, name: str) -> int | None:
+    """`value`, or the integer value of the `name` environment variable if not set."""
+    if value is None and os.environ.get(name):
+        return int(os.environ[name])
+
+    return value
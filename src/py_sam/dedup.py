@@ -0,0 +1,219 @@
+"""Near-duplicate image grouping with perceptual hashes."""
+
+import collections
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import cv2
+import numpy as np
+
+DEFAULT_DEDUP_WINDOW = 8
+
+# Bits of the perceptual hash, and so the largest Hamming distance between two images.
+HASH_BITS = 64
+
+# Array dimensions of an HWC colour image.
+COLOUR_NDIM = 3
+
+
+def phash(image: np.ndarray) -> int:
+    """64 bit DCT perceptual hash of an image.
+
+    The image is reduced to 32x32 grayscale, and each bit records whether one of the 8x8
+    lowest frequency DCT coefficients is above their median. Small changes in noise,
+    compression or brightness flip few bits.
+
+    Parameters:
+        image: The image in HWC RGB (or HW grayscale) format.
+
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == COLOUR_NDIM else image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:8, :8].flatten()
+
+    return int.from_bytes(np.packbits(low > np.median(low)).tobytes(), "big")
+
+
+def distance(hash_a: int, hash_b: int) -> int:
+    """Hamming distance between two perceptual hashes."""
+    return (hash_a ^ hash_b).bit_count()
+
+
+@dataclass(frozen=True)
+class Duplicate:
+    """Near-duplicate of a representative image, whose masks it reuses.
+
+    Either `masks` holds the masks of a representative seen before, or `leader` is the
+    index of a representative in the same batch.
+
+    """
+
+    representative: str
+    distance: int
+    masks: list[dict[str, Any]] | None = None
+    leader: int | None = None
+
+
+@dataclass(frozen=True)
+class DedupSettings:
+    """Near-duplicate image grouping settings.
+
+    Parameters:
+        distance: Largest perceptual hash Hamming distance between near-duplicates.
+        window: Number of recent representative images to match against.
+
+    """
+
+    distance: int
+    window: int = DEFAULT_DEDUP_WINDOW
+
+    @classmethod
+    def from_environment(cls, distance: int | None = None, window: int | None = None) -> "DedupSettings | None":
+        """Resolve the near-duplicate grouping settings, with unset values from the environment.
+
+        Falls back to the `PY_SAM__DEDUP_DISTANCE` and `PY_SAM__DEDUP_WINDOW` environment
+        variables. No grouping (`None`) if no distance is set.
+
+        Parameters:
+            distance: Largest perceptual hash Hamming distance between near-duplicates.
+            window: Number of recent representative images to match against. Defaults
+                to 8.
+
+        """
+        if distance is None and os.environ.get("PY_SAM__DEDUP_DISTANCE"):
+            distance = int(os.environ["PY_SAM__DEDUP_DISTANCE"])
+        if distance is None:
+            return None
+        if window is None:
+            window = int(os.environ.get("PY_SAM__DEDUP_WINDOW", str(DEFAULT_DEDUP_WINDOW)))
+
+        return cls(distance, window=window)
+
+
+class DuplicateIndex:
+    """Recent representative images and their masks, matched by perceptual hash.
+
+    Images of the same size within `max_distance` bits of a representative are its
+    near-duplicates. Only the `window` most recently matched representatives are held,
+    which suits the long runs of almost identical frames of a camera feed.
+
+    """
+
+    def __init__(self, max_distance: int, window: int = DEFAULT_DEDUP_WINDOW) -> None:
+        """Initialise a DuplicateIndex instance.
+
+        Parameters:
+            max_distance: Largest Hamming distance between near-duplicate hashes.
+            window: Number of representatives (with their masks) to hold.
+
+        """
+        if not 0 <= max_distance <= HASH_BITS:
+            msg = f"Near-duplicate distance {max_distance} is outside 0 to {HASH_BITS}"
+            raise ValueError(msg)
+        if window < 1:
+            msg = "The near-duplicate window holds at least one image"
+            raise ValueError(msg)
+
+        self.__max_distance = max_distance
+        self.__window = window
+        self.__entries: collections.OrderedDict[int, tuple[int, tuple[int, ...], str, list[dict[str, Any]]]] = (
+            collections.OrderedDict()
+        )
+        self.__next_id = 0
+        self.__duplicates = 0
+
+    def __len__(self) -> int:
+        """Return the number of representatives held."""
+        return len(self.__entries)
+
+    @property
+    def max_distance(self) -> int:
+        """Largest near-duplicate Hamming distance getter."""
+        return self.__max_distance
+
+    @property
+    def window(self) -> int:
+        """Number of representatives held getter."""
+        return self.__window
+
+    @property
+    def duplicates(self) -> int:
+        """Near-duplicate counter getter."""
+        return self.__duplicates
+
+    def group(
+        self, images: list[np.ndarray], image_names: list[str], indices: list[int]
+    ) -> tuple[dict[int, int], dict[int, Duplicate]]:
+        """Group images with the representatives held and with each other.
+
+        Each image is matched to the closest representative held, then to the earlier
+        representatives of the batch. Otherwise, it represents a new group.
+
+        Parameters:
+            images: The batch of images.
+            image_names: Source image references.
+            indices: Indices of the `images` to group.
+
+        Returns:
+            The perceptual hash of each new representative by index (in order), which need
+            masks generated, and the near-duplicate match of the other images by index.
+
+        """
+        leaders: list[tuple[int, int]] = []
+        duplicates: dict[int, Duplicate] = {}
+        for idx in indices:
+            image_hash = phash(images[idx])
+            shape = images[idx].shape
+
+            held = [
+                (distance(image_hash, entry_hash), entry_id)
+                for entry_id, (entry_hash, entry_shape, _, _) in self.__entries.items()
+                if entry_shape == shape
+            ]
+            if held and min(held)[0] <= self.max_distance:
+                entry_distance, entry_id = min(held)
+                self.__entries.move_to_end(entry_id)
+                _, _, name, masks = self.__entries[entry_id]
+                duplicates[idx] = Duplicate(name, entry_distance, masks=masks)
+                continue
+
+            batch = [
+                (distance(image_hash, leader_hash), leader)
+                for leader, leader_hash in leaders
+                if images[leader].shape == shape
+            ]
+            if batch and min(batch)[0] <= self.max_distance:
+                leader_distance, leader = min(batch)
+                duplicates[idx] = Duplicate(image_names[leader], leader_distance, leader=leader)
+                continue
+
+            leaders.append((idx, image_hash))
+
+        self.__duplicates += len(duplicates)
+
+        return dict(leaders), duplicates
+
+    def add(
+        self,
+        image: np.ndarray,
+        image_name: str,
+        masks: list[dict[str, Any]],
+        image_hash: int | None = None,
+    ) -> None:
+        """Hold a representative image and its masks, evicting the least recently matched.
+
+        Parameters:
+            image: The representative image.
+            image_name: Source image reference.
+            masks: The mask records generated for the image.
+            image_hash: Perceptual hash of the image, as returned by `group`. Hashed if not
+                given.
+
+        """
+        if image_hash is None:
+            image_hash = phash(image)
+        self.__entries[self.__next_id] = (image_hash, image.shape, image_name, masks)
+        self.__next_id += 1
+        while len(self.__entries) > self.window:
+            self.__entries.popitem(last=False)
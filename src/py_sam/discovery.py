@@ -0,0 +1,316 @@
+"""Streaming source image discovery and input manifests."""
+
+import functools
+import os
+import posixpath
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from typing import Any, cast
+from urllib.parse import urlparse
+
+import fsspec  # type: ignore[import-untyped]
+import pyarrow as pa
+import ray
+from pyarrow.fs import FSSpecHandler, PyFileSystem  # type: ignore[import-untyped]
+from ray.data.block import BlockMetadata
+from ray.data.datasource import Datasource, ReadTask
+from s3fs import S3FileSystem  # type: ignore[import-untyped]
+
+import py_sam.decode
+import py_sam.incremental
+from py_sam.logging_config import log
+
+# Number of image paths in each block fed into the pipeline (the S3 listing page size).
+PAGE_SIZE = 1000
+
+INPUT_MANIFEST_COLUMN = "path"
+
+# Listing is network bound. A fractional CPU also keeps Ray from fusing the listing read
+# task with the decode and inference stages, which would run them all in that one task.
+LISTING_NUM_CPUS = 0.25
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+@dataclass(frozen=True)
+class SourceSettings:
+    """Source image settings of a batch run.
+
+    Parameters:
+        data_path: Location of the source images.
+        input_manifest: Location of a text file (one image URI per line) or Parquet dataset
+            (with a `path` column) listing the source images, in place of `data_path`.
+        streaming_discovery: Page through the `data_path` listing as the pipeline runs,
+            instead of listing every source image up front.
+        max_side: Decode the source images with the longer side capped at `max_side`.
+
+    """
+
+    data_path: str | None = None
+    input_manifest: str | None = None
+    streaming_discovery: bool = False
+    max_side: int | None = None
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if (self.data_path is None) == (self.input_manifest is None):
+            msg = "Set one of source_data_path or input_manifest"
+            raise ValueError(msg)
+
+    @property
+    def uri(self) -> str:
+        """Source images location getter, the data path or the input manifest."""
+        return cast(str, self.data_path or self.input_manifest)
+
+    @classmethod
+    def from_environment(
+        cls,
+        data_path: str | None = None,
+        input_manifest: str | None = None,
+        streaming_discovery: bool | None = None,
+        max_side: int | None = None,
+    ) -> "SourceSettings":
+        """Resolve the source image settings, with unset values from the environment.
+
+        Falls back to the `PY_SAM__INPUT_MANIFEST` and `PY_SAM__STREAMING_DISCOVERY`
+        environment variables.
+
+        Parameters:
+            data_path: Location of the source images.
+            input_manifest: Location of the input manifest.
+            streaming_discovery: Page through the `data_path` listing as the pipeline runs.
+            max_side: Decode the source images with the longer side capped at `max_side`.
+
+        """
+        if streaming_discovery is None:
+            streaming_discovery = os.environ.get("PY_SAM__STREAMING_DISCOVERY") == "true"
+
+        return cls(
+            data_path,
+            input_manifest=input_manifest or os.environ.get("PY_SAM__INPUT_MANIFEST"),
+            streaming_discovery=streaming_discovery,
+            max_side=max_side,
+        )
+
+
+def is_image(path: str) -> bool:
+    """Whether `path` has a source image file extension."""
+    return path.rsplit(".", 1)[-1].lower() in py_sam.incremental.IMAGE_EXTENSIONS
+
+
+def s3_pages(filesystem: S3FileSystem, root: str, page_size: int = PAGE_SIZE) -> Iterator[list[str]]:
+    """Page through the objects under an S3 prefix with `ListObjectsV2`.
+
+    Parameters:
+        filesystem: The S3 filesystem.
+        root: Bucket and key prefix, without the URI scheme.
+        page_size: Maximum number of keys in each listing page.
+
+    Yields:
+        The object paths (bucket and key) of each listing page.
+
+    """
+    bucket, _, prefix = root.partition("/")
+    kwargs: dict[str, Any] = {"Bucket": bucket, "MaxKeys": page_size}
+    if prefix:
+        kwargs["Prefix"] = f"{prefix.rstrip('/')}/"
+
+    while True:
+        response = filesystem.call_s3("list_objects_v2", **kwargs)
+        yield [f"{bucket}/{item['Key']}" for item in response.get("Contents", [])]
+        if not response.get("IsTruncated"):
+            return
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def iter_image_pages(
+    source_data_path: str,
+    filesystem: fsspec.AbstractFileSystem,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[list[str]]:
+    """Stream the image file URIs under `source_data_path` in pages.
+
+    S3 prefixes are paged through object listings as they arrive, so the first images are
+    available long before the listing of a large prefix completes. Other filesystems are
+    walked one directory at a time.
+
+    Parameters:
+        source_data_path: Image file or prefix.
+        filesystem: The `fsspec` filesystem that hosts `source_data_path`.
+        page_size: Maximum number of image URIs in each page.
+
+    Yields:
+        Pages of image file URIs.
+
+    """
+    scheme = urlparse(source_data_path).scheme
+    root = filesystem._strip_protocol(source_data_path).rstrip("/")
+
+    listings: Iterator[list[str]]
+    if filesystem.isfile(root):
+        listings = iter([[root]])
+    elif isinstance(filesystem, S3FileSystem):
+        listings = s3_pages(filesystem, root, page_size)
+    else:
+        listings = (
+            [posixpath.join(dirpath, filename) for filename in sorted(filenames)]
+            for dirpath, _, filenames in filesystem.walk(root)
+        )
+
+    page: list[str] = []
+    for listing in listings:
+        for path in listing:
+            if is_image(path):
+                page.append(f"{scheme}://{path}" if scheme else path)
+            if len(page) >= page_size:
+                yield page
+                page = []
+    if page:
+        yield page
+
+
+class ImagePathDatasource(Datasource):
+    """Ray datasource of the image file URIs under a prefix, streamed as they are listed.
+
+    One read task pages through the listing and emits a block of `path` rows per page, so
+    downstream stages start on the first page while listing continues.
+
+    """
+
+    def __init__(
+        self,
+        source_data_path: str,
+        filesystem: fsspec.AbstractFileSystem,
+        page_size: int = PAGE_SIZE,
+    ) -> None:
+        """Initialise an ImagePathDatasource instance."""
+        self.__source_data_path = source_data_path
+        self.__filesystem = filesystem
+        self.__page_size = page_size
+
+    def estimate_inmemory_data_size(self) -> int | None:
+        """Report no size estimate as the listing size is unknown until it completes."""
+        return None
+
+    def get_read_tasks(self, parallelism: int) -> list[ReadTask]:
+        """Return a single read task that streams the listing pages."""
+        source_data_path = self.__source_data_path
+        filesystem = self.__filesystem
+        page_size = self.__page_size
+
+        def read_pages() -> Iterator[pa.Table]:
+            count = 0
+            for page in iter_image_pages(source_data_path, filesystem, page_size):
+                count += len(page)
+                log.info(f"Discovered {count} images under {source_data_path}")
+                yield pa.table({"path": page})
+
+        metadata = BlockMetadata(
+            num_rows=None,
+            size_bytes=None,
+            schema=None,
+            input_files=None,
+            exec_stats=None,
+        )
+
+        return [ReadTask(read_pages, metadata)]
+
+
+def read_image_paths(source_data_path: str, filesystem: fsspec.AbstractFileSystem) -> ray.data.Dataset:
+    """Dataset of the image file URIs under `source_data_path`, streamed as they are listed.
+
+    Parameters:
+        source_data_path: Image file or prefix.
+        filesystem: The `fsspec` filesystem that hosts `source_data_path`.
+
+    """
+    return ray.data.read_datasource(
+        ImagePathDatasource(source_data_path, filesystem),
+        override_num_blocks=1,
+        ray_remote_args={"num_cpus": LISTING_NUM_CPUS},
+    )
+
+
+def read_input_manifest(input_manifest: str, filesystem: fsspec.AbstractFileSystem) -> ray.data.Dataset:
+    """Dataset of the image file URIs of an input manifest.
+
+    The input manifest is either a Parquet dataset with a `path` column, or a text file
+    with one URI per line (blank lines and `#` comments are skipped).
+
+    Parameters:
+        input_manifest: Input manifest location.
+        filesystem: The `fsspec` filesystem that hosts `input_manifest`.
+
+    """
+    pa_fs = None
+    if isinstance(filesystem, S3FileSystem):
+        pa_fs = PyFileSystem(FSSpecHandler(filesystem))
+
+    ray_remote_args = {"num_cpus": LISTING_NUM_CPUS}
+    if input_manifest.rstrip("/").lower().endswith(PARQUET_EXTENSIONS):
+        return ray.data.read_parquet(
+            input_manifest,
+            filesystem=pa_fs,
+            columns=[INPUT_MANIFEST_COLUMN],
+            ray_remote_args=ray_remote_args,
+        )
+
+    return ray.data.read_text(input_manifest, filesystem=pa_fs, ray_remote_args=ray_remote_args).map_batches(
+        manifest_lines, batch_format="pyarrow", num_cpus=LISTING_NUM_CPUS
+    )
+
+
+def manifest_lines(batch: pa.Table) -> pa.Table:
+    """Input manifest text lines as `path` rows."""
+    paths = [line.strip() for line in batch.column("text").to_pylist()]
+
+    return pa.table({"path": [path for path in paths if path and not path.startswith("#")]})
+
+
+def pending_batch(batch: pa.Table, **kwargs: Any) -> pa.Table:
+    """Filter out the `path` rows that already have a result.
+
+    The streaming counterpart of `py_sam.incremental.pending_images`, applied to each block
+    of image URIs as it is discovered.
+
+    Parameters:
+        batch: Block of `path` rows holding image file URIs.
+        kwargs: `py_sam.incremental.pending_images` arguments other than `paths`.
+
+    """
+    uris = batch.column("path").to_pylist()
+    paths = {fsspec.core.strip_protocol(uri): uri for uri in uris}
+    pending = py_sam.incremental.pending_images(list(paths), **kwargs)
+
+    return pa.table({"path": [paths[path] for path in pending]})
+
+
+@functools.cache
+def _filesystem(
+    filesystem_factory: Callable[[str], fsspec.AbstractFileSystem], scheme: str
+) -> fsspec.AbstractFileSystem:
+    """`fsspec` filesystem of a URI scheme, built once per worker process."""
+    return filesystem_factory(f"{scheme}://" if scheme else "")
+
+
+def load_row(
+    row: dict[str, Any],
+    filesystem_factory: Callable[[str], fsspec.AbstractFileSystem],
+    max_side: int | None = None,
+) -> dict[str, Any]:
+    """Read and decode the source image of a `path` row.
+
+    The `path` column is set without the URI scheme, matching the rows of
+    `ray.data.read_images(..., include_paths=True)`.
+
+    Parameters:
+        row: Ray row with a `path` column holding the image file URI.
+        filesystem_factory: Builds the `fsspec` filesystem of a URI.
+        max_side: Longest side of the decoded image. See `py_sam.decode.decode_row`.
+
+    """
+    uri = row["path"]
+    filesystem = _filesystem(filesystem_factory, urlparse(uri).scheme)
+    path = filesystem._strip_protocol(uri)
+
+    return py_sam.decode.decode_row({**row, "path": path, "bytes": filesystem.cat_file(path)}, max_side)
@@ -0,0 +1,171 @@
+"""SAM 2 model execution modes: mixed precision, compilation and inference mode."""
+
+import contextlib
+import os
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+
+import torch
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+
+from py_sam.logging_config import log
+
+FP32 = "fp32"
+BF16 = "bf16"
+
+PRECISIONS = (FP32, BF16)
+
+TORCH = "torch"
+ONNX = "onnx"
+
+ENGINES = (TORCH, ONNX)
+
+# Number of timed image encoder runs behind the logged compile speedup.
+TIMING_ITERATIONS = 3
+
+
+@dataclass(frozen=True)
+class ExecutionSettings:
+    """SAM 2 model execution modes.
+
+    Parameters:
+        precision: `fp32` for default float32, or `bf16` for bfloat16 autocast.
+        compile_encoder: Compile the image encoder with `torch.compile`.
+        inference_mode: Run under `torch.inference_mode`.
+        quantize: Run a dynamic INT8 quantized model on CPU.
+        engine: `torch`, or `onnx` to run the model on ONNX Runtime (CPU).
+
+    """
+
+    precision: str = FP32
+    compile_encoder: bool = False
+    inference_mode: bool = False
+    quantize: bool = False
+    engine: str = TORCH
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.precision not in PRECISIONS:
+            msg = f"Unsupported precision: {self.precision}"
+            raise ValueError(msg)
+        if self.engine not in ENGINES:
+            msg = f"Unsupported engine: {self.engine}"
+            raise ValueError(msg)
+        if self.engine == ONNX and (self.quantize or self.compile_encoder or self.precision != FP32):
+            msg = "The onnx engine runs fp32 graphs only: quantize, compile_encoder and precision do not apply"
+            raise ValueError(msg)
+
+    @classmethod
+    def from_environment(cls, model_type: str, **overrides: Any) -> "ExecutionSettings":
+        """Resolve the execution modes, with unset values from the environment.
+
+        Falls back to the `PY_SAM__PRECISION`, `PY_SAM__COMPILE_ENCODER`,
+        `PY_SAM__INFERENCE_MODE`, `PY_SAM__QUANTIZE` and `PY_SAM__ENGINE` environment
+        variables. `PY_SAM__QUANTIZE` is either `true` or a comma separated list of the
+        model types to quantize (for example, `hiera_b,hiera_l`).
+
+        Parameters:
+            model_type: The model type of the pre-trained weight.
+            overrides: Execution modes that take precedence over the environment. Values
+                of `None` are unset.
+
+        """
+        quantize = os.environ.get("PY_SAM__QUANTIZE", "")
+        settings = {
+            "precision": os.environ.get("PY_SAM__PRECISION", FP32),
+            "compile_encoder": os.environ.get("PY_SAM__COMPILE_ENCODER") == "true",
+            "inference_mode": os.environ.get("PY_SAM__INFERENCE_MODE") == "true",
+            "quantize": quantize == "true" or model_type in [name.strip() for name in quantize.split(",")],
+            "engine": os.environ.get("PY_SAM__ENGINE", TORCH),
+        }
+        settings.update((name, value) for name, value in overrides.items() if value is not None)
+
+        return cls(**settings)
+
+
+def device_type(device: str) -> str:
+    """Map a `torch` device string to its `torch.autocast` device type."""
+    return device.split(":", 1)[0]
+
+
+@contextlib.contextmanager
+def execution_context(device: str, precision: str = FP32, inference_mode: bool = False) -> Iterator[None]:
+    """Context for running the SAM 2 model as per the execution mode.
+
+    Parameters:
+        device: The `torch` device the model runs on.
+        precision: `fp32` for default float32, or `bf16` for bfloat16 autocast.
+        inference_mode: Run under `torch.inference_mode`.
+
+    """
+    if precision not in PRECISIONS:
+        msg = f"Unsupported precision: {precision}"
+        raise ValueError(msg)
+
+    with contextlib.ExitStack() as stack:
+        if inference_mode:
+            stack.enter_context(torch.inference_mode())
+        if precision == BF16:
+            stack.enter_context(torch.autocast(device_type(device), dtype=torch.bfloat16))
+        yield
+
+
+def time_image_encoder(sam: SAM2Base, image: torch.Tensor, device: str, iterations: int = TIMING_ITERATIONS) -> float:
+    """Mean wall time of the SAM 2 image encoder over `iterations` warm runs.
+
+    CUDA kernels run asynchronously, so the device is synchronised before the clock is
+    read.
+
+    Parameters:
+        sam: The SAM 2 model.
+        image: The image batch to encode.
+        device: The `torch` device the model runs on.
+        iterations: Number of timed runs.
+
+    """
+
+    def synchronize() -> None:
+        if device_type(device) == "cuda":
+            torch.cuda.synchronize(device)
+
+    synchronize()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        sam.image_encoder(image)
+    synchronize()
+
+    return (time.perf_counter() - start) / iterations
+
+
+def compile_image_encoder(sam: SAM2Base, device: str, precision: str = FP32, inference_mode: bool = False) -> None:
+    """Compile the SAM 2 image encoder with `torch.compile` and warm it up.
+
+    Only the encoder `forward` is compiled (as per SAM 2 `compile_image_encoder`), so the
+    module and its weights are unchanged. The warm-up runs one full size image through the
+    encoder under the execution context. The compile time and the speedup of the compiled
+    encoder over eager mode, both timed over warm runs, are logged.
+
+    Parameters:
+        sam: The SAM 2 model.
+        device: The `torch` device the model runs on.
+        precision: See `execution_context`.
+        inference_mode: See `execution_context`.
+
+    """
+    warm_up = torch.zeros(1, 3, sam.image_size, sam.image_size, device=device)
+    with execution_context(device, precision, inference_mode):
+        sam.image_encoder(warm_up)
+        eager = time_image_encoder(sam, warm_up, device)
+
+        sam.image_encoder.forward = torch.compile(sam.image_encoder.forward)
+
+        compile_time = time_image_encoder(sam, warm_up, device, iterations=1)
+        compiled = time_image_encoder(sam, warm_up, device)
+
+    log.info(
+        f"SAM image encoder compiled in {compile_time:.2f}s "
+        f"(eager: {eager:.3f}s | compiled: {compiled:.3f}s | "
+        f"speedup: {eager / compiled:.2f}x over {TIMING_ITERATIONS} runs)"
+    )
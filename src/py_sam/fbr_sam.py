@@ -1,42 +1,78 @@
 """Facebook Research Segment Anything 2 Model (SAM 2) tooling."""
 
+import contextlib
+import json
 import os
+import posixpath
+import time
+import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Type, cast
+from typing import Any, cast
 from urllib.parse import urlparse
 
 import cv2
-import matplotlib
-import matplotlib.pyplot as plt
+import fsspec  # type: ignore[import-untyped]
 import numpy as np
 import ray
 import torch
 from dotenv import load_dotenv
 from pyarrow.fs import FSSpecHandler, PyFileSystem  # type: ignore[import-untyped]
-from ray.data.datasource import FilenameProvider
-from s3fs import S3FileSystem  # type: ignore[import-untyped]
-from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator  # type: ignore[import-untyped]
-from sam2.build_sam import build_sam2  # type: ignore[import-untyped]
 
+# Not exported by the public Ray API, which is pinned in pyproject.toml.
+from ray.data._internal.datasource.parquet_datasink import ParquetDatasink
+from ray.data.datasource import Datasink, FilenameProvider
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+
+import py_sam.cache
+import py_sam.checkpoint
+import py_sam.concurrency
+import py_sam.decode
+import py_sam.dedup
+import py_sam.discovery
+import py_sam.execution
+import py_sam.incremental
+import py_sam.metrics
 import py_sam.model.hiera
+import py_sam.onnx_backend
+import py_sam.output
+import py_sam.profiles
+import py_sam.profiling
+import py_sam.prompting
+import py_sam.quantization
+import py_sam.render
+import py_sam.storage
+import py_sam.tiling
 from py_sam.logging_config import log
+from py_sam.mask_generator import BatchedMaskGenerator
 
 load_dotenv()
-matplotlib.use("agg")
 
 
 class ImageFilenameProvider(FilenameProvider):
     """Customised filename provider."""
 
-    def __init__(self, mask_symbol: str = "masks") -> None:
-        """Initialise a ImageFilenameProvider instance."""
+    def __init__(self, mask_symbol: str = "masks", file_extension: str | None = None) -> None:
+        """Initialise a ImageFilenameProvider instance.
+
+        Parameters:
+            mask_symbol: Token appended to the source filename stem.
+            file_extension: Replace the source filename suffixes (for example, `.json`).
+
+        """
         self.__mask_symbol = mask_symbol
+        self.__file_extension = file_extension
 
     @property
     def mask_symbol(self) -> str:
         """Mask token getter."""
         return self.__mask_symbol
 
+    @property
+    def file_extension(self) -> str | None:
+        """File extension override getter."""
+        return self.__file_extension
+
     def get_filename_for_row(  # type: ignore[no-untyped-def]
         self, row, task_index, block_index, row_index
     ) -> str:
@@ -52,15 +88,12 @@ class ImageFilenameProvider(FilenameProvider):
             The new masked filename.
 
         """
-        filename_base, filename_stem, filename_suffixes = (
-            ImageFilenameProvider.filename_splitter(row["path"])
-        )
+        filename_base, filename_stem, filename_suffixes = ImageFilenameProvider.filename_splitter(row["path"])
 
-        masked_output = f"{filename_base or ''}{filename_stem}_{self.mask_symbol}{''.join(filename_suffixes)}"
+        suffix = self.file_extension if self.file_extension is not None else "".join(filename_suffixes)
+        masked_output = f"{filename_base or ''}{filename_stem}_{self.mask_symbol}{suffix}"
         if row["flatten_output"]:
-            masked_output = (
-                f"{filename_stem}_{self.mask_symbol}{''.join(filename_suffixes)}"
-            )
+            masked_output = f"{filename_stem}_{self.mask_symbol}{suffix}"
 
         return masked_output
 
@@ -72,7 +105,7 @@ class ImageFilenameProvider(FilenameProvider):
             Tuple structure that represents the original filename construct.
 
         """
-        filename_name = Path(filename.split("/")[-1])
+        filename_name = Path(filename.rsplit("/", maxsplit=1)[-1])
         filename_parent = None
         uri_filename_parsed = urlparse(filename)
         if uri_filename_parsed.scheme in ["s3"]:
@@ -87,16 +120,141 @@ class ImageFilenameProvider(FilenameProvider):
         return filename_parent, filename_name.stem, filename_name.suffixes
 
 
+@dataclass(frozen=True)
+class FbrSamSettings:
+    """Mask generation, output and execution settings of a `FbrSam` instance.
+
+    Parameters:
+        output_mode: Render the overlay image (`overlay`), or encode the raw masks as COCO
+            RLE JSON (`coco_rle`), packed NPZ (`npz`) or per-mask records (`parquet`).
+        batch_size: Number of images that `ray.data.Dataset.map_batches` feeds through the
+            image encoder together. Rows come one at a time from `ray.data.Dataset.map` if
+            not set.
+        profile: Mask generation profile (`fast`, `balanced` or `quality`).
+        mask_settings: `SAM2AutomaticMaskGenerator` settings that override the profile.
+        execution: Model execution modes.
+        cache: Mask result cache. No caching if not set.
+        tiling: Tiled mask generation of large images. Whole images if not set.
+        profiler: Profiling of the first images. No profiling if not set.
+        dedup: Near-duplicate image grouping. No grouping if not set.
+        embedding_cache_bytes: Memory budget of the image embeddings of prompted images.
+
+    """
+
+    output_mode: str = py_sam.output.OVERLAY
+    batch_size: int | None = None
+    profile: str = py_sam.profiles.BALANCED
+    mask_settings: dict | None = None
+    execution: py_sam.execution.ExecutionSettings = field(default_factory=py_sam.execution.ExecutionSettings)
+    cache: py_sam.cache.CacheSettings | None = None
+    tiling: py_sam.tiling.TileSettings | None = None
+    profiler: py_sam.profiling.ProfilerSettings | None = None
+    dedup: py_sam.dedup.DedupSettings | None = None
+    embedding_cache_bytes: int = py_sam.prompting.DEFAULT_EMBEDDING_CACHE_BYTES
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.output_mode not in py_sam.output.OUTPUT_MODES:
+            msg = f"Unsupported output mode: {self.output_mode}"
+            raise ValueError(msg)
+        py_sam.profiles.resolve(self.profile, self.mask_settings)
+
+    @classmethod
+    def from_environment(cls, model_type: str, profile_path: str | None = None, **overrides: Any) -> "FbrSamSettings":
+        """Resolve the settings, with unset values from the environment.
+
+        The profile falls back to the `PY_SAM__PROFILE` environment variable. The execution
+        modes, mask result cache, profiler and near-duplicate grouping fall back to theirs
+        (see the `from_environment` of each).
+
+        Parameters:
+            model_type: The model type of the pre-trained weight.
+            profile_path: Location of the profile traces if the environment does not set
+                one.
+            overrides: Settings that take precedence over the environment. Values of `None`
+                are unset.
+
+        """
+        settings = {name: value for name, value in overrides.items() if value is not None}
+        if "profile" not in settings:
+            settings["profile"] = os.environ.get("PY_SAM__PROFILE", py_sam.profiles.BALANCED)
+        if "execution" not in settings:
+            settings["execution"] = py_sam.execution.ExecutionSettings.from_environment(model_type)
+        if "cache" not in settings:
+            settings["cache"] = py_sam.cache.CacheSettings.from_environment()
+        if "profiler" not in settings:
+            settings["profiler"] = py_sam.profiling.ProfilerSettings.from_environment(default_path=profile_path)
+        if "dedup" not in settings:
+            settings["dedup"] = py_sam.dedup.DedupSettings.from_environment()
+
+        return cls(**settings)
+
+
 class FbrSam:
     """Facebook Research Segment Anything Model (SAM) abstraction."""
 
     def __init__(
         self,
         device: str = "cpu",
-        model: Type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        settings: FbrSamSettings | None = None,
+        preload: bool = False,
     ) -> None:
-        """Initialise a Facebook Research Segment Anything Model (SAM) instance."""
-        if torch.backends.mps.is_available():
+        """Initialise a Facebook Research Segment Anything Model (SAM) instance.
+
+        The SAM 2 model and mask generator are built once per instance and reused across
+        every image that passes through. Set `preload` to build them here in the constructor
+        (for example, at Ray actor start). Otherwise, they are built lazily on first use.
+
+        Set the `settings` batch size when the instance is fed by
+        `ray.data.Dataset.map_batches` rather than `ray.data.Dataset.map`. Raw output modes
+        skip rendering altogether.
+
+        With a mask result cache (local or `s3://`), the masks of images that have been seen
+        before with the same model and mask generator settings are reused. The cache size
+        can be bound with least recently used eviction.
+
+        With tiling, the masks of images with a side longer than the tile size are generated
+        over overlapping tiles, stitched across the overlap borders. Peak memory then scales
+        with the tile size rather than the image size.
+
+        The resolved mask generation settings of the profile are recorded in the output
+        metadata.
+
+        The execution modes are opt-in. `bf16` precision runs the model under bfloat16
+        autocast (CPU included). `compile_encoder` compiles the image encoder with
+        `torch.compile` and warms it up when the model is built. `inference_mode` runs mask
+        generation under `torch.inference_mode`. `quantize` runs a dynamic INT8 quantized
+        model on CPU, cached next to the pre-trained weight (see
+        `py_sam.quantization.build_quantized`). The `onnx` engine runs the image encoder and
+        mask decoder on ONNX Runtime (CPU), from graphs exported into the model cache on
+        first use (see `py_sam.onnx_backend.export`).
+
+        The profiler traces the first images through this instance, named by the actor and
+        the source image (see `py_sam.profiling.TraceProfiler`).
+
+        Prompted segmentation (see `predict_prompts`) keeps the image embeddings of recently
+        prompted images in memory, up to the embedding cache budget.
+
+        Near-duplicate grouping runs mask generation once per group of images within the
+        grouping distance of perceptual hash of each other. The other images of a group
+        reuse the masks of its representative, matched against the most recent
+        representatives (see `py_sam.dedup.DuplicateIndex`).
+
+        Parameters:
+            device: Device to run the model on, unless MPS or CUDA are available.
+            model: The pre-trained weight to use for the compute.
+            settings: Mask generation, output and execution settings. Defaults apply if not
+                set.
+            preload: Build the model in the constructor.
+
+        """
+        self.__settings = settings or FbrSamSettings()
+        execution = self.settings.execution
+
+        if execution.quantize or execution.engine == py_sam.execution.ONNX:
+            self.__device = "cpu"
+        elif torch.backends.mps.is_available():
             self.__device = "mps"
         else:
             self.__device = "cuda" if torch.cuda.is_available() else device
@@ -105,11 +263,78 @@ class FbrSam:
         self.__model = model()
         log.info(f"SAM pre-trained weight initialised as: {self.__model.model_type}")
 
+        self.__cache = None
+        if self.settings.cache is not None:
+            cache_path = self.settings.cache.path
+            self.__cache = py_sam.cache.MaskCache(
+                cache_path, FbrSam.filesystem(cache_path), max_bytes=self.settings.cache.max_bytes
+            )
+            log.info(f"SAM mask cache initialised at: {cache_path}")
+
+        self.__trace_profiler = None
+        if self.settings.profiler is not None:
+            profiler = self.settings.profiler
+            self.__trace_profiler = py_sam.profiling.TraceProfiler(
+                profiler.path,
+                FbrSam.filesystem(profiler.path),
+                profiler=profiler.profiler,
+                max_images=profiler.images,
+            )
+            log.info(f"SAM {profiler.profiler} profiler initialised for {profiler.images} image(s) at: {profiler.path}")
+
+        self.__mask_settings = py_sam.profiles.resolve(self.settings.profile, self.settings.mask_settings)
+        metadata = {
+            "profile": self.settings.profile,
+            "model_type": self.model.model_type,
+            "mask_generator": self.mask_settings,
+            "precision": execution.precision,
+            "quantized": execution.quantize,
+            "engine": execution.engine,
+        }
+
+        self.__dedup = None
+        if self.settings.dedup is not None:
+            dedup = self.settings.dedup
+            metadata["dedup_distance"] = dedup.distance
+            self.__dedup = py_sam.dedup.DuplicateIndex(dedup.distance, window=dedup.window)
+            log.info(
+                f"SAM near-duplicate grouping within {dedup.distance} bits over {dedup.window} representative image(s)"
+            )
+        self.__metadata = json.dumps(metadata)
+
+        self.__prompted_predictor: py_sam.prompting.PromptedPredictor | None = None
+        self.__mask_generator: BatchedMaskGenerator | None = None
+        if preload:
+            self.load()
+
     def __call__(self, batch: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
         """Batch compute."""
-        batch["image"] = self.generate_masks(
-            image=batch["image"], image_name=str(batch["path"])
-        )
+        # Source image sizes are only set by reduced resolution decoding.
+        original_sizes = None
+        if "original_height" in batch:
+            original_sizes = np.stack([batch["original_height"], batch["original_width"]], axis=-1).tolist()
+
+        if self.batched:
+            output = self.generate_batch_masks(
+                images=list(batch["image"]),
+                image_names=[str(path) for path in batch["path"]],
+                original_sizes=original_sizes,
+            )
+        else:
+            output = self.generate_masks(  # type: ignore[assignment]
+                image=batch["image"],
+                image_name=str(batch["path"]),
+                original_size=original_sizes,  # type: ignore[arg-type]
+            )
+
+        if self.output_mode == py_sam.output.OVERLAY:
+            batch["image"] = output  # type: ignore[assignment]
+            batch["metadata"] = (
+                np.array([self.metadata] * len(output)) if self.batched else self.metadata  # type: ignore[assignment]
+            )
+        else:
+            del batch["image"]
+            batch["masks"] = output  # type: ignore[assignment]
 
         return batch
 
@@ -123,6 +348,128 @@ class FbrSam:
         """SAM model getter."""
         return self.__model
 
+    @property
+    def settings(self) -> FbrSamSettings:
+        """Mask generation, output and execution settings getter."""
+        return self.__settings
+
+    @property
+    def batched(self) -> bool:
+        """Batched (`map_batches`) compute mode getter."""
+        return self.settings.batch_size is not None
+
+    @property
+    def output_mode(self) -> str:
+        """Output mode getter."""
+        return self.settings.output_mode
+
+    @property
+    def cache(self) -> py_sam.cache.MaskCache | None:
+        """Mask result cache getter."""
+        return self.__cache
+
+    @property
+    def dedup(self) -> py_sam.dedup.DuplicateIndex | None:
+        """Near-duplicate image index getter."""
+        return self.__dedup
+
+    @property
+    def trace_profiler(self) -> py_sam.profiling.TraceProfiler | None:
+        """Profile trace writer getter."""
+        return self.__trace_profiler
+
+    @property
+    def mask_settings(self) -> dict:
+        """Resolved mask generation settings getter."""
+        return self.__mask_settings
+
+    @property
+    def metadata(self) -> str:
+        """Output metadata getter, as a JSON document of the profile and its settings."""
+        return self.__metadata
+
+    @property
+    def mask_generator(self) -> BatchedMaskGenerator:
+        """SAM 2 automatic mask generator getter.
+
+        Builds the model on first access.
+
+        """
+        if self.__mask_generator is None:
+            self.load()
+
+        return cast(BatchedMaskGenerator, self.__mask_generator)
+
+    @property
+    def prompted_predictor(self) -> py_sam.prompting.PromptedPredictor:
+        """SAM 2 prompted predictor getter.
+
+        Shares the model of the automatic mask generator. Built on first access.
+
+        """
+        if self.__prompted_predictor is None:
+            self.__prompted_predictor = py_sam.prompting.PromptedPredictor(
+                self.mask_generator.predictor,
+                py_sam.prompting.EmbeddingCache(self.settings.embedding_cache_bytes),
+                output_mode=self.mask_generator.output_mode,
+            )
+
+        return self.__prompted_predictor
+
+    def load(self) -> None:
+        """Load the pre-trained weights and build the SAM 2 automatic mask generator.
+
+        Subsequent calls are a no-op once the mask generator has been built.
+
+        """
+        if self.__mask_generator is not None:
+            return
+
+        execution = self.settings.execution
+        with py_sam.metrics.stage(py_sam.metrics.LOAD, self.model.model_type):
+            predictor_kwargs: dict = {}
+            if execution.engine == py_sam.execution.ONNX:
+                graphs = py_sam.onnx_backend.export(self.model)
+                start = time.perf_counter()
+                sam = cast(SAM2Base, py_sam.onnx_backend.build_predictor_model(self.model))
+                predictor_kwargs = {
+                    "predictor_class": py_sam.onnx_backend.OnnxImagePredictor,
+                    "predictor_kwargs": {"graphs": graphs},
+                }
+            elif execution.quantize:
+                start = time.perf_counter()
+                sam = py_sam.quantization.build_quantized(self.model)
+            else:
+                start = time.perf_counter()
+                sam = py_sam.checkpoint.build_mmap(self.model, self.device)
+            self.__mask_generator = BatchedMaskGenerator(
+                sam,
+                output_mode=("binary_mask" if self.output_mode == py_sam.output.OVERLAY else "uncompressed_rle"),
+                **predictor_kwargs,
+                **self.mask_settings,
+            )
+            log.info(
+                f"SAM model {self.model.model_type} loaded on {self.device} "
+                f"with the {execution.engine} engine "
+                f"in {time.perf_counter() - start:.2f}s (pid: {os.getpid()})"
+            )
+
+            if execution.compile_encoder:
+                py_sam.execution.compile_image_encoder(sam, self.device, execution.precision, execution.inference_mode)
+
+    def execution_context(self) -> contextlib.AbstractContextManager:
+        """Context for running the SAM 2 model as per the execution modes."""
+        execution = self.settings.execution
+
+        return py_sam.execution.execution_context(self.device, execution.precision, execution.inference_mode)
+
+    def profiling(self, image_names: list[str]) -> contextlib.AbstractContextManager:
+        """Context that profiles the images while the profiler budget lasts."""
+        if self.trace_profiler is None:
+            return contextlib.nullcontext()
+
+        return self.trace_profiler.profile(image_names)
+
     @staticmethod
     def image_convert(image: str | Path | np.ndarray) -> np.ndarray:
         """Standardise the image format for further processing.
@@ -133,9 +480,7 @@ class FbrSam:
             image: The source image to standardise.
 
         """
-        transformed_image = (
-            cv2.imread(str(image)) if isinstance(image, (str, Path)) else image
-        )
+        transformed_image = cv2.imread(str(image)) if isinstance(image, (str, Path)) else image
 
         return cv2.cvtColor(transformed_image, cv2.COLOR_BGR2RGB)
 
@@ -163,126 +508,526 @@ class FbrSam:
         return height, width
 
     def generate_masks(
-        self, image: str | Path | np.ndarray, image_name: str
-    ) -> np.ndarray:
+        self,
+        image: str | Path | np.ndarray,
+        image_name: str,
+        original_size: tuple[int, int] | None = None,
+    ) -> np.ndarray | bytes | list[dict]:
         """Generate the SAM prediction masks.
 
         Parameters:
             image:
             image_name:
+            original_size: Source image height and width if `image` was downscaled on
+                decode. Raw masks are scaled back to this size.
+
+        Returns:
+            The rendered overlay image, or the encoded masks for the raw output modes.
 
         """
         image = self.image_convert(image)
-        orig_height, orig_width = self.image_spec(image, image_name)
+        self.image_spec(image, image_name)
 
-        self.model.download()
+        with self.profiling([image_name]):
+            masks = self.predict([image], [image_name])[0]
+            py_sam.metrics.record_image(len(masks), self.model.model_type, image=image_name)
 
-        sam = build_sam2(
-            self.model.model_cfg,
-            self.model.checkpoint,
-            device=self.device,
-            apply_postprocessing=False,
-        )
+            return self.encode(image, masks, image_name, original_size)
 
-        mask_generator = SAM2AutomaticMaskGenerator(sam)
-        masks = mask_generator.generate(image)
+    def generate_batch_masks(
+        self,
+        images: list[str | Path | np.ndarray],
+        image_names: list[str],
+        original_sizes: list[tuple[int, int]] | None = None,
+    ) -> list[np.ndarray | bytes | list[dict]]:
+        """Generate the SAM prediction masks for a batch of images.
 
-        px = 1 / float(plt.rcParams.get("figure.dpi", 100.0))
-        plt.figure(figsize=(orig_width * px, orig_height * px))
-        plt.subplots_adjust(top=1, bottom=0, right=1, left=0, hspace=0, wspace=0)
-        plt.margins(0, 0)
-        plt.gca().xaxis.set_major_locator(plt.NullLocator())
-        plt.gca().yaxis.set_major_locator(plt.NullLocator())
-        plt.imshow(image)
-        self.show_annotations(masks)
+        The image encoder runs once over the whole batch before the masks are generated for
+        each image from its precomputed embeddings.
 
-        canvas = cast(plt.Figure, plt.gca().figure).canvas
-        canvas.draw()
-        data = np.frombuffer(canvas.tostring_rgb(), dtype=np.uint8)  # type: ignore[attr-defined]
+        Parameters:
+            images: The batch of images, as paths or decoded HWC RGB arrays.
+            image_names: Source image references, one for each image.
+            original_sizes: Source image heights and widths. See `generate_masks`.
 
-        return data.reshape(canvas.get_width_height()[::-1] + (3,))
+        """
+        converted_images = [self.image_convert(image) for image in images]
+        for image, image_name in zip(converted_images, image_names, strict=True):
+            self.image_spec(image, image_name)
 
-    @staticmethod
-    def show_annotations(anns: dict) -> None:
-        """Apply the masks via the set of image annotations.
+        with self.profiling(image_names):
+            batch_masks = self.predict(converted_images, image_names)
+            for masks, image_name in zip(batch_masks, image_names, strict=True):
+                py_sam.metrics.record_image(len(masks), self.model.model_type, image=image_name)
+
+            return [
+                self.encode(image, masks, image_name, original_size)
+                for image, masks, image_name, original_size in zip(
+                    converted_images,
+                    batch_masks,
+                    image_names,
+                    original_sizes or [None] * len(images),
+                    strict=True,
+                )
+            ]
+
+    def predict(self, images: list[np.ndarray], image_names: list[str]) -> list[list[dict]]:
+        """Run SAM 2 automatic mask generation over the images that are not cached.
+
+        With near-duplicate grouping, mask generation only runs over the representative of
+        each group, and the other images reuse its masks.
 
         Parameters:
-            anns: The image annotations.
+            images: The images in RGB format.
+            image_names: Source image references.
+
+        Returns:
+            The mask records for each image. Segmentations are binary masks or uncompressed
+            RLEs.
 
         """
-        if len(anns) == 0:
-            return
-        sorted_anns = sorted(anns, key=(lambda x: x["area"]), reverse=True)
-        ax = plt.gca()
-        ax.set_autoscale_on(False)
-
-        img = np.ones(
-            (
-                sorted_anns[0]["segmentation"].shape[0],
-                sorted_anns[0]["segmentation"].shape[1],
-                4,
+        batch_masks: list[list[dict] | None] = [None] * len(images)
+        keys: list[str] = []
+        if self.cache is not None:
+            settings = self.cache_key_settings()
+            for idx, (image, image_name) in enumerate(zip(images, image_names, strict=True)):
+                keys.append(self.cache.key(image, self.model.model_type, settings))
+                batch_masks[idx] = self.cache.get(keys[idx], image_name)
+
+        misses = [idx for idx, masks in enumerate(batch_masks) if masks is None]
+        hashes: dict[int, int] = {}
+        duplicates: dict[int, py_sam.dedup.Duplicate] = {}
+        if self.dedup is not None:
+            hashes, duplicates = self.dedup.group(images, image_names, misses)
+            misses = list(hashes)
+
+        with (
+            py_sam.metrics.stage(
+                py_sam.metrics.INFERENCE,
+                self.model.model_type,
+                images=len(misses),
+                cached=len(images) - len(misses) - len(duplicates),
+                duplicates=len(duplicates),
+            ),
+            self.execution_context(),
+        ):
+            generated = self._generate_masks(images, misses)
+
+        for idx, masks in generated.items():
+            batch_masks[idx] = masks
+            if self.cache is not None:
+                self.cache.put(keys[idx], masks)
+            if self.dedup is not None:
+                self.dedup.add(images[idx], image_names[idx], masks, image_hash=hashes[idx])
+
+        for idx, duplicate in duplicates.items():
+            batch_masks[idx] = (
+                duplicate.masks if duplicate.masks is not None else batch_masks[cast(int, duplicate.leader)]
+            )
+            py_sam.metrics.record_duplicate(
+                self.model.model_type,
+                image=image_names[idx],
+                representative=duplicate.representative,
+                distance=duplicate.distance,
             )
+
+        return cast(list[list[dict]], batch_masks)
+
+    def _generate_masks(self, images: list[np.ndarray], indices: list[int]) -> dict[int, list[dict]]:
+        """Run SAM 2 automatic mask generation over the images at `indices`.
+
+        Images with a side longer than the tile size are generated over tiles, and the
+        others through the image encoder together.
+
+        Parameters:
+            images: The images in RGB format.
+            indices: Positions in `images` of the images to generate the masks of.
+
+        Returns:
+            The mask records of each generated image, by position in `images`.
+
+        """
+        tiled = [idx for idx in indices if self.is_tiled(images[idx])]
+        whole = [idx for idx in indices if idx not in tiled]
+
+        generated: dict[int, list[dict]] = {}
+        for idx in tiled:
+            generated[idx] = py_sam.tiling.generate_tiled(
+                self.mask_generator, images[idx], cast(py_sam.tiling.TileSettings, self.settings.tiling)
+            )
+        if len(whole) == 1:
+            generated[whole[0]] = self.mask_generator.generate(images[whole[0]])
+        elif whole:
+            generated.update(
+                zip(whole, self.mask_generator.generate_batch([images[idx] for idx in whole]), strict=True)
+            )
+
+        return generated
+
+    def predict_prompts(
+        self,
+        image: str | Path | np.ndarray,
+        image_name: str,
+        prompts: py_sam.prompting.Prompts,
+        original_size: tuple[int, int] | None = None,
+    ) -> np.ndarray | bytes | list[dict]:
+        """Generate the SAM prediction masks of the object at point and box prompts.
+
+        The image embeddings are cached, so repeated prompts against the same image only
+        run the mask decoder.
+
+        Parameters:
+            image: The source image.
+            image_name: Source image reference.
+            prompts: Point and box prompts in source image pixel coordinates.
+            original_size: Source image height and width if `image` was downscaled on
+                decode. Prompts are scaled onto `image`, and raw masks back to this size.
+
+        Returns:
+            The rendered overlay image, or the encoded masks for the raw output modes.
+
+        """
+        image = self.image_convert(image)
+        height, width = self.image_spec(image, image_name)
+        if original_size is not None and tuple(original_size) != (height, width):
+            prompts = prompts.scale(width / original_size[1], height / original_size[0])
+
+        cache = self.prompted_predictor.cache
+        with (
+            py_sam.metrics.stage(
+                py_sam.metrics.INFERENCE,
+                self.model.model_type,
+                image=image_name,
+                prompted=True,
+            ),
+            self.execution_context(),
+        ):
+            masks = self.prompted_predictor.predict(image, prompts)
+        log.info(
+            f"Prompted {image_name} - embedding cache hits: {cache.hits} | "
+            f"misses: {cache.misses} | {cache.nbytes} of {cache.max_bytes} bytes in use"
         )
-        img[:, :, 3] = 0
-        for ann in sorted_anns:
-            m = ann["segmentation"]
-            color_mask = np.concatenate([np.random.random(3), [0.35]])
-            img[m] = color_mask
-        ax.imshow(img)
+        py_sam.metrics.record_image(len(masks), self.model.model_type, image=image_name)
+
+        return self.encode(image, masks, image_name, original_size)
+
+    def is_tiled(self, image: np.ndarray) -> bool:
+        """Whether the masks of `image` are generated over tiles."""
+        tiling = self.settings.tiling
+
+        return tiling is not None and max(image.shape[:2]) > tiling.size
+
+    def cache_key_settings(self) -> dict:
+        """Return the settings that determine the generated masks, for the mask result cache key."""
+        execution = self.settings.execution
+        settings = self.mask_generator.settings()
+        settings.update(precision=execution.precision, quantize=execution.quantize, engine=execution.engine)
+        if self.settings.tiling is not None:
+            settings.update(tile_size=self.settings.tiling.size, tile_overlap=self.settings.tiling.overlap)
+
+        return settings
+
+    def encode(
+        self,
+        image: np.ndarray,
+        masks: list[dict],
+        image_name: str,
+        original_size: tuple[int, int] | None = None,
+    ) -> np.ndarray | bytes | list[dict]:
+        """Encode the SAM prediction masks as per the output mode.
+
+        Overlays are rendered at the size of `image` and scaled to the source image size by
+        the datasink on write.
+
+        Parameters:
+            image: The source image in RGB format.
+            masks: The mask records from the SAM 2 automatic mask generator.
+            image_name: Source image reference.
+            original_size: Source image height and width. Raw masks are scaled to this size
+                when it differs from the `image` size.
+
+        """
+        if self.output_mode == py_sam.output.OVERLAY:
+            with py_sam.metrics.stage(py_sam.metrics.RENDER, self.model.model_type, image=image_name):
+                return self.render(image, masks)
+
+        with py_sam.metrics.stage(py_sam.metrics.ENCODE, self.model.model_type, image=image_name):
+            return self._encode_masks(image, masks, image_name, original_size)
+
+    def _encode_masks(
+        self,
+        image: np.ndarray,
+        masks: list[dict],
+        image_name: str,
+        original_size: tuple[int, int] | None = None,
+    ) -> bytes | list[dict]:
+        """Encode the SAM prediction masks as per the raw output mode. See `encode`."""
+        height, width = image.shape[:2]
+        if original_size is not None and tuple(original_size) != (height, width):
+            masks = py_sam.output.upscale_masks(
+                masks,
+                (height, width),
+                tuple(original_size),  # type: ignore[arg-type]
+            )
+            height, width = original_size
+        metadata = json.loads(self.metadata)
+        if self.output_mode == py_sam.output.COCO_RLE:
+            return py_sam.output.to_coco_json(masks, image_name, height, width, metadata=metadata)
+        if self.output_mode == py_sam.output.NPZ:
+            return py_sam.output.to_npz(masks, height, width, metadata=metadata)
+
+        return [{**record, "metadata": self.metadata} for record in py_sam.output.mask_records(masks)]
+
+    @staticmethod
+    def render(image: np.ndarray, masks: list[dict]) -> np.ndarray:
+        """Render the SAM prediction masks over the source image.
+
+        Parameters:
+            image: The source image in RGB format.
+            masks: The mask records from the SAM 2 automatic mask generator.
+
+        Returns:
+            The overlay image at the same resolution as `image`.
+
+        """
+        return py_sam.render.composite(image, masks)
+
+    @staticmethod
+    def filesystem(uri: str) -> fsspec.AbstractFileSystem:
+        """Return the `fsspec` filesystem for `uri`.
+
+        S3 URIs get an `S3FileSystem` configured from the environment (see
+        `py_sam.storage.S3Settings.from_environment`), shared across the worker process.
+        Everything else is treated as local.
+
+        Parameters:
+            uri: Resource location.
+
+        """
+        if urlparse(uri).scheme in ["s3"]:
+            return py_sam.storage.s3_filesystem(py_sam.storage.S3Settings.from_environment())
+
+        return fsspec.filesystem("file")
 
     @staticmethod
     def process(
-        source_data_path: str,
-        model: Type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
-        output_path: str | None = None,
-        flatten_output: bool = False,
-        file_format: str = "PNG",
+        source: py_sam.discovery.SourceSettings,
+        output: py_sam.output.OutputSettings,
+        model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        settings: FbrSamSettings | None = None,
+        concurrency: py_sam.concurrency.ConcurrencySettings | None = None,
     ) -> None:
         """Ray SAM batch processing.
 
-        source_data_path: Location of the source images to run the SAM predictions over.
-        model: The pre-trained weight to use for the compute.
-        output_path: Override the path to write the masks to.
-        flatten_output: Only use filename as output to `output_path`.
-        file_format: The image file format to write with.
+        The source images are read from a data path (listed up front, or paged through as
+        the pipeline runs with streaming discovery) or from an input manifest. See
+        `py_sam.discovery.SourceSettings.from_environment`.
 
-        """
-        log.info(f"Source data path: {source_data_path}")
+        Parameters:
+            source: The source images to run the SAM predictions over.
+            output: Where and how to write the masks. Incremental runs skip source images
+                that are recorded in the manifest or that already have an output file.
+            model: The pre-trained weight to use for the compute.
+            settings: Mask generation, output and execution settings of the inference
+                actors. Resolved from the environment if not set (see
+                `FbrSamSettings.from_environment`), with the profile traces under
+                `_profiles` of the output path.
+            concurrency: Requested stage concurrency. See `py_sam.concurrency.resolve`.
 
-        uri_parsed = urlparse(source_data_path)
+        """
+        settings = settings or FbrSamSettings.from_environment(
+            model().model_type, profile_path=posixpath.join(output.path, py_sam.profiling.PROFILES_DIRNAME)
+        )
+        if source.input_manifest is not None:
+            log.info(f"Input manifest: {source.input_manifest}")
+        else:
+            log.info(f"Source data path: {source.data_path} (streaming discovery: {source.streaming_discovery})")
+        log.info(f"SAM settings - {settings}")
 
+        filesystem = FbrSam.filesystem(source.uri)
         pa_fs = None
-        if uri_parsed.scheme in ["s3"]:
-            filesystem = S3FileSystem(
-                key=os.environ.get("AWS_ACCESS_KEY_ID"),
-                secret=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-                client_kwargs={
-                    "endpoint_url": os.environ.get("MINIO_URL"),
-                    "verify": os.environ.get("MINIO_SSL_VERIFY", "true") == "true",
-                },
-            )
+        if urlparse(source.uri).scheme in ["s3"]:
             pa_fs = PyFileSystem(FSSpecHandler(filesystem))
 
         num_cpus = os.environ.get("PY_SAM__NUM_CPUS")
         num_gpus = os.environ.get("PY_SAM__NUM_GPUS")
         log.info(f"Overriding values for CPU/GPU: {num_cpus}/{num_gpus}")
 
-        ray.data.read_images(
-            paths=source_data_path,
+        stage_concurrency = py_sam.concurrency.resolve(
+            concurrency,
+            num_cpus=float(num_cpus) if num_cpus else None,
+            num_gpus=float(num_gpus) if num_gpus else None,
+        )
+        log.info(f"Stage concurrency - {stage_concurrency}")
+
+        manifest = None
+        pending_kwargs = None
+        if output.incremental:
+            manifest = py_sam.incremental.Manifest(
+                output.manifest_path or posixpath.join(output.path, py_sam.incremental.MANIFEST_DIRNAME),
+                filesystem,
+            )
+            pending_kwargs = FbrSam.pending_kwargs(manifest, output, settings.output_mode, filesystem)
+
+        dataset = FbrSam.read_source(source, filesystem, pa_fs, pending_kwargs, stage_concurrency.read)
+        if dataset is None:
+            log.info("Incremental run: all source images already processed")
+            return
+        dataset = dataset.add_column("flatten_output", lambda df: output.flatten)
+
+        compute_kwargs = {
+            "fn_constructor_kwargs": {"model": model, "settings": settings, "preload": True},
+            "num_cpus": int(num_cpus) if num_cpus else None,
+            "num_gpus": int(num_gpus) if num_gpus else None,
+            "concurrency": stage_concurrency.inference,
+        }
+        if settings.batch_size is not None:
+            log.info(f"Batched image encoder mode with batch size: {settings.batch_size}")
+            dataset = dataset.map_batches(
+                FbrSam, batch_size=settings.batch_size, batch_format="numpy", **compute_kwargs
+            )
+        else:
+            dataset = dataset.map(FbrSam, **compute_kwargs)
+
+        if settings.output_mode == py_sam.output.PARQUET:
+            dataset = dataset.flat_map(py_sam.output.explode_records)
+
+        datasink = FbrSam.datasink(output.path, pa_fs, output_mode=settings.output_mode, file_format=output.file_format)
+        if manifest is not None:
+            datasink = py_sam.incremental.ManifestDatasink(datasink, manifest)
+
+        dataset.write_datasink(datasink, concurrency=stage_concurrency.write)
+
+    @staticmethod
+    def pending_kwargs(
+        manifest: py_sam.incremental.Manifest,
+        output: py_sam.output.OutputSettings,
+        output_mode: str,
+        filesystem: fsspec.AbstractFileSystem,
+    ) -> dict[str, Any]:
+        """Incremental run filter of the source images that are still to be processed.
+
+        Parameters:
+            manifest: The incremental run manifest.
+            output: The batch run output settings.
+            output_mode: See `FbrSamSettings`.
+            filesystem: The `fsspec` filesystem of the output path.
+
+        Returns:
+            The `py_sam.incremental.pending_images` keyword arguments.
+
+        """
+        return {
+            "completed": manifest.completed(),
+            "existing_outputs": (
+                set()
+                if output_mode == py_sam.output.PARQUET
+                else py_sam.incremental.list_outputs(output.path, filesystem)
+            ),
+            "filename_provider": ImageFilenameProvider(file_extension=py_sam.output.FILE_EXTENSIONS.get(output_mode)),
+            "flatten_output": output.flatten,
+        }
+
+    @staticmethod
+    def read_source(
+        source: py_sam.discovery.SourceSettings,
+        filesystem: fsspec.AbstractFileSystem,
+        pa_fs: PyFileSystem | None,
+        pending_kwargs: dict[str, Any] | None,
+        read_concurrency: int,
+    ) -> ray.data.Dataset | None:
+        """Ray dataset of the decoded source images.
+
+        Parameters:
+            source: The source images.
+            filesystem: The `fsspec` filesystem of the source images.
+            pa_fs: The `pyarrow` filesystem of S3 source images.
+            pending_kwargs: Incremental run filter (see `FbrSam.pending_kwargs`). Every
+                source image is read if not set.
+            read_concurrency: Number of concurrent read tasks.
+
+        Returns:
+            The dataset, or `None` when an incremental run has no source image left.
+
+        """
+        if source.input_manifest is not None or source.streaming_discovery:
+            if source.input_manifest is not None:
+                dataset = py_sam.discovery.read_input_manifest(source.input_manifest, filesystem)
+            else:
+                dataset = py_sam.discovery.read_image_paths(source.uri, filesystem)
+            if pending_kwargs is not None:
+                dataset = dataset.map_batches(
+                    py_sam.discovery.pending_batch,
+                    fn_kwargs=pending_kwargs,
+                    batch_format="pyarrow",
+                    batch_size=None,
+                )
+
+            return dataset.map(
+                py_sam.discovery.load_row,
+                fn_kwargs={"filesystem_factory": FbrSam.filesystem, "max_side": source.max_side},
+                concurrency=read_concurrency,
+            )
+
+        paths: str | list[str] = source.uri
+        if pending_kwargs is not None:
+            paths = py_sam.incremental.pending_images(
+                py_sam.incremental.list_images(source.uri, filesystem), **pending_kwargs
+            )
+            if not paths:
+                return None
+
+        if source.max_side is not None:
+            log.info(f"Reduced resolution decode with max side: {source.max_side}")
+            return ray.data.read_binary_files(
+                paths=paths,
+                filesystem=pa_fs,
+                include_paths=True,
+                file_extensions=list(py_sam.incremental.IMAGE_EXTENSIONS),
+                concurrency=read_concurrency,
+            ).map(
+                py_sam.decode.decode_row,
+                fn_kwargs={"max_side": source.max_side},
+                concurrency=read_concurrency,
+            )
+
+        return ray.data.read_images(
+            paths=paths,
             filesystem=pa_fs,
             include_paths=True,
-            concurrency=int(os.environ.get("PY_SAM__CONCURRENCY", 1)),
-        ).add_column("flatten_output", lambda df: flatten_output).map(
-            FbrSam,
-            fn_constructor_kwargs={"model": model},
-            num_cpus=int(num_cpus) if num_cpus else None,
-            num_gpus=int(num_gpus) if num_gpus else None,
-            concurrency=int(os.environ.get("PY_SAM__CONCURRENCY", 1)),
-        ).write_images(
-            path=output_path,
-            filesystem=pa_fs,
-            column="image",
-            file_format=file_format,
-            concurrency=int(os.environ.get("PY_SAM__CONCURRENCY", 1)),
+            concurrency=read_concurrency,
+        )
+
+    @staticmethod
+    def datasink(
+        output_path: str,
+        filesystem: PyFileSystem | None,
+        output_mode: str = py_sam.output.OVERLAY,
+        file_format: str = "PNG",
+    ) -> Datasink:
+        """Ray datasink for the output mode.
+
+        Parameters:
+            output_path: Path to write the masks to.
+            filesystem: The filesystem to write to. Inferred from `output_path` if not set.
+            output_mode: See `FbrSam.process`.
+            file_format: The image file format to write with in `overlay` output mode.
+
+        """
+        if output_mode == py_sam.output.PARQUET:
+            return ParquetDatasink(output_path, filesystem=filesystem, dataset_uuid=uuid.uuid4().hex)
+
+        if output_mode in py_sam.output.FILE_EXTENSIONS:
+            return py_sam.output.MaskDatasink(
+                output_path,
+                filesystem=filesystem,
+                filename_provider=ImageFilenameProvider(file_extension=py_sam.output.FILE_EXTENSIONS[output_mode]),
+            )
+
+        return py_sam.output.OverlayDatasink(
+            output_path,
+            "image",
+            file_format,
+            filesystem=filesystem,
             filename_provider=ImageFilenameProvider(),
         )
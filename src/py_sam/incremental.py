@@ -0,0 +1,198 @@
+"""Incremental (resumable) batch run support."""
+
+import posixpath
+import uuid
+from collections.abc import Iterable
+from typing import TYPE_CHECKING, Any
+
+import fsspec  # type: ignore[import-untyped]
+from ray.data.block import Block, BlockAccessor
+from ray.data.datasource import Datasink, FilenameProvider
+from ray.data.datasource.datasink import WriteResult
+
+from py_sam.logging_config import log
+
+if TYPE_CHECKING:
+    # Not exported by the public Ray API, so only imported for type checking.
+    from ray.data._internal.execution.interfaces import TaskContext
+
+IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "tif", "tiff", "bmp", "gif")
+
+MANIFEST_DIRNAME = "_manifest"
+
+
+def list_images(source_data_path: str, filesystem: fsspec.AbstractFileSystem) -> list[str]:
+    """List the image files under `source_data_path` as `ray.data.read_images` would.
+
+    Paths are returned without the URI scheme, matching the `path` column that
+    `ray.data.read_images(..., include_paths=True)` produces.
+
+    Parameters:
+        source_data_path: Image file or prefix.
+        filesystem: The `fsspec` filesystem that hosts `source_data_path`.
+
+    """
+    root = filesystem._strip_protocol(source_data_path)
+    paths = [root] if filesystem.isfile(root) else filesystem.find(root)
+
+    return sorted(path for path in paths if path.rsplit(".", 1)[-1].lower() in IMAGE_EXTENSIONS)
+
+
+def list_outputs(output_path: str, filesystem: fsspec.AbstractFileSystem) -> set[str]:
+    """Existing files under `output_path`, relative to `output_path`.
+
+    Parameters:
+        output_path: Output prefix.
+        filesystem: The `fsspec` filesystem that hosts `output_path`.
+
+    """
+    root = filesystem._strip_protocol(output_path).rstrip("/")
+    if not filesystem.exists(root):
+        return set()
+
+    return {path[len(root) :].lstrip("/") for path in filesystem.find(root)}
+
+
+class Manifest:
+    """Record of completed input paths.
+
+    The manifest is a prefix of append-only shard files, each holding one input path per
+    line. Each write task adds its own shard, so concurrent writers never contend and
+    object stores without append semantics (like S3) are supported.
+
+    """
+
+    def __init__(self, location: str, filesystem: fsspec.AbstractFileSystem) -> None:
+        """Initialise a Manifest instance."""
+        self.__location = filesystem._strip_protocol(location).rstrip("/")
+        self.__filesystem = filesystem
+
+    @property
+    def location(self) -> str:
+        """Manifest prefix getter."""
+        return self.__location
+
+    @property
+    def filesystem(self) -> fsspec.AbstractFileSystem:
+        """Manifest filesystem getter."""
+        return self.__filesystem
+
+    def completed(self) -> set[str]:
+        """Input paths recorded as completed."""
+        if not self.filesystem.exists(self.location):
+            return set()
+
+        completed: set[str] = set()
+        for shard in self.filesystem.find(self.location):
+            completed.update(line for line in self.filesystem.cat_file(shard).decode().splitlines() if line)
+
+        return completed
+
+    def append(self, paths: Iterable[str], shard: str | None = None) -> None:
+        """Record `paths` as completed in a new manifest shard.
+
+        Parameters:
+            paths: The completed input paths.
+            shard: Shard file name. Defaults to a random unique name.
+
+        """
+        lines = "".join(f"{path}\n" for path in dict.fromkeys(paths))
+        if not lines:
+            return
+
+        self.filesystem.makedirs(self.location, exist_ok=True)
+        shard_path = posixpath.join(self.location, shard or f"{uuid.uuid4().hex}.txt")
+        self.filesystem.pipe_file(shard_path, lines.encode())
+
+
+def pending_images(
+    paths: list[str],
+    completed: set[str],
+    existing_outputs: set[str],
+    filename_provider: FilenameProvider,
+    flatten_output: bool,
+) -> list[str]:
+    """Filter out input images that already have a result.
+
+    An input image is done if it is in the manifest or its expected output file exists.
+
+    Parameters:
+        paths: Candidate input image paths.
+        completed: Input paths recorded in the manifest.
+        existing_outputs: Existing output files relative to the output location.
+        filename_provider: Filename provider used when writing the results.
+        flatten_output: Whether output is written to the output path without nesting.
+
+    """
+    pending = []
+    for path in paths:
+        if path in completed:
+            continue
+        output = filename_provider.get_filename_for_row({"path": path, "flatten_output": flatten_output}, 0, 0, 0)
+        if output not in existing_outputs:
+            pending.append(path)
+
+    log.info(f"Incremental run: {len(pending)} of {len(paths)} images pending")
+
+    return pending
+
+
+class ManifestDatasink(Datasink):
+    """Datasink wrapper that appends the input paths of each written task to a manifest."""
+
+    def __init__(self, datasink: Datasink, manifest: Manifest) -> None:
+        """Initialise a ManifestDatasink instance."""
+        self.__datasink = datasink
+        self.__manifest = manifest
+
+    @property
+    def datasink(self) -> Datasink:
+        """Wrapped datasink getter."""
+        return self.__datasink
+
+    @property
+    def manifest(self) -> Manifest:
+        """Manifest getter."""
+        return self.__manifest
+
+    def on_write_start(self) -> None:
+        """Delegate to the wrapped datasink."""
+        self.datasink.on_write_start()
+
+    def write(self, blocks: Iterable[Block], ctx: "TaskContext") -> Any:
+        """Write the blocks with the wrapped datasink, then record their input paths."""
+        blocks = list(blocks)
+        result = self.datasink.write(blocks, ctx)
+
+        self.manifest.append(path for block in blocks for path in self.paths(block))
+
+        return result
+
+    @staticmethod
+    def paths(block: Block) -> list[str]:
+        """Input paths of a block, converting only its projected `path` column."""
+        paths = BlockAccessor.for_block(block).select(["path"])
+
+        return BlockAccessor.for_block(paths).to_arrow().column("path").to_pylist()
+
+    def on_write_complete(self, write_result: WriteResult) -> None:
+        """Delegate to the wrapped datasink."""
+        self.datasink.on_write_complete(write_result)
+
+    def on_write_failed(self, error: Exception) -> None:
+        """Delegate to the wrapped datasink."""
+        self.datasink.on_write_failed(error)
+
+    def get_name(self) -> str:
+        """Name of the wrapped datasink."""
+        return self.datasink.get_name()
+
+    @property
+    def supports_distributed_writes(self) -> bool:
+        """Delegate to the wrapped datasink."""
+        return self.datasink.supports_distributed_writes
+
+    @property
+    def num_rows_per_write(self) -> int | None:
+        """Delegate to the wrapped datasink."""
+        return self.datasink.num_rows_per_write
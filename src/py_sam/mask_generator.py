@@ -0,0 +1,358 @@
+"""SAM 2 automatic mask generation over batches of images."""
+
+import hashlib
+from typing import Any
+
+import numpy as np
+import torch
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator  # type: ignore[import-untyped]
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+from sam2.sam2_image_predictor import SAM2ImagePredictor  # type: ignore[import-untyped]
+from sam2.utils.amg import (  # type: ignore[import-untyped]
+    MaskData,
+    calculate_stability_score,
+    coco_encode_rle,
+    generate_crop_boxes,
+    is_box_near_crop_edge,
+    uncrop_boxes_xyxy,
+    uncrop_masks,
+    uncrop_points,
+)
+from torchvision.ops.boxes import batched_nms, box_area  # type: ignore[import-untyped]
+
+import py_sam.postprocess
+
+
+class EmbeddingImagePredictor(SAM2ImagePredictor):
+    """SAM 2 image predictor that can be primed with image embeddings computed elsewhere."""
+
+    def __init__(self, sam_model: SAM2Base, **kwargs: Any) -> None:
+        """Initialise an EmbeddingImagePredictor instance."""
+        super().__init__(sam_model, **kwargs)
+        self.__precomputed: tuple[dict, tuple[int, int]] | None = None
+
+    def prime(self, features: dict, orig_hw: tuple[int, int]) -> None:
+        """Set the embeddings to use for the next full-frame `set_image`.
+
+        Parameters:
+            features: Single image `image_embed` and `high_res_feats` features.
+            orig_hw: Original height and width of the image the features were computed from.
+
+        """
+        self.__precomputed = (features, (int(orig_hw[0]), int(orig_hw[1])))
+
+    def clear(self) -> None:
+        """Drop any primed embeddings."""
+        self.__precomputed = None
+
+    def is_primed(self, image: np.ndarray) -> bool:
+        """Whether the primed embeddings apply to `image`."""
+        return self.__precomputed is not None and tuple(image.shape[:2]) == self.__precomputed[1]
+
+    def set_image(self, image: np.ndarray) -> None:  # type: ignore[override]
+        """Use the primed embeddings if they match `image`, otherwise run the image encoder."""
+        if self.__precomputed is not None and self.is_primed(image):
+            self.reset_predictor()
+            self._features, orig_hw = self.__precomputed
+            self._orig_hw = [orig_hw]
+            self._is_image_set = True
+            return
+
+        super().set_image(image)
+
+
+class BatchedMaskGenerator(SAM2AutomaticMaskGenerator):
+    """SAM 2 automatic mask generator that shares one image encoder pass across a batch.
+
+    The Hiera image encoder runs once over the stacked batch. The point grid prompts and mask
+    decoder then run for each image against its slice of the batch embeddings.
+
+    The masks of an image stay stacked on the model device (bit packed between point
+    batches) rather than being RLE encoded mask by mask. Small region filtering
+    (`min_mask_region_area`), overlap suppression and area sorting then run over the whole
+    stack (see `py_sam.postprocess`). Mask records are returned largest first.
+
+    Unlike `SAM2AutomaticMaskGenerator.generate`, which hands `min_mask_region_area` to the
+    image predictor to fill holes and remove sprinkles over the low resolution masks (with
+    the SAM 2 CUDA extension only), small regions are filtered over the full resolution
+    masks, as the SAM 2 `postprocess_small_regions` helper does. This is a deliberate
+    change: the filtering no longer depends on the CUDA extension being built.
+
+    """
+
+    def __init__(
+        self,
+        model: SAM2Base,
+        predictor_class: type[EmbeddingImagePredictor] = EmbeddingImagePredictor,
+        predictor_kwargs: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """Initialise a BatchedMaskGenerator instance.
+
+        Parameters:
+            model: The SAM 2 model.
+            predictor_class: The image predictor implementation, for example
+                `py_sam.onnx_backend.OnnxImagePredictor`.
+            predictor_kwargs: Extra `predictor_class` keyword arguments.
+            kwargs: `SAM2AutomaticMaskGenerator` settings.
+
+        """
+        super().__init__(model, **kwargs)
+        # Drops the SAM 2 `max_hole_area` and `max_sprinkle_area` predictor settings: small
+        # regions are filtered at full resolution in `generate` instead (see class docstring).
+        self.predictor = predictor_class(model, **(predictor_kwargs or {}))
+
+    def settings(self) -> dict[str, Any]:
+        """Mask generation settings that determine the generated masks.
+
+        The point grids are summarised by their digest.
+
+        """
+        digest = hashlib.sha256()
+        for grid in self.point_grids:
+            digest.update(np.ascontiguousarray(grid, dtype=np.float64).tobytes())
+
+        return {
+            "point_grids": digest.hexdigest(),
+            "pred_iou_thresh": self.pred_iou_thresh,
+            "stability_score_thresh": self.stability_score_thresh,
+            "stability_score_offset": self.stability_score_offset,
+            "mask_threshold": self.mask_threshold,
+            "box_nms_thresh": self.box_nms_thresh,
+            "crop_n_layers": self.crop_n_layers,
+            "crop_nms_thresh": self.crop_nms_thresh,
+            "crop_overlap_ratio": self.crop_overlap_ratio,
+            "crop_n_points_downscale_factor": self.crop_n_points_downscale_factor,
+            "min_mask_region_area": self.min_mask_region_area,
+            "use_m2m": self.use_m2m,
+            "multimask_output": self.multimask_output,
+        }
+
+    @torch.no_grad()
+    def generate_batch(self, images: list[np.ndarray]) -> list[list[dict[str, Any]]]:
+        """Generate masks for each image in `images`.
+
+        Parameters:
+            images: The images to generate masks for, in HWC uint8 RGB format.
+
+        Returns:
+            A list of mask records for each image, as per `SAM2AutomaticMaskGenerator.generate`.
+
+        """
+        if not images:
+            return []
+
+        predictor = self.predictor
+        predictor.set_image_batch(images)
+        features = predictor._features
+        orig_hws = predictor._orig_hw
+        predictor.reset_predictor()
+
+        batch_masks = []
+        try:
+            for idx, image in enumerate(images):
+                predictor.prime(
+                    {
+                        "image_embed": features["image_embed"][idx : idx + 1],
+                        "high_res_feats": [feat[idx : idx + 1] for feat in features["high_res_feats"]],
+                    },
+                    orig_hws[idx],
+                )
+                batch_masks.append(self.generate(image))
+        finally:
+            predictor.clear()
+
+        return batch_masks
+
+    @torch.no_grad()
+    def generate(self, image: np.ndarray) -> list[dict[str, Any]]:
+        """Generate masks for `image`, as per `SAM2AutomaticMaskGenerator.generate`.
+
+        Parameters:
+            image: The image to generate masks for, in HWC uint8 RGB format.
+
+        Returns:
+            The mask records, in descending area order.
+
+        """
+        height, width = image.shape[:2]
+        data = self._generate_masks(image)
+        masks = py_sam.postprocess.unpack_masks(data["masks"], height, width)
+        keep, masks, areas, boxes = py_sam.postprocess.postprocess(
+            masks,
+            min_area=self.min_mask_region_area,
+            nms_thresh=self.box_nms_thresh,
+        )
+
+        if self.output_mode == "binary_mask":
+            segmentations: list[Any] = list(masks.cpu().numpy())
+        else:
+            segmentations = py_sam.postprocess.masks_to_rles(masks)
+            if self.output_mode == "coco_rle":
+                segmentations = [coco_encode_rle(rle) for rle in segmentations]
+
+        del data["masks"]
+        data.filter(keep)
+        columns = zip(
+            segmentations,
+            areas.tolist(),
+            py_sam.postprocess.boxes_to_xywh(boxes),
+            data["iou_preds"].float().tolist(),
+            data["points"].float().tolist(),
+            data["stability_score"].float().tolist(),
+            py_sam.postprocess.boxes_to_xywh(data["crop_boxes"]),
+            strict=True,
+        )
+
+        return [
+            {
+                "segmentation": segmentation,
+                "area": area,
+                "bbox": bbox,
+                "predicted_iou": predicted_iou,
+                "point_coords": [point],
+                "stability_score": stability_score,
+                "crop_box": crop_box,
+            }
+            for (
+                segmentation,
+                area,
+                bbox,
+                predicted_iou,
+                point,
+                stability_score,
+                crop_box,
+            ) in columns
+        ]
+
+    def _generate_masks(self, image: np.ndarray) -> MaskData:
+        """Generate the packed masks of each crop of `image`, keeping them on the device."""
+        orig_size = image.shape[:2]
+        crop_boxes, layer_idxs = generate_crop_boxes(orig_size, self.crop_n_layers, self.crop_overlap_ratio)
+
+        data = MaskData()
+        for crop_box, layer_idx in zip(crop_boxes, layer_idxs, strict=True):
+            data.cat(self._process_crop(image, crop_box, layer_idx, orig_size))
+
+        # Remove duplicate masks between crops, preferring masks from smaller crops.
+        if len(crop_boxes) > 1:
+            scores = 1 / box_area(data["crop_boxes"]).to(data["boxes"].device)
+            data.filter(
+                batched_nms(
+                    data["boxes"].float(),
+                    scores,
+                    torch.zeros_like(data["boxes"][:, 0]),
+                    iou_threshold=self.crop_nms_thresh,
+                )
+            )
+
+        return data
+
+    def _process_crop(
+        self,
+        image: np.ndarray,
+        crop_box: list[int],
+        crop_layer_idx: int,
+        orig_size: tuple[int, ...],
+    ) -> MaskData:
+        """Generate the packed masks of the point grid of one crop of `image`."""
+        x0, y0, x1, y1 = crop_box
+        cropped_im = image[y0:y1, x0:x1, :]
+        cropped_im_size = cropped_im.shape[:2]
+        self.predictor.set_image(cropped_im)
+
+        points_scale = np.array(cropped_im_size)[None, ::-1]
+        points_for_image = self.point_grids[crop_layer_idx] * points_scale
+
+        data = MaskData()
+        for start in range(0, len(points_for_image), self.points_per_batch):
+            data.cat(
+                self._process_batch(
+                    points_for_image[start : start + self.points_per_batch],
+                    cropped_im_size,
+                    crop_box,
+                    orig_size,
+                    normalize=True,
+                )
+            )
+        self.predictor.reset_predictor()
+
+        data.filter(
+            batched_nms(
+                data["boxes"].float(),
+                data["iou_preds"],
+                torch.zeros_like(data["boxes"][:, 0]),
+                iou_threshold=self.box_nms_thresh,
+            )
+        )
+
+        data["boxes"] = uncrop_boxes_xyxy(data["boxes"], crop_box)
+        data["points"] = uncrop_points(data["points"], crop_box)
+        data["crop_boxes"] = torch.tensor([crop_box], device=data["boxes"].device).repeat(len(data["iou_preds"]), 1)
+
+        return data
+
+    def _process_batch(  # type: ignore[override]
+        self,
+        points: np.ndarray,
+        im_size: tuple[int, ...],
+        crop_box: list[int],
+        orig_size: tuple[int, ...],
+        normalize: bool = False,
+    ) -> MaskData:
+        """Predict and filter the masks of a batch of point prompts.
+
+        See `SAM2AutomaticMaskGenerator._process_batch`. The masks are bit packed on the
+        device rather than RLE encoded.
+
+        """
+        orig_h, orig_w = orig_size
+
+        points = torch.as_tensor(points, dtype=torch.float32, device=self.predictor.device)
+        in_points = self.predictor._transforms.transform_coords(points, normalize=normalize, orig_hw=im_size)
+        in_labels = torch.ones(in_points.shape[0], dtype=torch.int, device=in_points.device)
+        masks, iou_preds, low_res_masks = self.predictor._predict(
+            in_points[:, None, :],
+            in_labels[:, None],
+            multimask_output=self.multimask_output,
+            return_logits=True,
+        )
+
+        data = MaskData(
+            masks=masks.flatten(0, 1),
+            iou_preds=iou_preds.flatten(0, 1),
+            points=points.repeat_interleave(masks.shape[1], dim=0),
+            low_res_masks=low_res_masks.flatten(0, 1),
+        )
+        del masks
+
+        if self.use_m2m:
+            # One step refinement using the previous mask predictions.
+            in_points = self.predictor._transforms.transform_coords(
+                data["points"], normalize=normalize, orig_hw=im_size
+            )
+            labels = torch.ones(in_points.shape[0], dtype=torch.int, device=in_points.device)
+            masks, ious = self.refine_with_m2m(in_points, labels, data["low_res_masks"], self.points_per_batch)
+            data["masks"] = masks.squeeze(1)
+            data["iou_preds"] = ious.squeeze(1)
+        del data["low_res_masks"]
+
+        if self.pred_iou_thresh > 0.0:
+            data.filter(data["iou_preds"] > self.pred_iou_thresh)
+
+        data["stability_score"] = calculate_stability_score(
+            data["masks"], self.mask_threshold, self.stability_score_offset
+        )
+        if self.stability_score_thresh > 0.0:
+            data.filter(data["stability_score"] >= self.stability_score_thresh)
+
+        data["masks"] = data["masks"] > self.mask_threshold
+        data["boxes"] = py_sam.postprocess.mask_boxes(data["masks"])
+
+        keep_mask = ~is_box_near_crop_edge(data["boxes"], crop_box, [0, 0, orig_w, orig_h])
+        if not torch.all(keep_mask):
+            data.filter(keep_mask)
+
+        data["masks"] = py_sam.postprocess.pack_masks(uncrop_masks(data["masks"], crop_box, orig_h, orig_w))
+
+        return data
@@ -0,0 +1,160 @@
+"""Pipeline stage timing and throughput metrics.
+
+Metrics are emitted through `ray.util.metrics`, so they reach the Ray dashboard and the
+Prometheus endpoint of the Ray cluster (prefixed with `ray_`). Each stage timing is also
+logged as a structured `structlog` event.
+
+"""
+
+import contextlib
+import functools
+import time
+from collections.abc import Iterator
+from typing import Any
+
+from ray.util.metrics import Counter, Histogram
+
+from py_sam.logging_config import log
+
+DECODE = "decode"
+LOAD = "load"
+INFERENCE = "inference"
+RENDER = "render"
+ENCODE = "encode"
+
+STAGES = (DECODE, LOAD, INFERENCE, RENDER, ENCODE)
+
+LATENCY_BOUNDARIES = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+MASK_COUNT_BOUNDARIES = [1, 5, 10, 25, 50, 100, 200, 500]
+
+TAG_KEYS = ("stage", "model_type")
+
+
+class PipelineMetrics:
+    """Ray metrics of the SAM 2 pipeline stages."""
+
+    def __init__(self) -> None:
+        """Initialise a PipelineMetrics instance."""
+        self.__stage_seconds = Histogram(
+            "py_sam_stage_seconds",
+            description="Latency of a SAM 2 pipeline stage in seconds.",
+            boundaries=LATENCY_BOUNDARIES,
+            tag_keys=TAG_KEYS,
+        )
+        self.__failures = Counter(
+            "py_sam_failures",
+            description="Number of SAM 2 pipeline stage failures.",
+            tag_keys=TAG_KEYS,
+        )
+        self.__images = Counter(
+            "py_sam_images_processed",
+            description="Number of images that passed through mask generation.",
+            tag_keys=("model_type",),
+        )
+        self.__masks = Counter(
+            "py_sam_masks",
+            description="Number of masks generated.",
+            tag_keys=("model_type",),
+        )
+        self.__duplicates = Counter(
+            "py_sam_duplicates",
+            description="Number of near-duplicate images that reused the masks of another.",
+            tag_keys=("model_type",),
+        )
+        self.__masks_per_image = Histogram(
+            "py_sam_masks_per_image",
+            description="Number of masks generated per image.",
+            boundaries=MASK_COUNT_BOUNDARIES,
+            tag_keys=("model_type",),
+        )
+
+    def observe_stage(self, stage: str, seconds: float, model_type: str) -> None:
+        """Record the latency of a pipeline stage."""
+        self.__stage_seconds.observe(seconds, tags={"stage": stage, "model_type": model_type})
+
+    def record_failure(self, stage: str, model_type: str) -> None:
+        """Count a pipeline stage failure."""
+        self.__failures.inc(tags={"stage": stage, "model_type": model_type})
+
+    def record_image(self, mask_count: int, model_type: str) -> None:
+        """Count an image and its masks."""
+        tags = {"model_type": model_type}
+        self.__images.inc(tags=tags)
+        if mask_count:
+            self.__masks.inc(mask_count, tags=tags)
+        self.__masks_per_image.observe(mask_count, tags=tags)
+
+    def record_duplicate(self, model_type: str) -> None:
+        """Count a near-duplicate image."""
+        self.__duplicates.inc(tags={"model_type": model_type})
+
+
+@functools.cache
+def metrics() -> PipelineMetrics:
+    """Get the pipeline metrics of the current process.
+
+    Ray metrics are registered with the worker process that creates them, so they are built
+    on first use in each process (for example, in each Ray actor).
+
+    """
+    return PipelineMetrics()
+
+
+@contextlib.contextmanager
+def stage(name: str, model_type: str = "", **fields: Any) -> Iterator[None]:
+    """Time a pipeline stage.
+
+    The stage latency is recorded in the `py_sam_stage_seconds` histogram and logged as a
+    `stage` event. A stage that raises is counted in `py_sam_failures` instead, logged as a
+    `stage_failed` event and the exception re-raised.
+
+    Parameters:
+        name: The pipeline stage.
+        model_type: The pre-trained weight model type.
+        fields: Extra fields of the structured log event (for example, `image`).
+
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as err:
+        metrics().record_failure(name, model_type)
+        log.warning(
+            "stage_failed",
+            stage=name,
+            model_type=model_type,
+            seconds=time.perf_counter() - start,
+            error=repr(err),
+            **fields,
+        )
+        raise
+
+    seconds = time.perf_counter() - start
+    metrics().observe_stage(name, seconds, model_type)
+    log.info("stage", stage=name, model_type=model_type, seconds=seconds, **fields)
+
+
+def record_image(mask_count: int, model_type: str, **fields: Any) -> None:
+    """Count an image and its masks, and log an `image_processed` event.
+
+    Parameters:
+        mask_count: Number of masks generated for the image.
+        model_type: The pre-trained weight model type.
+        fields: Extra fields of the structured log event (for example, `image`).
+
+    """
+    metrics().record_image(mask_count, model_type)
+    log.info("image_processed", model_type=model_type, masks=mask_count, **fields)
+
+
+def record_duplicate(model_type: str, **fields: Any) -> None:
+    """Count a near-duplicate image that skipped mask generation, and log an event.
+
+    Parameters:
+        model_type: The pre-trained weight model type.
+        fields: Extra fields of the structured `image_duplicate` log event (for example,
+            `image` and `representative`).
+
+    """
+    metrics().record_duplicate(model_type)
+    log.info("image_duplicate", model_type=model_type, **fields)
@@ -1,3 +1,3 @@
 """Convenience importer at the `py_sam.model` level."""
 
-from .model import Model
+from .model import ChecksumError, Model
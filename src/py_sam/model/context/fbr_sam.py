@@ -1,13 +1,11 @@
 """Facebook Research context-based model lookup."""
 
-from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, StrEnum
 
 import py_sam.model.hiera
 
 
-@dataclass(frozen=True)
-class FbrSamEnum(str, Enum):
+class FbrSamEnum(StrEnum):
     """Facebook Research model enumerations custom to the model type."""
 
     HIERA_B = "hiera_b"
@@ -2,27 +2,39 @@
 
 from __future__ import annotations
 
+import hashlib
 import os
+import shutil
+import tempfile
+import time
 from abc import ABC, abstractmethod
+from collections.abc import Generator
 from pathlib import Path
-from typing import Generator
 
 import httpx
 import urllib3.exceptions
-from huggingface_hub import hf_hub_download
-from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_fixed
+from filelock import FileLock
+from huggingface_hub import HfApi, hf_hub_download
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
 
 from py_sam.logging_config import log
 
 
+class ChecksumError(Exception):
+    """Downloaded file does not match its published checksum."""
+
+
 class Model(ABC):
     """Abstraction of the Segment Anything Model 2 (SAM 2) model facility."""
 
     def __init__(self) -> None:
         """Initialise the `py_sam.model.Model` class."""
-        self.__target_basename: Path = Path(
-            os.environ.get("MODEL_CACHE", Path.home() / ".cache" / "blade" / "models")
-        )
+        self.__target_basename: Path = Path(os.environ.get("MODEL_CACHE", Path.home() / ".cache" / "blade" / "models"))
 
     @property
     @abstractmethod
@@ -54,42 +66,117 @@ class Model(ABC):
         """Getter for the model name attribute."""
         return self.target_basename / self.filename
 
+    @property
+    def quantized_checkpoint(self) -> Path:
+        """Getter for the dynamic INT8 quantized checkpoint cached next to `checkpoint`."""
+        return self.target_basename / f"{Path(self.filename).stem}.int8.pt"
+
+    @property
+    def mmap_checkpoint(self) -> Path:
+        """Getter for the memory mappable copy of `checkpoint` cached next to it."""
+        return self.target_basename / f"{Path(self.filename).stem}.mmap.pt"
+
+    def onnx_graph(self, graph: str) -> Path:
+        """ONNX graph path for the `graph` component, cached next to `checkpoint`.
+
+        Parameters:
+            graph: Graph component name (for example, `image_encoder`).
+
+        """
+        return self.target_basename / f"{Path(self.filename).stem}.{graph}.onnx"
+
+    @property
+    def download_lock(self) -> Path:
+        """Getter for the cross-process lock file of `checkpoint` downloads."""
+        return self.target_basename / f"{self.filename}.lock"
+
+    @staticmethod
+    def export_lock(path: Path) -> Path:
+        """Cross-process lock file of exports to `path`, a copy cached next to `checkpoint`.
+
+        Parameters:
+            path: The exported copy (for example, `mmap_checkpoint`).
+
+        """
+        return path.with_name(f"{path.name}.lock")
+
+    def sha256(self) -> str | None:
+        """SHA-256 checksum of the checkpoint published on the Hugging Face Hub.
+
+        Returns:
+            The hex digest, or `None` if the checkpoint is not stored with Git LFS.
+
+        """
+        (info,) = HfApi().get_paths_info(self.repo_id, [self.filename])
+        lfs = getattr(info, "lfs", None)
+
+        return lfs.sha256 if lfs is not None else None
+
     @retry(
         retry=(
             retry_if_exception_type(httpx.HTTPError)
             | retry_if_exception_type(urllib3.exceptions.HTTPError)
+            | retry_if_exception_type(ChecksumError)
         ),
         stop=stop_after_attempt(10),
-        wait=wait_fixed(60),
+        wait=wait_random_exponential(multiplier=2, max=60),
     )
     def download(self) -> None:
         """Download a SAM 2 model if not already cached locally.
 
-        Returns
-            Fully qualified name of target path on download success. `None` otherwise.
+        Concurrent downloads of the same checkpoint (for example, by every actor of a cold
+        node) are serialised by a file lock next to the checkpoint. The download goes to a
+        staging directory in the model cache and is verified against the published SHA-256
+        checksum before an atomic rename into place, so `checkpoint` is never seen partly
+        written. Waiting processes then find the checkpoint and skip the download.
 
         """
-        if self.checkpoint.exists() and self.checkpoint.is_file():
+        if self.checkpoint.is_file():
             log.info(f'Model "{self.checkpoint}" exists. Skipping download.')
             return
 
         self.target_basename.mkdir(parents=True, exist_ok=True)
 
-        log.info(
-            f"Downloading model {self.filename} from {self.repo_id} to {self.target_basename}"
-        )
-        hf_hub_download(
-            repo_id=self.repo_id, filename=self.filename, local_dir=self.target_basename
-        )
+        with FileLock(self.download_lock):
+            if self.checkpoint.is_file():
+                log.info(f'Model "{self.checkpoint}" downloaded by another process.')
+                return
 
-        if self.checkpoint.exists() and self.checkpoint.is_file():
-            log.info(f"Model cache location: {self.checkpoint}")
-        else:
-            log.error(f"Model download error. {self.checkpoint} does not exist.")
+            log.info(f"Downloading model {self.filename} from {self.repo_id} to {self.target_basename}")
+            start = time.perf_counter()
+            staging = tempfile.mkdtemp(prefix=f".{self.filename}.", dir=self.target_basename)
+            try:
+                path = hf_hub_download(repo_id=self.repo_id, filename=self.filename, local_dir=staging)
+                verify_checksum(Path(path), self.sha256())
+                os.replace(path, self.checkpoint)
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        log.info(f"Model cache location: {self.checkpoint} (downloaded in {time.perf_counter() - start:.2f}s)")
 
     @staticmethod
     def get_weights() -> Generator[Path, None, None]:
         """List the local cached SAM 2 weights."""
-        return Path(
-            os.environ.get("MODEL_CACHE", Path.home() / ".cache" / "blade" / "models")
-        ).glob("*.pt")
+        return Path(os.environ.get("MODEL_CACHE", Path.home() / ".cache" / "blade" / "models")).glob("*.pt")
+
+
+def verify_checksum(path: Path, sha256: str | None) -> None:
+    """Check the SHA-256 checksum of a downloaded file.
+
+    Parameters:
+        path: The downloaded file.
+        sha256: Expected hex digest. Verification is skipped if not set.
+
+    Raises:
+        ChecksumError: If the file does not match `sha256`.
+
+    """
+    if sha256 is None:
+        log.warning(f"No published checksum for {path.name}. Skipping verification.")
+        return
+
+    with open(path, "rb") as file:
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+    if digest != sha256:
+        msg = f"Checksum mismatch for {path.name}: expected {sha256}, got {digest}"
+        raise ChecksumError(msg)
@@ -0,0 +1,356 @@
+"""ONNX export of SAM 2 and an ONNX Runtime image predictor."""
+
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+from filelock import FileLock
+from hydra import compose  # type: ignore[import-untyped]
+from sam2.build_sam import build_sam2  # type: ignore[import-untyped]
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+
+import py_sam.model
+from py_sam.logging_config import log
+from py_sam.mask_generator import EmbeddingImagePredictor
+
+ENCODER = "image_encoder"
+DECODER = "mask_decoder"
+DECODER_SINGLE = "mask_decoder_single"
+
+GRAPHS = (ENCODER, DECODER, DECODER_SINGLE)
+
+OPSET_VERSION = 17
+
+# SAM 2 backbone feature map sizes for a 1024x1024 input, as per `SAM2ImagePredictor`.
+BACKBONE_FEATURE_SIZES = [(256, 256), (128, 128), (64, 64)]
+
+LOW_RES_MASK_SIZE = 256
+
+
+class ImageEncoderGraph(torch.nn.Module):
+    """SAM 2 image encoder as per `SAM2ImagePredictor.set_image_batch`, for ONNX export."""
+
+    def __init__(self, sam: SAM2Base) -> None:
+        """Initialise an ImageEncoderGraph instance."""
+        super().__init__()
+        self.sam = sam
+
+    def forward(self, image: torch.Tensor) -> tuple[torch.Tensor, ...]:
+        """Image embeddings and high resolution features of a normalised image batch."""
+        batch_size = image.shape[0]
+        backbone_out = self.sam.forward_image(image)
+        _, vision_feats, _, _ = self.sam._prepare_backbone_features(backbone_out)
+        if self.sam.directly_add_no_mem_embed:
+            vision_feats[-1] = vision_feats[-1] + self.sam.no_mem_embed
+
+        feats = [
+            feat.permute(1, 2, 0).reshape(batch_size, -1, *feat_size)
+            for feat, feat_size in zip(vision_feats[::-1], BACKBONE_FEATURE_SIZES[::-1], strict=True)
+        ][::-1]
+
+        return feats[-1], feats[0], feats[1]
+
+
+class MaskDecoderGraph(torch.nn.Module):
+    """SAM 2 prompt encoder and mask decoder as per `SAM2ImagePredictor._predict`.
+
+    The mask prompt is always an input. `has_mask_input` selects between its embedding and
+    the "no mask" embedding, so one graph serves both cases.
+
+    """
+
+    def __init__(self, sam: SAM2Base, multimask_output: bool) -> None:
+        """Initialise a MaskDecoderGraph instance."""
+        super().__init__()
+        self.sam = sam
+        self.multimask_output = multimask_output
+
+    def forward(  # noqa: PLR0913, PLR0917 - the graph inputs, in ONNX input order
+        self,
+        image_embed: torch.Tensor,
+        high_res_feats_0: torch.Tensor,
+        high_res_feats_1: torch.Tensor,
+        point_coords: torch.Tensor,
+        point_labels: torch.Tensor,
+        mask_input: torch.Tensor,
+        has_mask_input: torch.Tensor,
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """Low resolution mask logits and predicted IoUs for a batch of point prompts."""
+        prompt_encoder = self.sam.sam_prompt_encoder
+        sparse_embeddings, no_mask_embeddings = prompt_encoder(
+            points=(point_coords, point_labels), boxes=None, masks=None
+        )
+        dense_embeddings = (
+            has_mask_input * prompt_encoder._embed_masks(mask_input) + (1 - has_mask_input) * no_mask_embeddings
+        )
+
+        low_res_masks, iou_predictions, _, _ = self.sam.sam_mask_decoder(
+            image_embeddings=image_embed,
+            image_pe=prompt_encoder.get_dense_pe(),
+            sparse_prompt_embeddings=sparse_embeddings,
+            dense_prompt_embeddings=dense_embeddings,
+            multimask_output=self.multimask_output,
+            repeat_image=True,
+            high_res_features=[high_res_feats_0, high_res_feats_1],
+        )
+
+        return low_res_masks, iou_predictions
+
+
+def export(model: py_sam.model.Model, overwrite: bool = False) -> dict[str, Path]:
+    """Export the ONNX graphs of a pre-trained weight into the model cache.
+
+    Concurrent exports (for example, by every actor of a cold node) are serialised by a file
+    lock next to the graphs, and waiting processes then skip the export.
+
+    Parameters:
+        model: The pre-trained weight.
+        overwrite: Export even if the graphs already exist.
+
+    Returns:
+        The graph name to ONNX file path mapping.
+
+    """
+    paths = {graph: model.onnx_graph(graph) for graph in GRAPHS}
+    if not overwrite and all(path.is_file() for path in paths.values()):
+        log.info(f"ONNX graphs for {model.model_type} exist. Skipping export.")
+        return paths
+
+    model.download()
+
+    # One lock, next to the image encoder graph, covers all of the graphs.
+    with FileLock(model.export_lock(paths[ENCODER])):
+        if not overwrite and all(path.is_file() for path in paths.values()):
+            log.info(f"ONNX graphs for {model.model_type} exported by another process.")
+            return paths
+
+        start = time.perf_counter()
+        _export_graphs(model, paths)
+
+    log.info(
+        f"ONNX graphs for {model.model_type} exported to {model.target_basename} in {time.perf_counter() - start:.2f}s"
+    )
+
+    return paths
+
+
+def _export_graphs(model: py_sam.model.Model, paths: dict[str, Path]) -> None:
+    """Export the ONNX graphs of a downloaded pre-trained weight to `paths`."""
+    sam = build_sam2(model.model_cfg, model.checkpoint, device="cpu", apply_postprocessing=False)
+
+    image = torch.zeros(1, 3, sam.image_size, sam.image_size)
+    with torch.no_grad():
+        image_embed, high_res_0, high_res_1 = ImageEncoderGraph(sam)(image)
+    _export(
+        ImageEncoderGraph(sam),
+        (image,),
+        paths[ENCODER],
+        input_names=["image"],
+        output_names=["image_embed", "high_res_feats_0", "high_res_feats_1"],
+        dynamic_axes={
+            "image": {0: "batch"},
+            "image_embed": {0: "batch"},
+            "high_res_feats_0": {0: "batch"},
+            "high_res_feats_1": {0: "batch"},
+        },
+    )
+
+    prompts = (
+        torch.zeros(2, 1, 2),
+        torch.ones(2, 1, dtype=torch.int32),
+        torch.zeros(2, 1, LOW_RES_MASK_SIZE, LOW_RES_MASK_SIZE),
+        torch.zeros(1),
+    )
+    for graph, multimask_output in ((DECODER, True), (DECODER_SINGLE, False)):
+        _export(
+            MaskDecoderGraph(sam, multimask_output),
+            (image_embed, high_res_0, high_res_1, *prompts),
+            paths[graph],
+            input_names=[
+                "image_embed",
+                "high_res_feats_0",
+                "high_res_feats_1",
+                "point_coords",
+                "point_labels",
+                "mask_input",
+                "has_mask_input",
+            ],
+            output_names=["low_res_masks", "iou_predictions"],
+            dynamic_axes={
+                "point_coords": {0: "prompts", 1: "points"},
+                "point_labels": {0: "prompts", 1: "points"},
+                "mask_input": {0: "prompts"},
+                "low_res_masks": {0: "prompts"},
+                "iou_predictions": {0: "prompts"},
+            },
+        )
+
+
+def _export(module: torch.nn.Module, args: tuple, path: Path, **kwargs: Any) -> None:
+    """Export `module` to `path` through a temporary file and an atomic rename."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            args,
+            str(staging),
+            opset_version=OPSET_VERSION,
+            dynamo=False,
+            **kwargs,
+        )
+    os.replace(staging, path)
+    log.info(f"ONNX graph exported to {path}")
+
+
+def session(path: Path) -> Any:
+    """ONNX Runtime CPU inference session with all graph optimisations enabled."""
+    import onnxruntime  # type: ignore[import-untyped]  # noqa: PLC0415 - optional dependency
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if os.environ.get("PY_SAM__ORT_THREADS"):
+        options.intra_op_num_threads = int(os.environ["PY_SAM__ORT_THREADS"])
+
+    return onnxruntime.InferenceSession(str(path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class PredictorModel(torch.nn.Module):
+    """The SAM 2 model settings that `OnnxImagePredictor` reads: the input size and device.
+
+    The image encoder, prompt encoder and mask decoder all run in the ONNX graphs, so none of
+    their torch modules (or weights) are built.
+
+    """
+
+    def __init__(self, image_size: int) -> None:
+        """Initialise a PredictorModel instance.
+
+        Parameters:
+            image_size: The SAM 2 model input resolution.
+
+        """
+        super().__init__()
+        self.image_size = image_size
+
+    @property
+    def device(self) -> torch.device:
+        """ONNX Runtime CPU device getter."""
+        return torch.device("cpu")
+
+
+def build_predictor_model(model: py_sam.model.Model) -> PredictorModel:
+    """Read the settings of `OnnxImagePredictor` from a pre-trained weight configuration.
+
+    Parameters:
+        model: The pre-trained weight.
+
+    """
+    return PredictorModel(compose(config_name=model.model_cfg).model.image_size)
+
+
+class OnnxImagePredictor(EmbeddingImagePredictor):
+    """SAM 2 image predictor that runs the image encoder and mask decoder on ONNX Runtime.
+
+    Image transforms and mask post-processing are shared with `SAM2ImagePredictor`, so the
+    SAM 2 model passed in only needs its configuration (see `build_predictor_model`).
+
+    """
+
+    def __init__(self, sam_model: SAM2Base | PredictorModel, graphs: dict[str, Path], **kwargs: Any) -> None:
+        """Initialise an OnnxImagePredictor instance.
+
+        Parameters:
+            sam_model: SAM 2 model settings from `build_predictor_model` (or a SAM 2 model).
+            graphs: The graph name to ONNX file path mapping from `export`.
+
+        """
+        super().__init__(sam_model, **kwargs)
+        self.__sessions = {graph: session(path) for graph, path in graphs.items()}
+
+    def set_image(self, image: np.ndarray) -> None:  # type: ignore[override]
+        """Use the primed embeddings if they match `image`, otherwise run the ONNX encoder."""
+        if self.is_primed(image):
+            super().set_image(image)
+            return
+
+        self.set_image_batch([image])
+        self._is_batch = False
+
+    @torch.no_grad()
+    def set_image_batch(self, image_list: list[np.ndarray]) -> None:
+        """Compute the image embeddings of a batch of images on ONNX Runtime."""
+        self.reset_predictor()
+        self._orig_hw = [image.shape[:2] for image in image_list]
+        img_batch = self._transforms.forward_batch(image_list)
+
+        image_embed, high_res_0, high_res_1 = self.__sessions[ENCODER].run(None, {"image": img_batch.numpy()})
+        self._features = {
+            "image_embed": torch.from_numpy(image_embed),
+            "high_res_feats": [
+                torch.from_numpy(high_res_0),
+                torch.from_numpy(high_res_1),
+            ],
+        }
+        self._is_image_set = True
+        self._is_batch = True
+
+    @torch.no_grad()
+    def _predict(  # noqa: PLR0913, PLR0917 - as per `SAM2ImagePredictor._predict`
+        self,
+        point_coords: torch.Tensor | None,
+        point_labels: torch.Tensor | None,
+        boxes: torch.Tensor | None = None,
+        mask_input: torch.Tensor | None = None,
+        multimask_output: bool = True,
+        return_logits: bool = False,
+        img_idx: int = -1,
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Predict masks for transformed prompts on ONNX Runtime.
+
+        See `SAM2ImagePredictor._predict`. Box prompts are merged into the point prompts as
+        the SAM 2 predictor does.
+
+        """
+        if not self._is_image_set:
+            msg = "An image must be set with .set_image(...) before mask prediction."
+            raise RuntimeError(msg)
+
+        coords, labels = [], []
+        if boxes is not None:
+            coords.append(boxes.reshape(-1, 2, 2))
+            labels.append(torch.tensor([[2, 3]], dtype=torch.int32).repeat(boxes.shape[0], 1))
+        if point_coords is not None:
+            coords.append(point_coords)
+            labels.append(point_labels.to(torch.int32))  # type: ignore[union-attr]
+        prompts = torch.cat(coords, dim=1)
+
+        has_mask_input = mask_input is not None
+        if mask_input is None:
+            mask_input = torch.zeros(prompts.shape[0], 1, LOW_RES_MASK_SIZE, LOW_RES_MASK_SIZE)
+
+        features = self._features
+        graph = DECODER if multimask_output else DECODER_SINGLE
+        low_res_masks, iou_predictions = self.__sessions[graph].run(
+            None,
+            {
+                "image_embed": features["image_embed"][img_idx : img_idx + 1 or None].float().numpy(),
+                "high_res_feats_0": features["high_res_feats"][0][img_idx : img_idx + 1 or None].float().numpy(),
+                "high_res_feats_1": features["high_res_feats"][1][img_idx : img_idx + 1 or None].float().numpy(),
+                "point_coords": prompts.float().cpu().numpy(),
+                "point_labels": torch.cat(labels, dim=1).cpu().numpy(),
+                "mask_input": mask_input.float().cpu().numpy(),
+                "has_mask_input": np.array([float(has_mask_input)], dtype=np.float32),
+            },
+        )
+
+        low_res = torch.from_numpy(low_res_masks)
+        masks = self._transforms.postprocess_masks(low_res, self._orig_hw[img_idx])
+        low_res = torch.clamp(low_res, -32.0, 32.0)
+        if not return_logits:
+            masks = masks > self.mask_threshold
+
+        return masks, torch.from_numpy(iou_predictions), low_res
@@ -0,0 +1,410 @@
+"""Raw SAM 2 mask output encoders."""
+
+import io
+import json
+import posixpath
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pyarrow  # type: ignore[import-untyped]
+from PIL import Image, PngImagePlugin
+
+# Not exported by the public Ray API, which is pinned in pyproject.toml.
+from ray.data._internal.datasource.image_datasink import ImageDatasink
+from ray.data.datasource import RowBasedFileDatasink
+
+OVERLAY = "overlay"
+COCO_RLE = "coco_rle"
+NPZ = "npz"
+PARQUET = "parquet"
+
+OUTPUT_MODES = (OVERLAY, COCO_RLE, NPZ, PARQUET)
+
+FILE_EXTENSIONS = {COCO_RLE: ".json", NPZ: ".npz"}
+
+# COCO RLE strings hold each run length after the third as a delta of the run two before.
+RLE_DELTA_LAG = 2
+
+
+@dataclass(frozen=True)
+class OutputSettings:
+    """Output settings of a batch run.
+
+    Parameters:
+        path: Location to write the masks to.
+        flatten: Only use the source filename under `path` (ignore nested folders).
+        file_format: The image file format of overlays, `PNG` or `JPEG`.
+        incremental: Skip source images that are recorded in the manifest or that already
+            have an output file, and record the source images of each write in the
+            manifest.
+        manifest_path: Location of the incremental run manifest. Defaults to `_manifest`
+            under `path`.
+
+    """
+
+    path: str
+    flatten: bool = False
+    file_format: str = "PNG"
+    incremental: bool = False
+    manifest_path: str | None = None
+
+
+def rle_to_string(counts: list[int]) -> str:
+    """Compress uncompressed RLE counts into the COCO RLE string encoding.
+
+    This is a port of `pycocotools` `rleToString` so that `pycocotools` is not required.
+
+    Parameters:
+        counts: Uncompressed column-major RLE run lengths.
+
+    """
+    chars = []
+    for idx, count in enumerate(counts):
+        value = int(count)
+        if idx > RLE_DELTA_LAG:
+            value -= int(counts[idx - RLE_DELTA_LAG])
+        more = True
+        while more:
+            char = value & 0x1F
+            value >>= 5
+            more = value != -1 if char & 0x10 else value != 0
+            if more:
+                char |= 0x20
+            chars.append(chr(char + 48))
+
+    return "".join(chars)
+
+
+def mask_to_rle(mask: np.ndarray) -> dict[str, Any]:
+    """Encode a `HxW` boolean mask as an uncompressed column-major RLE.
+
+    Parameters:
+        mask: The binary mask.
+
+    """
+    height, width = mask.shape
+
+    return crop_to_rle(mask, 0, 0, height, width)
+
+
+def crop_to_rle(crop: np.ndarray, x0: int, y0: int, height: int, width: int) -> dict[str, Any]:
+    """Encode a mask crop as an uncompressed column-major RLE of the full image.
+
+    The full-size mask is never materialised, so memory scales with the crop size.
+
+    Parameters:
+        crop: The binary mask crop.
+        x0: Column offset of the crop in the full image.
+        y0: Row offset of the crop in the full image.
+        height: Full image height.
+        width: Full image width.
+
+    """
+    crop_height, crop_width = crop.shape
+    padded = np.zeros((crop_width, crop_height + 2), dtype=np.int8)
+    padded[:, 1:-1] = np.asarray(crop, dtype=bool).T
+    edges = np.diff(padded, axis=1)
+
+    # Column-major run boundaries in full image coordinates.
+    start_cols, start_rows = np.nonzero(edges == 1)
+    end_cols, end_rows = np.nonzero(edges == -1)
+    starts = (x0 + start_cols) * height + y0 + start_rows
+    ends = (x0 + end_cols) * height + y0 + end_rows
+
+    # Coalesce runs that continue from the bottom of one column into the next.
+    if len(starts):
+        keep = ends[:-1] != starts[1:]
+        starts = starts[np.concatenate(([True], keep))]
+        ends = ends[np.concatenate((keep, [True]))]
+
+    boundaries = np.empty(2 * len(starts) + 2, dtype=np.int64)
+    boundaries[0] = 0
+    boundaries[1:-1:2] = starts
+    boundaries[2:-1:2] = ends
+    boundaries[-1] = height * width
+    counts = np.diff(boundaries).tolist()
+    if len(counts) > 1 and counts[-1] == 0:
+        counts.pop()
+
+    return {"size": [height, width], "counts": counts}
+
+
+def rle_runs(rle: dict[str, Any]) -> tuple[np.ndarray, np.ndarray]:
+    """Foreground run start and end offsets of an uncompressed column-major RLE.
+
+    Parameters:
+        rle: Uncompressed RLE with `size` and `counts` keys.
+
+    """
+    boundaries = np.cumsum(np.asarray(rle["counts"], dtype=np.int64))
+    ends = boundaries[1::2]
+
+    return boundaries[0::2][: len(ends)], ends
+
+
+def rle_to_mask(rle: dict[str, Any]) -> np.ndarray:
+    """Decode an uncompressed column-major RLE into a `HxW` boolean mask.
+
+    Parameters:
+        rle: Uncompressed RLE with `size` and `counts` keys.
+
+    """
+    height, width = rle["size"]
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+
+    return np.repeat(values, counts).reshape(width, height).T
+
+
+def upscale_masks(
+    masks: list[dict[str, Any]], size: tuple[int, int], original_size: tuple[int, int]
+) -> list[dict[str, Any]]:
+    """Scale mask records generated from a downscaled image back to the source image size.
+
+    Segmentations are scaled with nearest neighbour sampling over the mask bounding box, so
+    memory scales with the mask extent rather than the source image size.
+
+    Parameters:
+        masks: Mask records with binary mask or uncompressed RLE segmentations.
+        size: Height and width of the image the masks were generated from.
+        original_size: Source image height and width.
+
+    Returns:
+        Mask records at `original_size` with uncompressed RLE segmentations.
+
+    """
+    height, width = size
+    original_height, original_width = original_size
+    scale_x, scale_y = original_width / width, original_height / height
+
+    upscaled = []
+    for mask in masks:
+        segmentation = mask["segmentation"]
+        if not isinstance(segmentation, np.ndarray):
+            segmentation = rle_to_mask(segmentation)
+
+        rows = np.flatnonzero(segmentation.any(axis=1))
+        cols = np.flatnonzero(segmentation.any(axis=0))
+        if not len(rows):
+            continue
+
+        # Source image rows and columns that sample the mask bounding box.
+        y0 = -(-int(rows[0]) * original_height // height)
+        y1 = -(-(int(rows[-1]) + 1) * original_height // height)
+        x0 = -(-int(cols[0]) * original_width // width)
+        x1 = -(-(int(cols[-1]) + 1) * original_width // width)
+        crop = segmentation[
+            np.ix_(
+                np.arange(y0, y1) * height // original_height,
+                np.arange(x0, x1) * width // original_width,
+            )
+        ]
+        upscaled.append({
+            **mask,
+            "segmentation": crop_to_rle(crop, x0, y0, original_height, original_width),
+            "area": int(crop.sum()),
+            "bbox": [float(x0), float(y0), float(x1 - x0 - 1), float(y1 - y0 - 1)],
+            "point_coords": [[x * scale_x, y * scale_y] for x, y in mask["point_coords"]],
+            "crop_box": [
+                value * scale
+                for value, scale in zip(mask["crop_box"], (scale_x, scale_y, scale_x, scale_y), strict=True)
+            ],
+        })
+
+    return upscaled
+
+
+def mask_bbox(mask: np.ndarray) -> list[float]:
+    """XYWH bounding box of a binary mask, as per the SAM 2 mask records.
+
+    Empty masks get an all zero box.
+
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return [0.0, 0.0, 0.0, 0.0]
+
+    return [
+        float(cols[0]),
+        float(rows[0]),
+        float(cols[-1] - cols[0]),
+        float(rows[-1] - rows[0]),
+    ]
+
+
+def mask_records(masks: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Per-mask records with the segmentation as a COCO compressed RLE.
+
+    Parameters:
+        masks: Mask records from the SAM 2 generator with `uncompressed_rle` segmentations.
+
+    """
+    return [
+        {
+            "mask_index": idx,
+            "segmentation": {
+                "size": [int(x) for x in mask["segmentation"]["size"]],
+                "counts": rle_to_string(mask["segmentation"]["counts"]),
+            },
+            "area": int(mask["area"]),
+            "bbox": [float(x) for x in mask["bbox"]],
+            "predicted_iou": float(mask["predicted_iou"]),
+            "stability_score": float(mask["stability_score"]),
+            "point_coords": [[float(x) for x in point] for point in mask["point_coords"]],
+            "crop_box": [float(x) for x in mask["crop_box"]],
+            **({"object_id": int(mask["object_id"])} if "object_id" in mask else {}),
+        }
+        for idx, mask in enumerate(masks)
+    ]
+
+
+def to_coco_json(
+    masks: list[dict[str, Any]],
+    image_name: str,
+    height: int,
+    width: int,
+    metadata: dict[str, Any] | None = None,
+) -> bytes:
+    """Encode the masks of one image as COCO-style compressed RLE JSON.
+
+    Parameters:
+        masks: Mask records from the SAM 2 generator with `uncompressed_rle` segmentations.
+        image_name: Source image reference.
+        height: Source image height.
+        width: Source image width.
+        metadata: Run metadata written to the COCO `info` section.
+
+    """
+    document: dict[str, Any] = {
+        "image": {"file_name": image_name, "height": height, "width": width},
+        "annotations": mask_records(masks),
+    }
+    if metadata is not None:
+        document["info"] = metadata
+
+    return json.dumps(document, separators=(",", ":")).encode()
+
+
+def to_npz(
+    masks: list[dict[str, Any]],
+    height: int,
+    width: int,
+    metadata: dict[str, Any] | None = None,
+) -> bytes:
+    """Encode the masks of one image as a compressed NPZ with bit-packed masks.
+
+    Unpack with `np.unpackbits(masks, axis=1, count=height * width)` and reshape to
+    `(-1, height, width)`. Video masks also carry their tracked `object_id`.
+
+    Parameters:
+        masks: Mask records from the SAM 2 generator with `uncompressed_rle` segmentations.
+        height: Source image height.
+        width: Source image width.
+        metadata: Run metadata written as a JSON string array named `metadata`.
+
+    """
+    stacked = np.zeros((len(masks), height * width), dtype=bool)
+    for idx, mask in enumerate(masks):
+        stacked[idx] = rle_to_mask(mask["segmentation"]).reshape(-1)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        masks=np.packbits(stacked, axis=1),
+        shape=np.array([height, width], dtype=np.int64),
+        area=np.array([mask["area"] for mask in masks], dtype=np.int64),
+        bbox=np.array([mask["bbox"] for mask in masks], dtype=np.float32).reshape(-1, 4),
+        predicted_iou=np.array([mask["predicted_iou"] for mask in masks], dtype=np.float32),
+        stability_score=np.array([mask["stability_score"] for mask in masks], dtype=np.float32),
+        metadata=np.array(json.dumps(metadata or {})),
+        **(
+            {"object_id": np.array([mask["object_id"] for mask in masks], np.int64)}
+            if masks and "object_id" in masks[0]
+            else {}
+        ),
+    )
+
+    return buffer.getvalue()
+
+
+def explode_records(row: dict[str, Any]) -> list[dict[str, Any]]:
+    """Flatten an image row into one row per mask record for Parquet output.
+
+    Parameters:
+        row: Ray row with `path` and `masks` (as per `mask_records`) columns.
+
+    """
+    return [{"path": row["path"], **record} for record in row["masks"]]
+
+
+class MaskDatasink(RowBasedFileDatasink):
+    """Ray datasink that writes the encoded masks of each row to its own file."""
+
+    def __init__(self, path: str, column: str = "masks", **file_datasink_kwargs: Any):
+        """Initialise a MaskDatasink instance."""
+        super().__init__(path, **file_datasink_kwargs)
+
+        self.column = column
+
+    def open_output_stream(self, path: str) -> pyarrow.NativeFile:
+        """Open the output file, creating any nested parent directories first."""
+        self.filesystem.create_dir(posixpath.dirname(path), recursive=True)
+
+        return super().open_output_stream(path)
+
+    def write_row_to_file(self, row: dict[str, Any], file: pyarrow.NativeFile) -> None:
+        """Write the encoded mask bytes of a row."""
+        file.write(row[self.column])
+
+
+class OverlayDatasink(ImageDatasink):
+    """Ray image datasink that scales overlays back to the source image size on write.
+
+    Rows with `original_height` and `original_width` columns (as decoded by
+    `py_sam.decode.decode_row`) are resized to that size. Other rows are written as is.
+    A `metadata` column is written to the PNG `py_sam` text chunk.
+
+    """
+
+    def write_row_to_file(self, row: dict[str, Any], file: pyarrow.NativeFile) -> None:
+        """Write the overlay image of a row at the source image size."""
+        width, height = row.get("original_width"), row.get("original_height")
+        original_size = None if width is None or height is None else (int(width), int(height))
+        file.write(
+            encode_overlay(
+                row[self.column], self.file_format, metadata=row.get("metadata"), original_size=original_size
+            )
+        )
+
+
+def encode_overlay(
+    overlay: np.ndarray,
+    file_format: str,
+    metadata: str | None = None,
+    original_size: tuple[int, int] | None = None,
+) -> bytes:
+    """Encode an overlay image as per `OverlayDatasink` on write.
+
+    Parameters:
+        overlay: The `HxWx3` overlay image.
+        file_format: The image file format (for example, `PNG` or `JPEG`).
+        metadata: Text for the PNG `py_sam` text chunk.
+        original_size: Source image width and height to scale the overlay to.
+
+    """
+    image = Image.fromarray(overlay)
+    if original_size is not None and image.size != original_size:
+        image = image.resize(original_size, Image.Resampling.BILINEAR)
+
+    save_kwargs = {}
+    if metadata is not None and file_format.upper() == "PNG":
+        pnginfo = PngImagePlugin.PngInfo()
+        pnginfo.add_text("py_sam", str(metadata))
+        save_kwargs["pnginfo"] = pnginfo
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=file_format, **save_kwargs)
+
+    return buffer.getvalue()
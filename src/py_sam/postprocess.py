@@ -0,0 +1,309 @@
+"""Tensor-native SAM 2 mask post-processing.
+
+The masks of an image stay stacked in one `(N, H, W)` boolean tensor, on the device they
+were predicted on, from the mask decoder through overlap suppression, small region
+filtering and area sorting. Python mask records are only built at the end.
+
+On CPU, the whole stack reductions (bit packing, areas, boxes and connected components)
+run on zero-copy NumPy views with NumPy and OpenCV, which are several times faster there
+than torch over boolean tensors.
+
+"""
+
+from typing import Any
+
+import cv2
+import numpy as np
+import torch
+from torch.nn import functional
+from torchvision.ops.boxes import batched_nms  # type: ignore[import-untyped]
+
+# Bit weights of the packed mask bytes, most significant bit first.
+BIT_WEIGHTS = (128, 64, 32, 16, 8, 4, 2, 1)
+
+# Masks labelled together by label propagation, which holds several `(N, H, W)` label
+# tensors at a time, so its memory does not grow with the number of masks.
+COMPONENT_CHUNK_MASKS = 16
+
+
+def pack_masks(masks: torch.Tensor) -> torch.Tensor:
+    """Pack `(N, H, W)` boolean masks into `(N, ceil(H * W / 8))` bytes, 8 pixels a byte."""
+    if masks.device.type == "cpu":
+        return torch.from_numpy(np.packbits(masks.flatten(1).numpy(), axis=1))
+
+    flat = masks.flatten(1).to(torch.uint8)
+    flat = functional.pad(flat, (0, -flat.shape[1] % 8))
+    weights = torch.tensor(BIT_WEIGHTS, dtype=torch.uint8, device=masks.device)
+
+    return (flat.view(flat.shape[0], -1, 8) * weights).sum(-1, dtype=torch.uint8)
+
+
+def unpack_masks(packed: torch.Tensor, height: int, width: int) -> torch.Tensor:
+    """Unpack the bytes of `pack_masks` into `(N, height, width)` boolean masks."""
+    if packed.device.type == "cpu":
+        bits = np.unpackbits(packed.numpy(), axis=1, count=height * width)
+        return torch.from_numpy(bits.view(bool).reshape(len(packed), height, width))
+
+    weights = torch.tensor(BIT_WEIGHTS, dtype=torch.uint8, device=packed.device)
+    bits = (packed.unsqueeze(-1) & weights) != 0
+
+    return bits.flatten(1)[:, : height * width].reshape(-1, height, width)
+
+
+def mask_areas(masks: torch.Tensor) -> torch.Tensor:
+    """Pixel count of each of a stack of `(N, H, W)` boolean masks."""
+    if masks.device.type == "cpu":
+        areas = np.count_nonzero(masks.flatten(1).numpy(), axis=1)
+        return torch.from_numpy(areas)
+
+    return masks.flatten(1).sum(1)
+
+
+def mask_boxes(masks: torch.Tensor) -> torch.Tensor:
+    """XYXY bounding boxes of a stack of `(N, H, W)` boolean masks, `0` if empty.
+
+    See `sam2.utils.amg.batched_mask_to_box`, which this matches from the row and column
+    projections of the masks.
+
+    """
+    if masks.device.type == "cpu":
+        rows = torch.from_numpy(masks.numpy().any(2))
+        cols = torch.from_numpy(masks.numpy().any(1))
+    else:
+        rows, cols = masks.any(2), masks.any(1)
+
+    height, width = rows.shape[1], cols.shape[1]
+    top = rows.to(torch.uint8).argmax(1)
+    bottom = height - 1 - rows.flip(1).to(torch.uint8).argmax(1)
+    left = cols.to(torch.uint8).argmax(1)
+    right = width - 1 - cols.flip(1).to(torch.uint8).argmax(1)
+    boxes = torch.stack([left, top, right, bottom], dim=1)
+
+    return torch.where(rows.any(1, keepdim=True), boxes, 0)
+
+
+def label_components(masks: torch.Tensor) -> torch.Tensor:
+    """Label the 8-connected components of a stack of masks with batched tensor operations.
+
+    Each foreground pixel takes the smallest flat pixel index of its component, found by
+    propagating the smallest label across neighbours with pointer jumping until nothing
+    changes. Background pixels are labelled `H * W`. Labels are `int32`.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+
+    """
+    count, height, width = masks.shape
+    background = height * width
+    index = torch.arange(background, dtype=torch.int32, device=masks.device)
+    labels = torch.where(masks, index.view(1, height, width), background)
+
+    while True:
+        padded = functional.pad(labels, (1, 1, 1, 1), value=background)
+        neighbours = labels
+        for dy in range(3):
+            for dx in range(3):
+                neighbours = torch.minimum(neighbours, padded[:, dy : dy + height, dx : dx + width])
+        flat = torch.where(masks, neighbours, background).view(count, -1)
+        jumped = flat.gather(1, flat.clamp(max=background - 1).long())
+        flat = torch.where(flat < background, torch.minimum(flat, jumped), flat)
+        updated = flat.view(count, height, width)
+        if torch.equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def component_areas(masks: torch.Tensor) -> torch.Tensor:
+    """Area of the 8-connected component of each foreground pixel, `0` for background.
+
+    Components are labelled `COMPONENT_CHUNK_MASKS` masks at a time. Areas are `int32`.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+
+    """
+    count, height, width = masks.shape
+    areas = torch.zeros(masks.shape, dtype=torch.int32, device=masks.device)
+    for start in range(0, count, COMPONENT_CHUNK_MASKS):
+        chunk = masks[start : start + COMPONENT_CHUNK_MASKS]
+        labels = label_components(chunk).flatten(1).long()
+        counts = torch.zeros((len(chunk), height * width + 1), dtype=torch.int32, device=masks.device).scatter_add_(
+            1, labels, chunk.flatten(1).to(torch.int32)
+        )
+        areas[start : start + COMPONENT_CHUNK_MASKS] = torch.where(chunk, counts.gather(1, labels).view(chunk.shape), 0)
+
+    return areas
+
+
+def small_components(
+    masks: torch.Tensor, min_area: int, keep_largest: bool = False
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Pixels of the 8-connected mask components with fewer than `min_area` pixels.
+
+    Components are labelled by OpenCV mask by mask on CPU, where it is much faster than
+    label propagation, and by `propagate_small_components` on other devices.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+        min_area: Smallest component area to keep, in pixels.
+        keep_largest: Leave out the largest component of the masks whose components are
+            all small, as per `sam2.utils.amg.remove_small_regions` islands.
+
+    Returns:
+        The small component pixels, and whether each mask has any.
+
+    """
+    if masks.device.type == "cpu":
+        small = np.zeros(masks.shape, dtype=bool)
+        found = np.zeros(len(masks), dtype=bool)
+        for idx, mask in enumerate(masks.numpy().view(np.uint8)):
+            _, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+            is_small = stats[:, cv2.CC_STAT_AREA] < min_area
+            is_small[0] = False
+            if keep_largest and len(stats) > 1 and is_small[1:].all():
+                is_small[1 + np.argmax(stats[1:, cv2.CC_STAT_AREA])] = False
+            if is_small.any():
+                small[idx] = is_small[labels]
+                found[idx] = True
+
+        return torch.from_numpy(small), torch.from_numpy(found)
+
+    return propagate_small_components(masks, min_area, keep_largest=keep_largest)
+
+
+def propagate_small_components(
+    masks: torch.Tensor, min_area: int, keep_largest: bool = False
+) -> tuple[torch.Tensor, torch.Tensor]:
+    """Pixels of the small mask components, as per `small_components`, by label propagation.
+
+    The stack is labelled `COMPONENT_CHUNK_MASKS` masks at a time. Of equally large
+    components, `keep_largest` leaves out the first in raster order, as OpenCV does.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+        min_area: Smallest component area to keep, in pixels.
+        keep_largest: Leave out the largest component of the masks whose components are
+            all small.
+
+    Returns:
+        The small component pixels, and whether each mask has any.
+
+    """
+    small = torch.empty_like(masks)
+    for start in range(0, len(masks), COMPONENT_CHUNK_MASKS):
+        chunk = masks[start : start + COMPONENT_CHUNK_MASKS]
+        areas = component_areas(chunk)
+        is_small = chunk & (areas < min_area)
+        all_small = chunk.flatten(1).any(1) & ~(chunk & ~is_small).flatten(1).any(1)
+        if keep_largest and all_small.any():
+            # The smallest label of the largest components is that of the first.
+            labels = label_components(chunk[all_small])
+            largest = areas[all_small] == areas[all_small].amax((1, 2), keepdim=True)
+            background = chunk.shape[1] * chunk.shape[2]
+            first = torch.where(largest, labels, background).amin((1, 2), keepdim=True)
+            is_small[all_small] &= labels != first
+        small[start : start + COMPONENT_CHUNK_MASKS] = is_small
+
+    return small, small.flatten(1).any(1)
+
+
+def remove_small_regions(masks: torch.Tensor, min_area: int) -> tuple[torch.Tensor, torch.Tensor]:
+    """Fill the holes and remove the islands of fewer than `min_area` pixels in each mask.
+
+    As per `sam2.utils.amg.remove_small_regions`, the largest island of a mask is kept if
+    every island is small.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+        min_area: Smallest hole or island area to keep, in pixels.
+
+    Returns:
+        The filtered masks, and whether each mask changed.
+
+    """
+    holes, has_holes = small_components(~masks, min_area)
+    filled = masks | holes
+    islands, has_islands = small_components(filled, min_area, keep_largest=True)
+
+    return filled & ~islands, has_holes | has_islands
+
+
+def postprocess(
+    masks: torch.Tensor,
+    min_area: int = 0,
+    nms_thresh: float = 0.7,
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Filter small regions, suppress overlaps and sort a stack of masks by area.
+
+    With `min_area` set, small holes and islands are removed from each mask and box NMS
+    runs again over the changed masks, preferring the masks that did not change (see
+    `SAM2AutomaticMaskGenerator.postprocess_small_regions`). Empty masks are dropped and
+    the others returned largest first.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+        min_area: Smallest hole and island area to keep, in pixels. No region filtering if
+            `0`.
+        nms_thresh: Box IoU above which the changed of two masks is suppressed.
+
+    Returns:
+        The indices of the kept masks into `masks`, and the kept masks with their areas and
+        XYXY boxes, in descending area order.
+
+    """
+    keep = torch.arange(len(masks), device=masks.device)
+    if min_area > 0 and len(masks):
+        masks, changed = remove_small_regions(masks, min_area)
+        boxes = mask_boxes(masks)
+        keep = batched_nms(
+            boxes.float(),
+            (~changed).float(),
+            torch.zeros_like(boxes[:, 0]),
+            iou_threshold=nms_thresh,
+        )
+        masks = masks[keep]
+
+    areas = mask_areas(masks)
+    large = torch.nonzero(areas).squeeze(1)
+    order = large[torch.argsort(areas[large], descending=True, stable=True)]
+    masks = masks[order]
+
+    return keep[order], masks, areas[order], mask_boxes(masks)
+
+
+def boxes_to_xywh(boxes: torch.Tensor) -> list[list[float]]:
+    """XYWH boxes, as per the SAM 2 mask records, from a stack of XYXY boxes."""
+    boxes = boxes.float().cpu()
+
+    return torch.cat([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], dim=1).tolist()
+
+
+def masks_to_rles(masks: torch.Tensor) -> list[dict[str, Any]]:
+    """Encode a stack of masks as uncompressed column-major RLEs in one pass.
+
+    See `sam2.utils.amg.mask_to_rle_pytorch`, which encodes the masks one at a time.
+
+    Parameters:
+        masks: The `(N, H, W)` boolean masks.
+
+    """
+    count, height, width = masks.shape
+    if not count:
+        return []
+
+    flat = masks.transpose(1, 2).flatten(1)
+    mask_idx, change_idx = (flat[:, 1:] != flat[:, :-1]).nonzero().cpu().numpy().T.astype(np.int64)
+    changes = np.bincount(mask_idx, minlength=count)
+    offsets = np.cumsum(changes)
+    run_ends = np.insert(change_idx + 1, offsets, height * width)
+    run_starts = np.insert(change_idx + 1, offsets - changes, 0)
+    runs = np.split(run_ends - run_starts, np.cumsum(changes + 1)[:-1])
+    starts_on = flat[:, 0].cpu().numpy()
+
+    return [
+        {
+            "size": [height, width],
+            "counts": ([0] if starts_on[idx] else []) + counts.tolist(),
+        }
+        for idx, counts in enumerate(runs)
+    ]
@@ -0,0 +1,240 @@
+"""Opt-in `torch.profiler` and `cProfile` traces of the first images through an actor."""
+
+import contextlib
+import cProfile
+import io
+import os
+import posixpath
+import pstats
+import re
+import socket
+import tempfile
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+import fsspec
+import ray
+import torch
+
+from py_sam.logging_config import log
+
+TORCH = "torch"
+CPROFILE = "cprofile"
+
+PROFILERS = (TORCH, CPROFILE)
+
+PROFILES_DIRNAME = "_profiles"
+
+DEFAULT_PROFILE_IMAGES = 1
+
+# Number of rows of the hot spot summary written alongside each trace.
+SUMMARY_ROWS = 30
+
+
+@dataclass(frozen=True)
+class ProfilerSettings:
+    """Actor profiler settings.
+
+    Parameters:
+        path: Location (local or `s3://`) of the profile traces.
+        profiler: `torch` for `torch.profiler`, or `cprofile`.
+        images: Number of images to profile in each actor.
+
+    """
+
+    path: str
+    profiler: str = TORCH
+    images: int = DEFAULT_PROFILE_IMAGES
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.profiler not in PROFILERS:
+            msg = f"Unsupported profiler: {self.profiler}"
+            raise ValueError(msg)
+
+    @classmethod
+    def from_environment(
+        cls,
+        profiler: str | None = None,
+        images: int | None = None,
+        path: str | None = None,
+        default_path: str | None = None,
+    ) -> "ProfilerSettings | None":
+        """Resolve the actor profiler settings, with unset values from the environment.
+
+        Falls back to the `PY_SAM__PROFILER`, `PY_SAM__PROFILE_IMAGES` and
+        `PY_SAM__PROFILE_PATH` environment variables. No profiling (`None`) if no profiler
+        is set.
+
+        Parameters:
+            profiler: `torch` or `cprofile`.
+            images: Number of images to profile in each actor. Defaults to 1.
+            path: Location (local or `s3://`) of the profile traces.
+            default_path: Location of the profile traces if no path is set.
+
+        """
+        profiler = profiler or os.environ.get("PY_SAM__PROFILER")
+        if profiler is None:
+            return None
+
+        path = path or os.environ.get("PY_SAM__PROFILE_PATH") or default_path
+        if path is None:
+            msg = "A profile path is required to write profile traces"
+            raise ValueError(msg)
+        if images is None:
+            images = int(os.environ.get("PY_SAM__PROFILE_IMAGES", str(DEFAULT_PROFILE_IMAGES)))
+
+        return cls(path, profiler=profiler, images=images)
+
+
+def actor_name() -> str:
+    """Trace name prefix of the current Ray actor, or host and process outside of an actor."""
+    actor_id = None
+    if ray.is_initialized():
+        actor_id = ray.get_runtime_context().get_actor_id()
+
+    return actor_id or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def trace_name(image_name: str) -> str:
+    """File name safe stem of the source image reference."""
+    stem = posixpath.splitext(posixpath.basename(image_name))[0]
+
+    return re.sub(r"[^\w.-]", "_", stem) or "image"
+
+
+class TraceProfiler:
+    """Profile the first images that pass through a SAM 2 actor.
+
+    Each profiled call writes a trace and a hot spot summary under `location`, named by the
+    actor and the source image:
+
+    - `torch`: Chrome trace (`.json`, open in `chrome://tracing` or Perfetto) and the
+      operator table sorted by self CPU time (`.txt`).
+    - `cprofile`: `pstats` dump (`.prof`, open with `snakeviz` or `pstats`) and the function
+      table sorted by cumulative time (`.txt`).
+
+    """
+
+    def __init__(
+        self,
+        location: str,
+        filesystem: fsspec.AbstractFileSystem,
+        profiler: str = TORCH,
+        max_images: int = DEFAULT_PROFILE_IMAGES,
+    ) -> None:
+        """Initialise a TraceProfiler instance.
+
+        Parameters:
+            location: Trace output location (local or `s3://`).
+            filesystem: The `fsspec` filesystem of `location`.
+            profiler: `torch` for `torch.profiler`, or `cprofile`.
+            max_images: Number of images to profile in this process.
+
+        """
+        if profiler not in PROFILERS:
+            msg = f"Unsupported profiler: {profiler}"
+            raise ValueError(msg)
+
+        self.__location = filesystem._strip_protocol(location).rstrip("/")
+        self.__filesystem = filesystem
+        self.__profiler = profiler
+        self.__max_images = max_images
+        self.__profiled = 0
+
+    @property
+    def location(self) -> str:
+        """Trace output location getter."""
+        return self.__location
+
+    @property
+    def filesystem(self) -> fsspec.AbstractFileSystem:
+        """Trace output filesystem getter."""
+        return self.__filesystem
+
+    @property
+    def profiler(self) -> str:
+        """Profiler getter."""
+        return self.__profiler
+
+    @property
+    def max_images(self) -> int:
+        """Number of images to profile getter."""
+        return self.__max_images
+
+    @property
+    def profiled(self) -> int:
+        """Number of images profiled so far getter."""
+        return self.__profiled
+
+    @contextlib.contextmanager
+    def profile(self, image_names: list[str]) -> Iterator[None]:
+        """Profile the enclosed block until `max_images` images have been profiled.
+
+        Parameters:
+            image_names: Source image references of the images processed in the block.
+
+        """
+        if self.profiled >= self.max_images:
+            yield
+            return
+
+        self.__profiled += len(image_names)
+        name = f"{actor_name()}-{trace_name(image_names[0])}"
+        if len(image_names) > 1:
+            name = f"{name}-batch{len(image_names)}"
+
+        if self.profiler == TORCH:
+            with self.__torch_profile(name):
+                yield
+        else:
+            with self.__cprofile(name):
+                yield
+
+    @contextlib.contextmanager
+    def __torch_profile(self, name: str) -> Iterator[None]:
+        """Run the enclosed block under `torch.profiler` and write its trace."""
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        with torch.profiler.profile(activities=activities, record_shapes=True, profile_memory=True) as profiler:
+            yield
+
+        with tempfile.TemporaryDirectory() as staging:
+            trace_path = os.path.join(staging, "trace.json")
+            profiler.export_chrome_trace(trace_path)
+            with open(trace_path, "rb") as trace:
+                self.write(f"{name}.json", trace.read())
+        self.write(
+            f"{name}.txt",
+            profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=SUMMARY_ROWS).encode(),
+        )
+
+    @contextlib.contextmanager
+    def __cprofile(self, name: str) -> Iterator[None]:
+        """Run the enclosed block under `cProfile` and write its statistics."""
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+
+        with tempfile.TemporaryDirectory() as staging:
+            stats_path = os.path.join(staging, "stats.prof")
+            profiler.dump_stats(stats_path)
+            with open(stats_path, "rb") as stats:
+                self.write(f"{name}.prof", stats.read())
+
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+        self.write(f"{name}.txt", summary.getvalue().encode())
+
+    def write(self, filename: str, data: bytes) -> None:
+        """Write one trace file under the trace output location."""
+        path = posixpath.join(self.location, filename)
+        self.filesystem.makedirs(self.location, exist_ok=True)
+        with self.filesystem.open(path, "wb") as file:
+            file.write(data)
+        log.info(f"Profile trace written to {path}")
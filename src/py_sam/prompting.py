@@ -0,0 +1,319 @@
+"""Prompted SAM 2 segmentation from cached image embeddings."""
+
+import collections
+import copy
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import torch
+from sam2.utils.amg import calculate_stability_score  # type: ignore[import-untyped]
+
+import py_sam.output
+from py_sam.logging_config import log
+from py_sam.mask_generator import EmbeddingImagePredictor
+
+DEFAULT_EMBEDDING_CACHE_BYTES = 1 << 30
+
+FOREGROUND = 1
+BACKGROUND = 0
+
+
+def image_key(image: np.ndarray) -> str:
+    """Identity of a decoded image, as the digest of its pixels, shape and type."""
+    digest = hashlib.sha256(np.ascontiguousarray(image).tobytes())
+    digest.update(f"{image.shape}{image.dtype}".encode())
+
+    return digest.hexdigest()
+
+
+def features_nbytes(features: dict) -> int:
+    """Memory held by the `image_embed` and `high_res_feats` tensors of an image."""
+    tensors = [features["image_embed"], *features["high_res_feats"]]
+
+    return sum(tensor.element_size() * tensor.nelement() for tensor in tensors)
+
+
+@dataclass(frozen=True)
+class Prompts:
+    """Point and box prompts of one image, in source image pixel coordinates.
+
+    Points default to foreground (`1`) labels. Background points are labelled `0`.
+
+    """
+
+    point_coords: tuple[tuple[float, float], ...] = ()
+    point_labels: tuple[int, ...] = ()
+    box: tuple[float, float, float, float] | None = None
+    multimask_output: bool = True
+
+    def __post_init__(self) -> None:
+        """Validate the prompts."""
+        if not self.point_labels:
+            object.__setattr__(self, "point_labels", (FOREGROUND,) * len(self.point_coords))
+        if not self.point_coords and self.box is None:
+            msg = "At least one point or a box prompt is required"
+            raise ValueError(msg)
+        if len(self.point_labels) != len(self.point_coords):
+            msg = "Each point prompt needs one label"
+            raise ValueError(msg)
+        if any(label not in (FOREGROUND, BACKGROUND) for label in self.point_labels):
+            msg = "Point labels are 1 (foreground) or 0 (background)"
+            raise ValueError(msg)
+
+    @classmethod
+    def from_document(cls, document: dict[str, Any]) -> "Prompts":
+        """Prompts from a JSON document with `points`, `labels`, `box` and `multimask`.
+
+        Parameters:
+            document: For example, `{"points": [[x, y]], "labels": [1]}` or
+                `{"box": [x0, y0, x1, y1]}`.
+
+        """
+        try:
+            points = tuple((float(x), float(y)) for x, y in document.get("points") or [])
+            labels = tuple(int(label) for label in document.get("labels") or [])
+            box = document.get("box")
+            if box is not None:
+                x0, y0, x1, y1 = (float(value) for value in box)
+                box = (x0, y0, x1, y1)
+        except (TypeError, ValueError) as err:
+            msg = f"Malformed prompts: {err}"
+            raise ValueError(msg) from err
+
+        return cls(
+            point_coords=points,
+            point_labels=labels,
+            box=box,
+            multimask_output=bool(document.get("multimask", True)),
+        )
+
+    def scale(self, factor_x: float, factor_y: float) -> "Prompts":
+        """Prompts with the coordinates scaled, for example onto a downscaled image."""
+        box = None
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            box = (x0 * factor_x, y0 * factor_y, x1 * factor_x, y1 * factor_y)
+
+        return Prompts(
+            point_coords=tuple((x * factor_x, y * factor_y) for x, y in self.point_coords),
+            point_labels=self.point_labels,
+            box=box,
+            multimask_output=self.multimask_output,
+        )
+
+
+class EmbeddingCache:
+    """In-memory least recently used cache of SAM 2 image embeddings.
+
+    Entries are keyed by image identity (see `image_key`). Least recently used entries are
+    evicted once the embeddings held grow beyond `max_bytes`. Embeddings stay on the device
+    they were computed on.
+
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_EMBEDDING_CACHE_BYTES) -> None:
+        """Initialise an EmbeddingCache instance.
+
+        Parameters:
+            max_bytes: Memory budget of the cached embeddings.
+
+        """
+        self.__max_bytes = max_bytes
+        self.__entries: collections.OrderedDict[str, tuple[dict, tuple[int, int], int]] = collections.OrderedDict()
+        self.__nbytes = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached embeddings."""
+        return len(self.__entries)
+
+    @property
+    def max_bytes(self) -> int:
+        """Memory budget getter."""
+        return self.__max_bytes
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the cached embeddings getter."""
+        return self.__nbytes
+
+    @property
+    def hits(self) -> int:
+        """Cache hit counter getter."""
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """Cache miss counter getter."""
+        return self.__misses
+
+    def get(self, key: str) -> tuple[dict, tuple[int, int]] | None:
+        """Return the cached embeddings and original image height and width for `key`."""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__hits += 1
+
+            return entry[0], entry[1]
+
+    def put(self, key: str, features: dict, orig_hw: tuple[int, int]) -> None:
+        """Cache the embeddings of an image, evicting the least recently used as needed.
+
+        Parameters:
+            key: The image identity.
+            features: Single image `image_embed` and `high_res_feats` features.
+            orig_hw: Height and width of the image the features were computed from.
+
+        """
+        nbytes = features_nbytes(features)
+        if nbytes > self.max_bytes:
+            log.warning(
+                f"Image embeddings of {nbytes} bytes exceed the embedding cache budget "
+                f"of {self.max_bytes} bytes. Not caching."
+            )
+            return
+
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.__nbytes -= previous[2]
+            self.__entries[key] = (features, orig_hw, nbytes)
+            self.__nbytes += nbytes
+
+            evicted = 0
+            while self.__nbytes > self.max_bytes:
+                _, (_, _, size) = self.__entries.popitem(last=False)
+                self.__nbytes -= size
+                evicted += 1
+
+        if evicted:
+            log.info(f"Embedding cache evicted {evicted} image(s) ({self.nbytes} of {self.max_bytes} bytes in use)")
+
+
+class PromptedPredictor:
+    """Answers point and box prompts from cached SAM 2 image embeddings.
+
+    The Hiera image encoder runs once per image. Later prompts against the same image only
+    run the mask decoder over the cached embeddings.
+
+    """
+
+    def __init__(
+        self,
+        predictor: EmbeddingImagePredictor,
+        cache: EmbeddingCache | None = None,
+        output_mode: str = "binary_mask",
+    ) -> None:
+        """Initialise a PromptedPredictor instance.
+
+        Parameters:
+            predictor: The image predictor, for example that of the automatic mask
+                generator. A shallow copy shares its model (and ONNX sessions), with its
+                own image state.
+            cache: The image embedding cache.
+            output_mode: Mask record segmentation format, `binary_mask` or
+                `uncompressed_rle`.
+
+        """
+        self.__predictor = copy.copy(predictor)
+        self.__predictor.reset_predictor()
+        self.__cache = cache if cache is not None else EmbeddingCache()
+        self.__output_mode = output_mode
+        self.__lock = threading.Lock()
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        """Image embedding cache getter."""
+        return self.__cache
+
+    @property
+    def output_mode(self) -> str:
+        """Mask record segmentation format getter."""
+        return self.__output_mode
+
+    def embed(self, image: np.ndarray) -> str:
+        """Set the predictor on `image`, running the image encoder on a cache miss only.
+
+        Parameters:
+            image: The image in HWC uint8 RGB format.
+
+        Returns:
+            The image identity.
+
+        """
+        key = image_key(image)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.__predictor.prime(*cached)
+            self.__predictor.set_image(image)
+            return key
+
+        self.__predictor.clear()
+        self.__predictor.set_image(image)
+        self.cache.put(key, self.__predictor._features, tuple(self.__predictor._orig_hw[0]))
+
+        return key
+
+    @torch.no_grad()
+    def predict(self, image: np.ndarray, prompts: Prompts) -> list[dict[str, Any]]:
+        """Generate the masks of the prompted object in `image`.
+
+        Parameters:
+            image: The image in HWC uint8 RGB format.
+            prompts: Point and box prompts in `image` pixel coordinates.
+
+        Returns:
+            Mask records in the `SAM2AutomaticMaskGenerator.generate` format, in
+            descending predicted IoU order.
+
+        """
+        with self.__lock:
+            try:
+                self.embed(image)
+                logits, iou_predictions, _ = self.__predictor.predict(
+                    point_coords=(np.array(prompts.point_coords) if prompts.point_coords else None),
+                    point_labels=(np.array(prompts.point_labels) if prompts.point_labels else None),
+                    box=np.array(prompts.box) if prompts.box is not None else None,
+                    multimask_output=prompts.multimask_output,
+                    return_logits=True,
+                )
+            finally:
+                self.__predictor.clear()
+
+        return self.mask_records(torch.from_numpy(logits), iou_predictions, prompts, image.shape[:2])
+
+    def mask_records(
+        self,
+        logits: torch.Tensor,
+        iou_predictions: np.ndarray,
+        prompts: Prompts,
+        size: tuple[int, int],
+    ) -> list[dict[str, Any]]:
+        """Mask records from the mask logits of a prompted prediction."""
+        mask_threshold = self.__predictor.mask_threshold
+        stability_scores = calculate_stability_score(logits, mask_threshold, 1.0)
+        height, width = size
+
+        records = []
+        for idx in np.argsort(-iou_predictions, kind="stable"):
+            mask = (logits[idx] > mask_threshold).numpy()
+            records.append({
+                "segmentation": (py_sam.output.mask_to_rle(mask) if self.output_mode == "uncompressed_rle" else mask),
+                "area": int(mask.sum()),
+                "bbox": py_sam.output.mask_bbox(mask),
+                "predicted_iou": float(iou_predictions[idx]),
+                "point_coords": [list(point) for point in prompts.point_coords],
+                "stability_score": float(stability_scores[idx]),
+                "crop_box": [0.0, 0.0, float(width), float(height)],
+            })
+
+        return records
@@ -0,0 +1,113 @@
+"""Dynamic INT8 quantization of SAM 2 for CPU inference."""
+
+import os
+import time
+from typing import Any
+
+import numpy as np
+import torch
+from filelock import FileLock
+from sam2.build_sam import build_sam2  # type: ignore[import-untyped]
+from sam2.modeling.sam2_base import SAM2Base  # type: ignore[import-untyped]
+
+import py_sam.model
+import py_sam.output
+from py_sam.logging_config import log
+
+# SAM 2 submodules whose `torch.nn.Linear` layers are quantized.
+QUANTIZED_MODULES = ("image_encoder", "sam_mask_decoder")
+
+
+def quantize(sam: SAM2Base) -> SAM2Base:
+    """Apply dynamic INT8 quantization to the linear layers of the Hiera backbone and mask decoder.
+
+    Weights are stored as INT8 and activations are quantized on the fly, so no calibration
+    data is needed. The model is quantized in place.
+
+    Parameters:
+        sam: The float SAM 2 model on CPU.
+
+    """
+    for name in QUANTIZED_MODULES:
+        setattr(
+            sam,
+            name,
+            torch.ao.quantization.quantize_dynamic(getattr(sam, name), {torch.nn.Linear}, dtype=torch.qint8),
+        )
+
+    return sam
+
+
+def build_quantized(model: py_sam.model.Model) -> SAM2Base:
+    """Build the dynamic INT8 quantized SAM 2 model for a pre-trained weight.
+
+    The quantized state is cached at `Model.quantized_checkpoint`. Later builds load the
+    cached state into a freshly quantized model without reading the float checkpoint.
+    Concurrent builds of an uncached state are serialised by a file lock next to it, so
+    the state is quantized once and the waiting processes load it from the cache.
+
+    Parameters:
+        model: The pre-trained weight.
+
+    """
+    start = time.perf_counter()
+    if not model.quantized_checkpoint.is_file():
+        model.download()
+        with FileLock(model.export_lock(model.quantized_checkpoint)):
+            if not model.quantized_checkpoint.is_file():
+                sam = quantize(build_sam2(model.model_cfg, model.checkpoint, device="cpu", apply_postprocessing=False))
+
+                staging = model.quantized_checkpoint.with_name(f"{model.quantized_checkpoint.name}.{os.getpid()}.tmp")
+                torch.save(sam.state_dict(), staging)
+                os.replace(staging, model.quantized_checkpoint)
+                log.info(
+                    f"Quantized model cached at {model.quantized_checkpoint} in {time.perf_counter() - start:.2f}s"
+                )
+                return sam
+
+    sam = quantize(build_sam2(model.model_cfg, None, device="cpu", apply_postprocessing=False))
+    sam.load_state_dict(torch.load(model.quantized_checkpoint, map_location="cpu", weights_only=True))
+    log.info(f"Quantized model {model.quantized_checkpoint} loaded in {time.perf_counter() - start:.2f}s")
+
+    return sam
+
+
+def mask_iou(mask_a: dict[str, Any], mask_b: dict[str, Any]) -> float:
+    """Intersection over union of two mask records.
+
+    Parameters:
+        mask_a: Mask record with a binary mask or uncompressed RLE segmentation.
+        mask_b: Mask record with a binary mask or uncompressed RLE segmentation.
+
+    """
+    segmentations = []
+    for mask in (mask_a, mask_b):
+        segmentation = mask["segmentation"]
+        if not isinstance(segmentation, np.ndarray):
+            segmentation = py_sam.output.rle_to_mask(segmentation)
+        segmentations.append(segmentation)
+
+    union = np.logical_or(*segmentations).sum()
+
+    return float(np.logical_and(*segmentations).sum() / union) if union else 1.0
+
+
+def mask_agreement(reference: list[dict[str, Any]], candidate: list[dict[str, Any]]) -> float:
+    """Agreement of candidate masks with reference masks.
+
+    Each reference mask is matched to its best overlapping candidate mask. The agreement is
+    the mean of those best IoUs, weighted by the reference mask area, so that missed or
+    degraded large objects weigh most.
+
+    Parameters:
+        reference: Mask records from the float model.
+        candidate: Mask records from the quantized model.
+
+    """
+    if not reference:
+        return 1.0 if not candidate else 0.0
+
+    best = np.array([max((mask_iou(ref, cand) for cand in candidate), default=0.0) for ref in reference])
+    areas = np.array([ref["area"] for ref in reference], dtype=np.float64)
+
+    return float((best * areas).sum() / areas.sum())
@@ -0,0 +1,351 @@
+"""Long-running SAM 2 segmentation service on Ray Serve with dynamic request batching."""
+
+import asyncio
+import dataclasses
+import json
+import os
+import posixpath
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+import numpy as np
+from ray import serve
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+
+import py_sam.decode
+import py_sam.model.hiera
+import py_sam.output
+from py_sam.fbr_sam import FbrSam, FbrSamSettings
+from py_sam.logging_config import log
+from py_sam.prompting import Prompts
+
+APP_NAME = "py-sam"
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_BATCH_WAIT_TIMEOUT_S = 0.01
+
+# Raw output modes a request can ask for, with their response media types.
+MEDIA_TYPES = {
+    py_sam.output.COCO_RLE: "application/json",
+    py_sam.output.NPZ: "application/octet-stream",
+}
+
+
+class RequestError(ValueError):
+    """Malformed segmentation request."""
+
+
+@dataclass(frozen=True)
+class ServiceSettings:
+    """Deployment, batching and request settings of the segmentation service.
+
+    Parameters:
+        host: HTTP listen address.
+        port: HTTP listen port.
+        num_replicas: Number of warm SAM 2 replicas.
+        num_cpus: CPUs reserved for each replica.
+        num_gpus: GPUs reserved for each replica.
+        max_batch_size: Maximum number of requests in each batch.
+        batch_wait_timeout_s: Longest wait for a batch to fill.
+        max_side: Decode the source images with the longer side capped at `max_side`.
+        uri_root: Directory (or `s3://` prefix) that JSON requests may read images from.
+            Only uploads are accepted if not set.
+
+    """
+
+    host: str = DEFAULT_HOST
+    port: int = DEFAULT_PORT
+    num_replicas: int = 1
+    num_cpus: float | None = None
+    num_gpus: float | None = None
+    max_batch_size: int = DEFAULT_MAX_BATCH_SIZE
+    batch_wait_timeout_s: float = DEFAULT_BATCH_WAIT_TIMEOUT_S
+    max_side: int | None = None
+    uri_root: str | None = None
+
+
+def is_json(content_type: str) -> bool:
+    """Whether the request `Content-Type` header is JSON."""
+    return content_type.split(";", maxsplit=1)[0].strip() == "application/json"
+
+
+def read_request_prompts(body: bytes, content_type: str, query: str | None = None) -> Prompts | None:
+    """Point and box prompts of a segmentation request, if any.
+
+    JSON requests carry the prompts next to the image `uri`. Uploads carry them as a JSON
+    document in the `prompts` query parameter. See `py_sam.prompting.Prompts.from_document`.
+
+    Parameters:
+        body: The request body.
+        content_type: The request `Content-Type` header.
+        query: The `prompts` query parameter.
+
+    """
+    try:
+        if is_json(content_type):
+            document = json.loads(body)
+        elif query:
+            document = json.loads(query)
+        else:
+            return None
+    except ValueError as err:
+        msg = f"Malformed JSON: {err}"
+        raise RequestError(msg) from err
+
+    if not isinstance(document, dict):
+        msg = "Prompts must be a JSON object"
+        raise RequestError(msg)
+    if "points" not in document and "box" not in document:
+        return None
+
+    try:
+        return Prompts.from_document(document)
+    except ValueError as err:
+        raise RequestError(str(err)) from err
+
+
+def uri_within(uri: str, root: str) -> bool:
+    """Whether `uri` names an object under the `root` directory (or `s3://` prefix).
+
+    Local paths are resolved, symbolic links and `..` included, before they are compared.
+
+    """
+    uri_parsed, root_parsed = urlparse(uri), urlparse(root)
+    if uri_parsed.scheme in ("", "file") and root_parsed.scheme in ("", "file"):
+        path = os.path.realpath(uri_parsed.path if uri_parsed.scheme else uri)
+        base = os.path.realpath(root_parsed.path if root_parsed.scheme else root)
+
+        return os.path.commonpath([path, base]) == base
+
+    if (uri_parsed.scheme, uri_parsed.netloc) != (
+        root_parsed.scheme,
+        root_parsed.netloc,
+    ):
+        return False
+    key = posixpath.normpath(f"/{uri_parsed.path.lstrip('/')}")
+    prefix = posixpath.normpath(f"/{root_parsed.path.lstrip('/')}")
+
+    return key.startswith(prefix.rstrip("/") + "/")
+
+
+def read_request_image(
+    body: bytes,
+    content_type: str,
+    name: str | None = None,
+    max_side: int | None = None,
+    uri_root: str | None = None,
+) -> tuple[str, np.ndarray, tuple[int, int]]:
+    """Decode the source image of a segmentation request.
+
+    The request body is either the encoded image itself (uploads), or a JSON document with
+    the `uri` of the image (local or `s3://`). Image URIs are only read under `uri_root`,
+    and a missing image is not told apart from an undecodable one.
+
+    Parameters:
+        body: The request body.
+        content_type: The request `Content-Type` header.
+        name: Source image reference of an upload. Defaults to `image`.
+        max_side: Decode the image with the longer side capped at `max_side`.
+        uri_root: Directory (or `s3://` prefix) that JSON requests may read images from.
+            JSON requests are rejected if not set.
+
+    Returns:
+        The source image reference, the RGB image and the source image height and width.
+
+    """
+    if is_json(content_type):
+        try:
+            uri = json.loads(body)["uri"]
+        except (ValueError, KeyError, TypeError) as err:
+            msg = 'JSON requests need an image "uri"'
+            raise RequestError(msg) from err
+        if uri_root is None:
+            msg = "Image uri requests are not enabled, upload the image"
+            raise RequestError(msg)
+        if not isinstance(uri, str) or not uri_within(uri, uri_root):
+            msg = f"Image uri is outside the service root: {uri}"
+            raise RequestError(msg)
+        try:
+            filesystem = FbrSam.filesystem(uri)
+            body = filesystem.cat_file(filesystem._strip_protocol(uri))
+            image, height, width = py_sam.decode.decode_image(body, max_side)
+        except (OSError, ValueError) as err:
+            msg = f"Unable to read the image: {uri}"
+            raise RequestError(msg) from err
+
+        return uri, image, (height, width)
+
+    if not body:
+        msg = "Empty image upload"
+        raise RequestError(msg)
+
+    try:
+        image, height, width = py_sam.decode.decode_image(body, max_side)
+    except (OSError, ValueError) as err:
+        msg = f"Unable to decode the image: {err}"
+        raise RequestError(msg) from err
+
+    return name or "image", image, (height, width)
+
+
+@serve.deployment
+class SegmentationService:
+    """Warm SAM 2 replica that generates the masks of concurrent requests in batches.
+
+    Requests that arrive within `batch_wait_timeout_s` of each other go through the image
+    encoder together, up to `max_batch_size` at a time (see `FbrSam.generate_batch_masks`).
+
+    Requests with point or box prompts skip the batches. Their image embeddings are cached,
+    so repeated prompts against an image only run the mask decoder (see
+    `FbrSam.predict_prompts`).
+
+    """
+
+    def __init__(
+        self,
+        model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        settings: FbrSamSettings | None = None,
+        service: ServiceSettings | None = None,
+    ) -> None:
+        """Initialise a SegmentationService replica.
+
+        Parameters:
+            model: The pre-trained weight to use for the compute.
+            settings: `FbrSam` settings. The output mode is the response format, `coco_rle`
+                (JSON) or `npz`. Defaults to `coco_rle` with the default settings.
+            service: Batching and request settings. Defaults to `ServiceSettings()`.
+
+        """
+        service = service or ServiceSettings()
+        settings = dataclasses.replace(
+            settings or FbrSamSettings(output_mode=py_sam.output.COCO_RLE), batch_size=service.max_batch_size
+        )
+        if settings.output_mode not in MEDIA_TYPES:
+            msg = f"Unsupported service output mode: {settings.output_mode}"
+            raise ValueError(msg)
+
+        self.__fbr_sam = FbrSam(model=model, settings=settings, preload=True)
+        self.__service = service
+        self.segment.set_max_batch_size(service.max_batch_size)
+        self.segment.set_batch_wait_timeout_s(service.batch_wait_timeout_s)
+        log.info(
+            f"Segmentation service replica ready - batch size: {service.max_batch_size} | "
+            f"batch wait: {service.batch_wait_timeout_s}s"
+        )
+
+    @property
+    def fbr_sam(self) -> FbrSam:
+        """Warm SAM 2 model getter."""
+        return self.__fbr_sam
+
+    @property
+    def service(self) -> ServiceSettings:
+        """Service settings getter."""
+        return self.__service
+
+    @serve.batch(
+        max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=DEFAULT_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def segment(self, requests: list[tuple[str, np.ndarray, tuple[int, int]]]) -> list[bytes]:
+        """Generate the masks of a batch of decoded request images.
+
+        Parameters:
+            requests: The source image reference, RGB image and source image size of each
+                request.
+
+        """
+        names, images, original_sizes = (list(values) for values in zip(*requests, strict=True))
+        log.info(f"Segmenting a batch of {len(requests)} request(s)")
+
+        return await asyncio.to_thread(
+            self.fbr_sam.generate_batch_masks,
+            images=images,
+            image_names=names,
+            original_sizes=original_sizes,
+        )
+
+    async def __call__(self, request: Request) -> Response:
+        """Segment the uploaded image, or the image at the JSON `uri`."""
+        body = await request.body()
+        content_type = request.headers.get("content-type", "")
+        try:
+            prompts = read_request_prompts(body, content_type, request.query_params.get("prompts"))
+            decoded = await asyncio.to_thread(
+                read_request_image,
+                body,
+                content_type,
+                request.query_params.get("name"),
+                self.service.max_side,
+                self.service.uri_root,
+            )
+        except RequestError as err:
+            return JSONResponse({"error": str(err)}, status_code=400)
+
+        if prompts is None:
+            masks = await self.segment(decoded)
+        else:
+            name, image, original_size = decoded
+            masks = await asyncio.to_thread(self.fbr_sam.predict_prompts, image, name, prompts, original_size)
+        headers = {}
+        if self.fbr_sam.output_mode == py_sam.output.NPZ:
+            stem = posixpath.splitext(posixpath.basename(urlparse(decoded[0]).path))[0]
+            headers["Content-Disposition"] = f'attachment; filename="{stem}_masks.npz"'
+
+        return Response(
+            masks,
+            media_type=MEDIA_TYPES[self.fbr_sam.output_mode],
+            headers=headers,
+        )
+
+
+def build_app(
+    model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+    settings: FbrSamSettings | None = None,
+    service: ServiceSettings | None = None,
+) -> serve.Application:
+    """Build the segmentation service application.
+
+    Parameters:
+        model: The pre-trained weight to use for the compute.
+        settings: `FbrSam` settings of each replica. See `SegmentationService`.
+        service: Deployment, batching and request settings. Defaults to
+            `ServiceSettings()`.
+
+    """
+    service = service or ServiceSettings()
+    ray_actor_options: dict[str, float] = {}
+    if service.num_cpus is not None:
+        ray_actor_options["num_cpus"] = service.num_cpus
+    if service.num_gpus is not None:
+        ray_actor_options["num_gpus"] = service.num_gpus
+
+    return SegmentationService.options(  # type: ignore[attr-defined]
+        num_replicas=service.num_replicas,
+        # Let enough requests through to each replica to fill a batch while one runs.
+        max_ongoing_requests=2 * service.max_batch_size,
+        ray_actor_options=ray_actor_options,
+    ).bind(model=model, settings=settings, service=service)
+
+
+def run(
+    model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+    settings: FbrSamSettings | None = None,
+    service: ServiceSettings | None = None,
+) -> None:
+    """Serve the segmentation service until interrupted.
+
+    Parameters:
+        model: The pre-trained weight to use for the compute.
+        settings: `FbrSam` settings of each replica. See `SegmentationService`.
+        service: Deployment, batching and request settings. Defaults to
+            `ServiceSettings()`.
+
+    """
+    service = service or ServiceSettings()
+    serve.start(http_options={"host": service.host, "port": service.port})
+    log.info(f"Segmentation service listening on http://{service.host}:{service.port}/")
+    serve.run(build_app(model, settings, service), name=APP_NAME, route_prefix="/", blocking=True)
@@ -0,0 +1,163 @@
+"""Tuned, per worker process S3 filesystems."""
+
+import functools
+import os
+from dataclasses import dataclass
+from typing import Any
+
+from s3fs import S3FileSystem  # type: ignore[import-untyped]
+
+from py_sam.logging_config import log
+
+MIB = 2**20
+
+# S3 multipart upload parts (other than the last) must be at least 5 MiB.
+MIN_MULTIPART_THRESHOLD = 5 * MIB
+
+DEFAULT_MAX_POOL_CONNECTIONS = 32
+DEFAULT_READ_BLOCK_SIZE = 8 * MIB
+DEFAULT_MULTIPART_THRESHOLD = 16 * MIB
+DEFAULT_MAX_CONCURRENCY = 10
+DEFAULT_RETRY_MAX_ATTEMPTS = 5
+DEFAULT_RETRY_MODE = "standard"
+
+RETRY_MODES = ("legacy", "standard", "adaptive")
+
+
+@dataclass(frozen=True)
+class S3Settings:
+    """S3 connection and transfer settings.
+
+    Parameters:
+        key: Access key ID.
+        secret: Secret access key.
+        endpoint_url: S3 API endpoint, for example a MinIO server.
+        verify: Verify the endpoint SSL certificate.
+        max_pool_connections: Size of the HTTP connection pool.
+        read_block_size: Read-ahead block size of objects opened for reading. Objects no
+            larger than this are fetched in a single request.
+        multipart_threshold: Objects opened for writing are uploaded in a single request up
+            to this size, then in multipart parts of this size.
+        max_concurrency: Number of concurrent part transfers of multipart uploads and
+            downloads.
+        retry_max_attempts: Total number of attempts of each request.
+        retry_mode: botocore retry mode (`legacy`, `standard` or `adaptive`).
+
+    """
+
+    key: str | None = None
+    secret: str | None = None
+    endpoint_url: str | None = None
+    verify: bool = True
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS
+    read_block_size: int = DEFAULT_READ_BLOCK_SIZE
+    multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    retry_max_attempts: int = DEFAULT_RETRY_MAX_ATTEMPTS
+    retry_mode: str = DEFAULT_RETRY_MODE
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.multipart_threshold < MIN_MULTIPART_THRESHOLD:
+            msg = f"S3 multipart threshold must be at least {MIN_MULTIPART_THRESHOLD} bytes"
+            raise ValueError(msg)
+        if self.retry_mode not in RETRY_MODES:
+            msg = f"Unsupported S3 retry mode: {self.retry_mode}"
+            raise ValueError(msg)
+        if min(self.max_pool_connections, self.max_concurrency) < 1:
+            msg = "S3 connection pool and concurrency must be at least 1"
+            raise ValueError(msg)
+
+    @classmethod
+    def from_environment(cls) -> "S3Settings":
+        """S3 settings from the environment.
+
+        Credentials and endpoint come from `AWS_ACCESS_KEY_ID`, `AWS_SECRET_ACCESS_KEY`,
+        `MINIO_URL` and `MINIO_SSL_VERIFY`. Transfer settings come from
+        `PY_SAM__S3_MAX_POOL_CONNECTIONS`, `PY_SAM__S3_READ_BLOCK_SIZE`,
+        `PY_SAM__S3_MULTIPART_THRESHOLD`, `PY_SAM__S3_MAX_CONCURRENCY`,
+        `PY_SAM__S3_RETRY_MAX_ATTEMPTS` and `PY_SAM__S3_RETRY_MODE`.
+
+        """
+        return cls(
+            key=os.environ.get("AWS_ACCESS_KEY_ID"),
+            secret=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+            endpoint_url=os.environ.get("MINIO_URL"),
+            verify=os.environ.get("MINIO_SSL_VERIFY", "true") == "true",
+            max_pool_connections=_integer("PY_SAM__S3_MAX_POOL_CONNECTIONS", DEFAULT_MAX_POOL_CONNECTIONS),
+            read_block_size=_integer("PY_SAM__S3_READ_BLOCK_SIZE", DEFAULT_READ_BLOCK_SIZE),
+            multipart_threshold=_integer("PY_SAM__S3_MULTIPART_THRESHOLD", DEFAULT_MULTIPART_THRESHOLD),
+            max_concurrency=_integer("PY_SAM__S3_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY),
+            retry_max_attempts=_integer("PY_SAM__S3_RETRY_MAX_ATTEMPTS", DEFAULT_RETRY_MAX_ATTEMPTS),
+            retry_mode=os.environ.get("PY_SAM__S3_RETRY_MODE") or DEFAULT_RETRY_MODE,
+        )
+
+
+class TunedS3FileSystem(S3FileSystem):
+    """`S3FileSystem` with separate read-ahead and multipart upload block sizes.
+
+    `S3FileSystem` applies a single `default_block_size` to both reads and writes.
+
+    """
+
+    def __init__(self, *args: Any, multipart_threshold: int | None = None, **kwargs: Any) -> None:
+        """Initialise a TunedS3FileSystem instance.
+
+        Parameters:
+            multipart_threshold: Block size of objects opened for writing. Defaults to the
+                `default_block_size`.
+
+        """
+        super().__init__(*args, **kwargs)
+        self.multipart_threshold = multipart_threshold or self.default_block_size
+
+    def _open(self, path: str, mode: str = "rb", block_size: int | None = None, **kwargs: Any) -> Any:
+        """Open an object with the read or write block size of `mode`."""
+        if block_size is None and "r" not in mode:
+            block_size = self.multipart_threshold
+
+        return super()._open(path, mode=mode, block_size=block_size, **kwargs)
+
+
+@functools.cache
+def s3_filesystem(settings: S3Settings) -> TunedS3FileSystem:
+    """S3 filesystem of `settings`, built once per worker process.
+
+    The filesystem (and its connection pool) is shared by every task and actor call of the
+    process.
+
+    Parameters:
+        settings: S3 connection and transfer settings.
+
+    """
+    log.info(
+        f"S3 filesystem - pool: {settings.max_pool_connections} | "
+        f"read block: {settings.read_block_size} | "
+        f"multipart threshold: {settings.multipart_threshold} | "
+        f"concurrency: {settings.max_concurrency} | "
+        f"retries: {settings.retry_max_attempts} ({settings.retry_mode})"
+    )
+
+    return TunedS3FileSystem(
+        key=settings.key,
+        secret=settings.secret,
+        client_kwargs={
+            "endpoint_url": settings.endpoint_url,
+            "verify": settings.verify,
+        },
+        config_kwargs={
+            "max_pool_connections": settings.max_pool_connections,
+            "retries": {
+                "max_attempts": settings.retry_max_attempts,
+                "mode": settings.retry_mode,
+            },
+        },
+        default_block_size=settings.read_block_size,
+        multipart_threshold=settings.multipart_threshold,
+        max_concurrency=settings.max_concurrency,
+    )
+
+
+def _integer(name: str, default: int) -> int:
+    """Integer value of the `name` environment variable, or `default` if not set."""
+    return int(os.environ.get(name) or default)
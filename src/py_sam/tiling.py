@@ -0,0 +1,381 @@
+"""Tiled SAM 2 automatic mask generation for very large images."""
+
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+import py_sam.output
+from py_sam.logging_config import log
+from py_sam.mask_generator import BatchedMaskGenerator
+
+DEFAULT_TILE_OVERLAP = 128
+
+DEFAULT_MERGE_THRESH = 0.5
+
+
+@dataclass(frozen=True)
+class TileSettings:
+    """Tiled mask generation settings.
+
+    Parameters:
+        size: Tile side length.
+        overlap: Number of pixels shared by neighbouring tiles.
+        batch_size: Number of tiles to run through the image encoder together.
+        merge_thresh: See `stitch`.
+
+    """
+
+    size: int
+    overlap: int = DEFAULT_TILE_OVERLAP
+    batch_size: int = 1
+    merge_thresh: float = DEFAULT_MERGE_THRESH
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.overlap >= self.size:
+            msg = f"Tile overlap {self.overlap} must be less than tile size {self.size}"
+            raise ValueError(msg)
+        if self.batch_size < 1:
+            msg = f"Tile batch size must be at least 1: {self.batch_size}"
+            raise ValueError(msg)
+
+
+def tile_boxes(height: int, width: int, tile_size: int, overlap: int) -> list[tuple[int, int, int, int]]:
+    """Overlapping tile boxes that cover an image.
+
+    Parameters:
+        height: Image height.
+        width: Image width.
+        tile_size: Tile side length.
+        overlap: Number of pixels shared by neighbouring tiles.
+
+    Returns:
+        The `(x0, y0, x1, y1)` tile boxes (exclusive end).
+
+    """
+    if overlap >= tile_size:
+        msg = f"Tile overlap {overlap} must be less than tile size {tile_size}"
+        raise ValueError(msg)
+
+    def starts(length: int) -> list[int]:
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        offsets = list(range(0, length - tile_size, stride))
+
+        return [*offsets, length - tile_size]
+
+    return [
+        (x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+        for y0 in starts(height)
+        for x0 in starts(width)
+    ]
+
+
+class TileMask:
+    """A mask found in one tile, held as a crop of its bounding box in image coordinates."""
+
+    def __init__(
+        self,
+        crop: np.ndarray,
+        box: tuple[int, int, int, int],
+        tile: tuple[int, int, int, int],
+        record: dict[str, Any],
+    ) -> None:
+        """Initialise a TileMask instance.
+
+        Parameters:
+            crop: Binary mask cropped to `box`.
+            box: The `(x0, y0, x1, y1)` mask bounding box (exclusive end) in the image.
+            tile: The `(x0, y0, x1, y1)` box of the tile that produced the mask.
+            record: The SAM 2 mask record, with `predicted_iou`, `stability_score` and
+                `point_coords` in image coordinates.
+
+        """
+        self.crop = crop
+        self.box = box
+        self.tile = tile
+        self.record = record
+
+    def area_within(self, box: tuple[int, int, int, int]) -> int:
+        """Mask area within `box`."""
+        region = self.region(box)
+
+        return 0 if region is None else int(region.sum())
+
+    def region(self, box: tuple[int, int, int, int]) -> np.ndarray | None:
+        """Mask crop restricted to `box`, or `None` if they do not intersect."""
+        x0, y0 = max(box[0], self.box[0]), max(box[1], self.box[1])
+        x1, y1 = min(box[2], self.box[2]), min(box[3], self.box[3])
+        if x0 >= x1 or y0 >= y1:
+            return None
+
+        return self.crop[y0 - self.box[1] : y1 - self.box[1], x0 - self.box[0] : x1 - self.box[0]]
+
+
+def intersection(box_a: tuple[int, int, int, int], box_b: tuple[int, int, int, int]) -> tuple[int, int, int, int]:
+    """Intersection of two `(x0, y0, x1, y1)` boxes (may be empty)."""
+    return (
+        max(box_a[0], box_b[0]),
+        max(box_a[1], box_b[1]),
+        min(box_a[2], box_b[2]),
+        min(box_a[3], box_b[3]),
+    )
+
+
+def tile_masks(masks: list[dict[str, Any]], tile: tuple[int, int, int, int]) -> list[TileMask]:
+    """Crop the masks of one tile to their bounding boxes in image coordinates.
+
+    Parameters:
+        masks: SAM 2 mask records for the tile, with binary mask or uncompressed RLE
+            segmentations.
+        tile: The `(x0, y0, x1, y1)` tile box.
+
+    """
+    cropped = []
+    for mask in masks:
+        segmentation = mask["segmentation"]
+        if not isinstance(segmentation, np.ndarray):
+            segmentation = py_sam.output.rle_to_mask(segmentation)
+
+        rows = np.flatnonzero(segmentation.any(axis=1))
+        cols = np.flatnonzero(segmentation.any(axis=0))
+        if not len(rows):
+            continue
+
+        crop = np.ascontiguousarray(segmentation[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1])
+        box = (
+            tile[0] + int(cols[0]),
+            tile[1] + int(rows[0]),
+            tile[0] + int(cols[-1]) + 1,
+            tile[1] + int(rows[-1]) + 1,
+        )
+        record = {
+            "predicted_iou": mask["predicted_iou"],
+            "stability_score": mask["stability_score"],
+            "point_coords": [[x + tile[0], y + tile[1]] for x, y in mask["point_coords"]],
+        }
+        cropped.append(TileMask(crop, box, tile, record))
+
+    return cropped
+
+
+def overlapping_tiles(
+    tiles: list[tuple[int, int, int, int]],
+) -> list[tuple[tuple[int, int, int, int], tuple[int, int, int, int]]]:
+    """Pairs of `(x0, y0, x1, y1)` tiles that share a region.
+
+    Tiles are bucketed in a grid of cells as large as the largest tile, so each tile is
+    only compared with the tiles of its own and the neighbouring cells.
+
+    """
+    size = max(max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in tiles)
+    cells: dict[tuple[int, int], list[tuple[int, int, int, int]]] = {}
+    for tile in tiles:
+        cells.setdefault((tile[0] // size, tile[1] // size), []).append(tile)
+
+    pairs = []
+    for (cell_x, cell_y), cell in cells.items():
+        neighbours = [
+            tile for dx in (-1, 0, 1) for dy in (-1, 0, 1) for tile in cells.get((cell_x + dx, cell_y + dy), [])
+        ]
+        for tile_a in cell:
+            for tile_b in neighbours:
+                x0, y0, x1, y1 = intersection(tile_a, tile_b)
+                if tile_a < tile_b and x0 < x1 and y0 < y1:
+                    pairs.append((tile_a, tile_b))
+
+    return pairs
+
+
+def stitch(masks: list[TileMask], merge_thresh: float = DEFAULT_MERGE_THRESH) -> list[TileMask]:
+    """Merge masks from different tiles that are the same object.
+
+    Two masks from overlapping tiles are merged when their IoU within the region their
+    tiles share is at least `merge_thresh`. This both removes duplicates found in the
+    overlap and joins objects that cross tile borders, while a part and the whole that
+    contains it stay apart. Only the masks of overlapping tiles are compared, so time and
+    memory grow with the number of masks in each tile rather than in the image.
+
+    Matches are merged best IoU first, and never join two masks of the same tile: once a
+    whole has merged with its match across the border, a part of the whole in the same
+    tile as the whole can no longer merge into it through that match.
+
+    Parameters:
+        masks: Masks from all of the tiles.
+        merge_thresh: Shared region IoU threshold in [0, 1].
+
+    """
+    if not masks:
+        return []
+
+    by_tile: dict[tuple[int, int, int, int], list[int]] = {}
+    for idx, mask in enumerate(masks):
+        by_tile.setdefault(mask.tile, []).append(idx)
+
+    parent = list(range(len(masks)))
+    group_tiles = [{mask.tile} for mask in masks]
+
+    def find(idx: int) -> int:
+        while parent[idx] != idx:
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
+
+    matches = [
+        match
+        for tile_a, tile_b in overlapping_tiles(list(by_tile))
+        for match in tile_pair_matches(masks, by_tile[tile_a], by_tile[tile_b], merge_thresh)
+    ]
+    for _, i, j in sorted(matches, reverse=True):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j and not group_tiles[root_i] & group_tiles[root_j]:
+            parent[root_i] = root_j
+            group_tiles[root_j] |= group_tiles[root_i]
+
+    groups: dict[int, list[TileMask]] = {}
+    for idx, mask in enumerate(masks):
+        groups.setdefault(find(idx), []).append(mask)
+
+    return [merge(group) for group in groups.values()]
+
+
+def tile_pair_matches(
+    masks: list[TileMask], side_a: list[int], side_b: list[int], merge_thresh: float
+) -> list[tuple[float, int, int]]:
+    """Masks of two overlapping tiles that are the same object.
+
+    Parameters:
+        masks: Masks from all of the tiles.
+        side_a: Indices into `masks` of the masks of one tile.
+        side_b: Indices into `masks` of the masks of the other tile.
+        merge_thresh: Shared region IoU threshold in [0, 1].
+
+    Returns:
+        The `(iou, i, j)` matches of `masks[i]` of one tile and `masks[j]` of the other.
+
+    """
+    shared = intersection(masks[side_a[0]].tile, masks[side_b[0]].tile)
+    side_a = [idx for idx in side_a if masks[idx].area_within(shared)]
+    side_b = [idx for idx in side_b if masks[idx].area_within(shared)]
+    if not side_a or not side_b:
+        return []
+
+    boxes_a = np.array([intersection(masks[i].box, shared) for i in side_a])
+    boxes_b = np.array([intersection(masks[j].box, shared) for j in side_b])
+    candidates = (
+        (boxes_a[:, None, 0] < boxes_b[None, :, 2])
+        & (boxes_b[None, :, 0] < boxes_a[:, None, 2])
+        & (boxes_a[:, None, 1] < boxes_b[None, :, 3])
+        & (boxes_b[None, :, 1] < boxes_a[:, None, 3])
+    )
+    matches = []
+    for a, b in zip(*np.nonzero(candidates), strict=True):
+        i, j = side_a[a], side_b[b]
+        overlap = intersection(masks[i].box, masks[j].box)
+        common = int((masks[i].region(overlap) & masks[j].region(overlap)).sum())
+        union = masks[i].area_within(shared) + masks[j].area_within(shared) - common
+        if common / union >= merge_thresh:
+            matches.append((common / union, i, j))
+
+    return matches
+
+
+def merge(group: list[TileMask]) -> TileMask:
+    """Union of a group of masks."""
+    if len(group) == 1:
+        return group[0]
+
+    box = (
+        min(mask.box[0] for mask in group),
+        min(mask.box[1] for mask in group),
+        max(mask.box[2] for mask in group),
+        max(mask.box[3] for mask in group),
+    )
+    tile = (
+        min(mask.tile[0] for mask in group),
+        min(mask.tile[1] for mask in group),
+        max(mask.tile[2] for mask in group),
+        max(mask.tile[3] for mask in group),
+    )
+    crop = np.zeros((box[3] - box[1], box[2] - box[0]), dtype=bool)
+    for mask in group:
+        crop[
+            mask.box[1] - box[1] : mask.box[3] - box[1],
+            mask.box[0] - box[0] : mask.box[2] - box[0],
+        ] |= mask.crop
+    record = {
+        "predicted_iou": max(mask.record["predicted_iou"] for mask in group),
+        "stability_score": max(mask.record["stability_score"] for mask in group),
+        "point_coords": [point for mask in group for point in mask.record["point_coords"]],
+    }
+
+    return TileMask(crop, box, tile, record)
+
+
+def generate_tiled(
+    mask_generator: BatchedMaskGenerator, image: np.ndarray, settings: TileSettings
+) -> list[dict[str, Any]]:
+    """Generate SAM 2 masks for a large image tile by tile.
+
+    Tiles are passed through the image encoder `settings.batch_size` at a time. Masks are
+    kept as crops of their bounding boxes and returned as uncompressed RLEs of the full
+    image, so no full-size mask is ever allocated.
+
+    Parameters:
+        mask_generator: The SAM 2 automatic mask generator.
+        image: The `HxWx3` source image.
+        settings: The tile size, overlap, batch size and merge threshold.
+
+    Returns:
+        Mask records as per `SAM2AutomaticMaskGenerator.generate` with uncompressed RLE
+        segmentations, largest first.
+
+    """
+    height, width = image.shape[:2]
+    boxes = tile_boxes(height, width, settings.size, settings.overlap)
+    log.info(
+        f"Tiled mask generation over {len(boxes)} tiles (tile size: {settings.size} | overlap: {settings.overlap})"
+    )
+
+    masks: list[TileMask] = []
+    for idx in range(0, len(boxes), settings.batch_size):
+        batch_boxes = boxes[idx : idx + settings.batch_size]
+        tiles = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in batch_boxes]
+        batch_masks = [mask_generator.generate(tiles[0])] if len(tiles) == 1 else mask_generator.generate_batch(tiles)
+        for box, tile_result in zip(batch_boxes, batch_masks, strict=True):
+            masks.extend(tile_masks(tile_result, box))
+
+    stitched = stitch(masks, settings.merge_thresh)
+    log.info(f"Tiled mask generation stitched {len(masks)} tile masks into {len(stitched)}")
+
+    records = [to_record(mask, height, width) for mask in stitched]
+
+    return sorted(records, key=lambda record: record["area"], reverse=True)
+
+
+def to_record(mask: TileMask, height: int, width: int) -> dict[str, Any]:
+    """SAM 2 mask record for a stitched mask."""
+    rows = np.flatnonzero(mask.crop.any(axis=1))
+    cols = np.flatnonzero(mask.crop.any(axis=0))
+
+    return {
+        "segmentation": py_sam.output.crop_to_rle(mask.crop, mask.box[0], mask.box[1], height, width),
+        "area": int(mask.crop.sum()),
+        "bbox": [
+            float(mask.box[0] + cols[0]),
+            float(mask.box[1] + rows[0]),
+            float(cols[-1] - cols[0]),
+            float(rows[-1] - rows[0]),
+        ],
+        "predicted_iou": float(mask.record["predicted_iou"]),
+        "point_coords": mask.record["point_coords"],
+        "stability_score": float(mask.record["stability_score"]),
+        "crop_box": [
+            float(mask.tile[0]),
+            float(mask.tile[1]),
+            float(mask.tile[2] - mask.tile[0]),
+            float(mask.tile[3] - mask.tile[1]),
+        ],
+    }
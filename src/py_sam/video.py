@@ -0,0 +1,802 @@
+"""SAM 2 video segmentation with streamed frame decode and memory propagation."""
+
+import collections
+import os
+import posixpath
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, cast
+from urllib.parse import urlparse
+
+import cv2
+import fsspec  # type: ignore[import-untyped]
+import numpy as np
+import ray
+import torch
+from sam2.sam2_video_predictor import SAM2VideoPredictor  # type: ignore[import-untyped]
+
+import py_sam.checkpoint
+import py_sam.concurrency
+import py_sam.discovery
+import py_sam.execution
+import py_sam.metrics
+import py_sam.model.hiera
+import py_sam.output
+import py_sam.profiles
+import py_sam.render
+from py_sam.fbr_sam import FbrSam
+from py_sam.logging_config import log
+from py_sam.mask_generator import BatchedMaskGenerator
+
+VIDEO_EXTENSIONS = ("mp4", "m4v", "mov", "avi", "mkv", "webm")
+
+OUTPUT_MODES = (py_sam.output.OVERLAY, py_sam.output.COCO_RLE, py_sam.output.NPZ)
+
+DEFAULT_CHUNK_FRAMES = 500
+DEFAULT_MAX_OBJECTS = 16
+
+# Decoded frames held by a frame stream, for the frames SAM 2 revisits while propagating.
+FRAME_WINDOW = 8
+
+# Lifetime of the presigned URLs that OpenCV streams S3 videos from.
+SIGN_EXPIRATION = 24 * 60 * 60
+
+# SAM 2 input normalisation, as per `sam2.utils.misc.load_video_frames`.
+IMG_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMG_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def is_video(path: str) -> bool:
+    """Whether `path` has a source video file extension."""
+    return path.rsplit(".", 1)[-1].lower() in VIDEO_EXTENSIONS
+
+
+def list_videos(source_data_path: str, filesystem: fsspec.AbstractFileSystem) -> list[str]:
+    """List the video file URIs under `source_data_path`.
+
+    Parameters:
+        source_data_path: Video file or prefix.
+        filesystem: The `fsspec` filesystem that hosts `source_data_path`.
+
+    """
+    scheme = urlparse(source_data_path).scheme
+    root = filesystem._strip_protocol(source_data_path)
+    paths = [root] if filesystem.isfile(root) else filesystem.find(root)
+
+    return sorted(f"{scheme}://{path}" if scheme else path for path in paths if is_video(path))
+
+
+def video_source(uri: str) -> str:
+    """Location that OpenCV streams the video at `uri` from.
+
+    S3 videos are streamed over a presigned HTTPS URL (with ranged reads), so they are
+    never downloaded in full.
+
+    """
+    filesystem = FbrSam.filesystem(uri)
+    path = filesystem._strip_protocol(uri)
+    if urlparse(uri).scheme in ["s3"]:
+        return filesystem.sign(path, expiration=SIGN_EXPIRATION)
+
+    return path
+
+
+def open_video(uri: str) -> cv2.VideoCapture:
+    """Open the video at `uri` for streamed decoding."""
+    capture = cv2.VideoCapture(video_source(uri))
+    if not capture.isOpened():
+        msg = f"Unable to open video: {uri}"
+        raise OSError(msg)
+
+    return capture
+
+
+def count_frames(capture: cv2.VideoCapture) -> int:
+    """Count the frames of an opened video.
+
+    The container frame count is used if reported. Otherwise, as with some WebM and
+    Matroska files, the frames are counted by decoding through the video, which leaves the
+    capture at its end.
+
+    """
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    if frame_count > 0:
+        return frame_count
+
+    frame_count = 0
+    while capture.grab():
+        frame_count += 1
+
+    return frame_count
+
+
+def chunk_ranges(frame_count: int, chunk_frames: int) -> list[tuple[int, int]]:
+    """Start and stop frames of the consecutive chunks of a video.
+
+    Parameters:
+        frame_count: Number of frames in the video.
+        chunk_frames: Longest chunk, in frames.
+
+    """
+    return [(start, min(start + chunk_frames, frame_count)) for start in range(0, frame_count, chunk_frames)]
+
+
+def video_chunks(row: dict[str, Any], chunk_frames: int) -> list[dict[str, Any]]:
+    """Split the video of a `path` row into chunks of up to `chunk_frames` frames.
+
+    Parameters:
+        row: Ray row with a `path` column holding the video file URI.
+        chunk_frames: Longest chunk, in frames.
+
+    Returns:
+        A row for each chunk, with the `start` (inclusive) and `stop` (exclusive) frames.
+
+    """
+    capture = open_video(row["path"])
+    try:
+        fps = float(capture.get(cv2.CAP_PROP_FPS))
+        frame_count = count_frames(capture)
+    finally:
+        capture.release()
+
+    chunks = chunk_ranges(frame_count, chunk_frames)
+    log.info(f"Video {row['path']} - frames: {frame_count} | fps: {fps:.2f} | chunks: {len(chunks)}")
+
+    return [{"path": row["path"], "start": start, "stop": stop, "fps": fps} for start, stop in chunks]
+
+
+class FrameStream:
+    """Frames of a video segment, decoded on demand as a stream.
+
+    Frames are read in order with OpenCV and only the `window` most recently decoded
+    frames are held, so memory does not grow with the video length. Reading a frame outside
+    of the window seeks the video. Indexing returns the frame resized and normalised for
+    the SAM 2 image encoder, as `SAM2VideoPredictor` expects of its `images`.
+
+    Container frame counts and seeks are not exact for every video (for example, variable
+    frame rate or WebM files). Seeks that do not land on their frame decode forward to it
+    instead, and reading past the last decodable frame raises `EOFError`.
+
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        start: int = 0,
+        stop: int | None = None,
+        image_size: int = 1024,
+        window: int = FRAME_WINDOW,
+    ) -> None:
+        """Initialise a FrameStream instance.
+
+        Parameters:
+            uri: The video file URI.
+            start: First frame of the segment.
+            stop: Frame after the last frame of the segment. Defaults to the video end.
+            image_size: Side of the square SAM 2 image encoder input.
+            window: Number of decoded frames to hold.
+
+        """
+        self.__uri = uri
+        if stop is None:
+            capture = open_video(uri)
+            try:
+                stop = count_frames(capture)
+            finally:
+                capture.release()
+        self.__capture = open_video(uri)
+        self.__start = start
+        self.__stop = stop
+        if self.__stop <= start:
+            msg = f"No frames from {start} to {self.__stop} in {uri}"
+            raise ValueError(msg)
+
+        self.__video_height = int(self.__capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.__video_width = int(self.__capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.__image_size = image_size
+        self.__window = window
+        self.__frames: collections.OrderedDict[int, np.ndarray] = collections.OrderedDict()
+        self.__position = 0
+        self.__seeks = 0
+        if start:
+            self.seek(0)
+
+    def __len__(self) -> int:
+        """Return the number of frames in the segment."""
+        return self.__stop - self.__start
+
+    def __getitem__(self, idx: int) -> torch.Tensor:
+        """SAM 2 image encoder input of the `idx`-th frame of the segment."""
+        image = cv2.resize(
+            self.frame(idx),
+            (self.__image_size, self.__image_size),
+            interpolation=cv2.INTER_LINEAR,
+        )
+        image = (image.astype(np.float32) / 255.0 - IMG_MEAN) / IMG_STD
+
+        return torch.from_numpy(np.ascontiguousarray(image.transpose(2, 0, 1)))
+
+    @property
+    def start(self) -> int:
+        """First frame of the segment getter."""
+        return self.__start
+
+    @property
+    def video_height(self) -> int:
+        """Video frame height getter."""
+        return self.__video_height
+
+    @property
+    def video_width(self) -> int:
+        """Video frame width getter."""
+        return self.__video_width
+
+    @property
+    def seeks(self) -> int:
+        """Number of seeks out of decode order getter."""
+        return self.__seeks
+
+    def frame(self, idx: int) -> np.ndarray:
+        """RGB `idx`-th frame of the segment, at the video resolution."""
+        if not 0 <= idx < len(self):
+            msg = f"Frame {idx} is outside of the {len(self)} frame segment"
+            raise IndexError(msg)
+
+        frame = self.__frames.get(idx)
+        if frame is not None:
+            self.__frames.move_to_end(idx)
+            return frame
+
+        if idx != self.__position:
+            self.seek(idx)
+            self.__seeks += 1
+        ok, bgr = self.__capture.read()
+        if not ok:
+            msg = f"{self.__uri} ends before frame {self.__start + idx}"
+            raise EOFError(msg)
+        self.__position = idx + 1
+
+        frame = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        self.__frames[idx] = frame
+        if len(self.__frames) > self.__window:
+            self.__frames.popitem(last=False)
+
+        return frame
+
+    def seek(self, idx: int) -> None:
+        """Move the video to the `idx`-th frame of the segment, so it is read next.
+
+        The position is checked after the seek. If it is off, the video is decoded forward
+        to the frame from its start.
+
+        """
+        frame_idx = self.__start + idx
+        if (
+            self.__capture.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            and int(self.__capture.get(cv2.CAP_PROP_POS_FRAMES)) == frame_idx
+        ):
+            self.__position = idx
+            return
+
+        log.warning(f"Inexact seek to frame {frame_idx} of {self.__uri}. Decoding forward to it.")
+        self.__capture.release()
+        self.__capture = open_video(self.__uri)
+        for position in range(frame_idx):
+            if not self.__capture.grab():
+                msg = f"{self.__uri} ends at frame {position}"
+                raise EOFError(msg)
+        self.__position = idx
+
+    def close(self) -> None:
+        """Release the video."""
+        self.__capture.release()
+        self.__frames.clear()
+
+
+class StreamingVideoPredictor(SAM2VideoPredictor):
+    """SAM 2 video predictor over streamed frames with a bounded memory bank.
+
+    Pass a `FrameStream` to `init_state` to decode the frames as propagation reaches them,
+    rather than loading the whole video up front. While propagating forward, the outputs of
+    frames that are past the memory bank (`num_maskmem` frames) and object pointer
+    (`max_obj_ptrs_in_encoder` frames) horizon are released, so memory does not grow with
+    the segment length either.
+
+    """
+
+    @property
+    def memory_horizon(self) -> int:
+        """Number of past frames whose outputs propagation still reads."""
+        return max(
+            (self.num_maskmem - 1) * self.memory_temporal_stride_for_eval,
+            self.max_obj_ptrs_in_encoder,
+        )
+
+    @torch.inference_mode()
+    def init_state(  # type: ignore[override]
+        self,
+        video_path: Any,
+        offload_video_to_cpu: bool = False,
+        offload_state_to_cpu: bool = False,
+        async_loading_frames: bool = False,
+    ) -> dict[str, Any]:
+        """Initialise an inference state, streaming the frames of a `FrameStream`.
+
+        Other sources load as per `SAM2VideoPredictor.init_state`.
+
+        """
+        if not isinstance(video_path, FrameStream):
+            return super().init_state(
+                video_path,
+                offload_video_to_cpu=offload_video_to_cpu,
+                offload_state_to_cpu=offload_state_to_cpu,
+                async_loading_frames=async_loading_frames,
+            )
+
+        compute_device = self.device
+        inference_state: dict[str, Any] = {
+            "images": video_path,
+            "num_frames": len(video_path),
+            # Frames are decoded on to the CPU and copied to the device one at a time.
+            "offload_video_to_cpu": True,
+            "offload_state_to_cpu": offload_state_to_cpu,
+            "video_height": video_path.video_height,
+            "video_width": video_path.video_width,
+            "device": compute_device,
+            "storage_device": (torch.device("cpu") if offload_state_to_cpu else compute_device),
+            "point_inputs_per_obj": {},
+            "mask_inputs_per_obj": {},
+            "cached_features": {},
+            "constants": {},
+            "obj_id_to_idx": collections.OrderedDict(),
+            "obj_idx_to_id": collections.OrderedDict(),
+            "obj_ids": [],
+            "output_dict_per_obj": {},
+            "temp_output_dict_per_obj": {},
+            "frames_tracked_per_obj": {},
+        }
+        self._get_image_feature(inference_state, frame_idx=0, batch_size=1)
+
+        return inference_state
+
+    def propagate_in_video(  # type: ignore[override]
+        self,
+        inference_state: dict[str, Any],
+        start_frame_idx: int | None = None,
+        max_frame_num_to_track: int | None = None,
+        reverse: bool = False,
+    ) -> Iterator[tuple[int, list[int], torch.Tensor]]:
+        """Propagate the prompts across the frames, releasing outputs past the horizon.
+
+        See `SAM2VideoPredictor.propagate_in_video`. Reverse propagation keeps every output.
+
+        """
+        for frame_idx, obj_ids, video_res_masks in super().propagate_in_video(
+            inference_state,
+            start_frame_idx=start_frame_idx,
+            max_frame_num_to_track=max_frame_num_to_track,
+            reverse=reverse,
+        ):
+            yield frame_idx, obj_ids, video_res_masks
+            if not reverse:
+                self.release(inference_state, frame_idx)
+
+    def release(self, inference_state: dict[str, Any], frame_idx: int) -> None:
+        """Release the non-conditioning outputs of frames past the memory horizon.
+
+        Parameters:
+            inference_state: The video inference state.
+            frame_idx: The last frame propagated forward.
+
+        """
+        horizon = frame_idx - self.memory_horizon
+        for obj_idx, obj_output_dict in inference_state["output_dict_per_obj"].items():
+            outputs = obj_output_dict["non_cond_frame_outputs"]
+            tracked = inference_state["frames_tracked_per_obj"][obj_idx]
+            for idx in [idx for idx in outputs if idx < horizon]:
+                del outputs[idx]
+                tracked.pop(idx, None)
+
+
+def frame_records(
+    obj_ids: list[int],
+    masks: np.ndarray,
+    seeds: dict[int, dict[str, Any]],
+    output_mode: str = "binary_mask",
+) -> list[dict[str, Any]]:
+    """Mask records of the objects tracked in a frame.
+
+    Records follow the `SAM2AutomaticMaskGenerator.generate` format with the tracked
+    `object_id` added. Quality scores are those of the mask that seeded the object.
+
+    Parameters:
+        obj_ids: The tracked object IDs.
+        masks: The `(objects, height, width)` binary masks of the frame.
+        seeds: Seed mask record of each object ID.
+        output_mode: Segmentation format, `binary_mask` or `uncompressed_rle`.
+
+    """
+    height, width = masks.shape[-2:]
+    records = []
+    for obj_id, mask in zip(obj_ids, masks, strict=True):
+        area = int(mask.sum())
+        if not area:
+            continue
+        records.append({
+            "segmentation": (py_sam.output.mask_to_rle(mask) if output_mode == "uncompressed_rle" else mask),
+            "area": area,
+            "bbox": py_sam.output.mask_bbox(mask),
+            "predicted_iou": float(seeds[obj_id]["predicted_iou"]),
+            "stability_score": float(seeds[obj_id]["stability_score"]),
+            "point_coords": seeds[obj_id]["point_coords"],
+            "crop_box": [0.0, 0.0, float(width), float(height)],
+            "object_id": int(obj_id),
+        })
+
+    return records
+
+
+@dataclass(frozen=True)
+class VideoSettings:
+    """Chunking, tracking, output and execution settings of a `VideoSam` instance.
+
+    Parameters:
+        output_mode: Write rendered overlay frames (`overlay`), or the raw frame masks as
+            COCO RLE JSON (`coco_rle`) or packed NPZ (`npz`).
+        file_format: The image file format of overlay frames, `PNG` or `JPEG`.
+        chunk_frames: Longest chunk of a video, in frames. Longer chunks track objects
+            further, shorter chunks spread a long video over more actors.
+        max_objects: Most objects to track through each chunk.
+        profile: Mask generation profile of the seed frames.
+        mask_settings: `SAM2AutomaticMaskGenerator` settings that override the profile.
+        precision: `fp32`, or `bf16` for bfloat16 autocast.
+        inference_mode: Run under `torch.inference_mode`.
+
+    """
+
+    output_mode: str = py_sam.output.OVERLAY
+    file_format: str = "PNG"
+    chunk_frames: int = DEFAULT_CHUNK_FRAMES
+    max_objects: int = DEFAULT_MAX_OBJECTS
+    profile: str = py_sam.profiles.BALANCED
+    mask_settings: dict | None = None
+    precision: str = py_sam.execution.FP32
+    inference_mode: bool = False
+
+    def __post_init__(self) -> None:
+        """Validate the settings."""
+        if self.output_mode not in OUTPUT_MODES:
+            msg = f"Unsupported video output mode: {self.output_mode}"
+            raise ValueError(msg)
+        if self.precision not in py_sam.execution.PRECISIONS:
+            msg = f"Unsupported precision: {self.precision}"
+            raise ValueError(msg)
+        py_sam.profiles.resolve(self.profile, self.mask_settings)
+
+    @classmethod
+    def from_environment(cls, **overrides: Any) -> "VideoSettings":
+        """Resolve the settings, with unset values from the environment.
+
+        Falls back to the `PY_SAM__PROFILE`, `PY_SAM__PRECISION` and
+        `PY_SAM__INFERENCE_MODE` environment variables.
+
+        Parameters:
+            overrides: Settings that take precedence over the environment. Values of `None`
+                are unset.
+
+        """
+        settings = {
+            "profile": os.environ.get("PY_SAM__PROFILE", py_sam.profiles.BALANCED),
+            "precision": os.environ.get("PY_SAM__PRECISION", py_sam.execution.FP32),
+            "inference_mode": os.environ.get("PY_SAM__INFERENCE_MODE") == "true",
+        }
+        settings.update((name, value) for name, value in overrides.items() if value is not None)
+
+        return cls(**settings)
+
+
+class VideoSam:
+    """Facebook Research SAM 2 video segmentation over chunks of videos.
+
+    Each chunk is seeded with the automatic masks of its first frame (up to `max_objects`,
+    best predicted IoU first), which the SAM 2 video predictor then propagates through the
+    rest of the chunk with its memory bank. The masks are written out frame by frame as
+    propagation goes, under `<output_path>/<video>/<frame>`. Object IDs are local to a
+    chunk.
+
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        source_data_path: str = "",
+        device: str = "cpu",
+        model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        settings: VideoSettings | None = None,
+    ) -> None:
+        """Initialise a VideoSam instance, and build the SAM 2 video predictor.
+
+        Parameters:
+            output_path: Directory to write the frame masks to.
+            source_data_path: Source video file or prefix. Output directories are named by
+                the video path relative to it.
+            device: Device to run the model on, unless MPS or CUDA are available.
+            model: The pre-trained weight to use for the compute.
+            settings: Chunking, tracking, output and execution settings. Defaults to
+                `VideoSettings()`.
+
+        """
+        settings = settings or VideoSettings()
+
+        if torch.backends.mps.is_available():
+            self.__device = "mps"
+        else:
+            self.__device = "cuda" if torch.cuda.is_available() else device
+        self.__model = model()
+        self.__output_path = output_path
+        self.__filesystem = FbrSam.filesystem(output_path)
+        self.__source_root = (
+            FbrSam.filesystem(source_data_path)._strip_protocol(source_data_path) if source_data_path else ""
+        )
+        self.__settings = settings
+
+        mask_settings = py_sam.profiles.resolve(settings.profile, settings.mask_settings)
+        self.__metadata = {
+            "profile": settings.profile,
+            "model_type": self.model.model_type,
+            "mask_generator": mask_settings,
+            "precision": settings.precision,
+            "max_objects": settings.max_objects,
+        }
+
+        with py_sam.metrics.stage(py_sam.metrics.LOAD, self.model.model_type):
+            start = time.perf_counter()
+            self.__predictor = py_sam.checkpoint.build_mmap(
+                self.model, self.device, video_predictor=StreamingVideoPredictor
+            )
+            # The seed frame generator shares the weights of the video predictor.
+            self.__mask_generator = BatchedMaskGenerator(self.__predictor, output_mode="binary_mask", **mask_settings)
+            log.info(
+                f"SAM video predictor {self.model.model_type} loaded on {self.device} "
+                f"in {time.perf_counter() - start:.2f}s (pid: {os.getpid()})"
+            )
+
+    def __call__(self, row: dict[str, Any]) -> dict[str, Any]:
+        """Segment the video chunk of a `path`, `start` and `stop` row."""
+        start = time.perf_counter()
+        frames = objects = 0
+        for frame_idx, records, image in self.segment(row["path"], int(row["start"]), int(row["stop"])):
+            self.write_frame(row["path"], frame_idx, records, image, row)
+            frames += 1
+            objects = max(objects, len(records))
+
+        return {
+            **row,
+            "frames": frames,
+            "objects": objects,
+            "seconds": time.perf_counter() - start,
+        }
+
+    @property
+    def device(self) -> str:
+        """SAM device getter."""
+        return self.__device
+
+    @property
+    def model(self) -> py_sam.model.Model:
+        """SAM model getter."""
+        return self.__model
+
+    @property
+    def settings(self) -> VideoSettings:
+        """Video settings getter."""
+        return self.__settings
+
+    @property
+    def output_mode(self) -> str:
+        """Output mode getter."""
+        return self.settings.output_mode
+
+    @property
+    def predictor(self) -> StreamingVideoPredictor:
+        """SAM 2 video predictor getter."""
+        return self.__predictor
+
+    def seed(self, image: np.ndarray) -> list[dict[str, Any]]:
+        """Automatic masks of `image` to track, best predicted IoU first."""
+        masks = self.__mask_generator.generate(image)
+        masks.sort(key=lambda mask: mask["predicted_iou"], reverse=True)
+
+        return masks[: self.settings.max_objects]
+
+    def segment(
+        self, uri: str, start: int = 0, stop: int | None = None
+    ) -> Iterator[tuple[int, list[dict[str, Any]], np.ndarray]]:
+        """Track the objects of a video chunk from the automatic masks of its first frame.
+
+        Parameters:
+            uri: The video file URI.
+            start: First frame of the chunk.
+            stop: Frame after the last frame of the chunk. Defaults to the video end.
+
+        Returns:
+            An iterator over the video frame index, the mask records and the RGB image of
+            each frame, as propagation reaches it. The chunk ends early at the first frame
+            that does not decode, if the video is shorter than its reported frame count.
+
+        """
+        frames = FrameStream(uri, start, stop, image_size=self.predictor.image_size)
+        segmentation = "binary_mask" if self.output_mode == py_sam.output.OVERLAY else "uncompressed_rle"
+        try:
+            with (
+                py_sam.metrics.stage(
+                    py_sam.metrics.INFERENCE,
+                    self.model.model_type,
+                    video=uri,
+                    start=frames.start,
+                    frames=len(frames),
+                ),
+                py_sam.execution.execution_context(self.device, self.settings.precision, self.settings.inference_mode),
+            ):
+                seeds = dict(enumerate(self.seed(frames.frame(0)), start=1))
+                log.info(
+                    f"Tracking {len(seeds)} object(s) through frames {frames.start} "
+                    f"to {frames.start + len(frames) - 1} of {uri}"
+                )
+                if not seeds:
+                    for idx in range(len(frames)):
+                        yield frames.start + idx, [], frames.frame(idx)
+                    return
+
+                state = self.predictor.init_state(frames)
+                for obj_id, seed in seeds.items():
+                    self.predictor.add_new_mask(state, frame_idx=0, obj_id=obj_id, mask=seed["segmentation"])
+                for (
+                    frame_idx,
+                    obj_ids,
+                    video_res_masks,
+                ) in self.predictor.propagate_in_video(state):
+                    masks = (video_res_masks[:, 0] > 0.0).cpu().numpy()
+                    yield (
+                        frames.start + frame_idx,
+                        frame_records(obj_ids, masks, seeds, segmentation),
+                        frames.frame(frame_idx),
+                    )
+        except EOFError as error:
+            log.warning(f"Ending the chunk early: {error}")
+        finally:
+            frames.close()
+
+    def frame_path(self, uri: str, frame_idx: int) -> str:
+        """Output path of the masks of a video frame."""
+        path = FbrSam.filesystem(uri)._strip_protocol(uri)
+        name = (
+            posixpath.relpath(path, self.__source_root)
+            if self.__source_root and path != self.__source_root
+            else posixpath.basename(path)
+        )
+        extension = py_sam.output.FILE_EXTENSIONS.get(self.output_mode, f".{self.settings.file_format.lower()}")
+
+        return posixpath.join(
+            self.__filesystem._strip_protocol(self.__output_path),
+            posixpath.splitext(name)[0],
+            f"{frame_idx:06d}{extension}",
+        )
+
+    def write_frame(
+        self,
+        uri: str,
+        frame_idx: int,
+        records: list[dict[str, Any]],
+        image: np.ndarray,
+        row: dict[str, Any] | None = None,
+    ) -> None:
+        """Write the masks of a video frame as per the output mode.
+
+        Parameters:
+            uri: The video file URI.
+            frame_idx: The video frame index.
+            records: The mask records of the frame.
+            image: The RGB frame.
+            row: The video chunk row, recorded in the raw output metadata.
+
+        """
+        height, width = image.shape[:2]
+        with py_sam.metrics.stage(py_sam.metrics.ENCODE, self.model.model_type, image=f"{uri}#{frame_idx}"):
+            if self.output_mode == py_sam.output.OVERLAY:
+                ok, data = cv2.imencode(
+                    f".{self.settings.file_format.lower()}",
+                    cv2.cvtColor(py_sam.render.composite(image, records), cv2.COLOR_RGB2BGR),
+                )
+                if not ok:
+                    msg = f"Unable to encode frame {frame_idx} of {uri}"
+                    raise OSError(msg)
+                data = data.tobytes()
+            else:
+                metadata = {
+                    **self.__metadata,
+                    "video": uri,
+                    "frame": frame_idx,
+                    "chunk": [row["start"], row["stop"]] if row else None,
+                    "fps": row.get("fps") if row else None,
+                }
+                if self.output_mode == py_sam.output.COCO_RLE:
+                    data = py_sam.output.to_coco_json(records, f"{uri}#{frame_idx}", height, width, metadata=metadata)
+                else:
+                    data = py_sam.output.to_npz(records, height, width, metadata=metadata)
+
+        path = self.frame_path(uri, frame_idx)
+        self.__filesystem.makedirs(posixpath.dirname(path), exist_ok=True)
+        self.__filesystem.pipe_file(path, data)
+        py_sam.metrics.record_image(len(records), self.model.model_type, image=f"{uri}#{frame_idx}")
+
+    @staticmethod
+    def process(
+        source_data_path: str,
+        output_path: str,
+        model: type[py_sam.model.Model] = py_sam.model.hiera.HieraLarge,
+        settings: VideoSettings | None = None,
+        concurrency: py_sam.concurrency.ConcurrencySettings | None = None,
+    ) -> list[dict[str, Any]]:
+        """Ray SAM 2 video segmentation.
+
+        Videos are split into chunks of up to `chunk_frames` frames, which an actor pool
+        segments in parallel across and within videos.
+
+        source_data_path: Location of the source videos.
+        output_path: Path to write the frame masks to.
+        model: The pre-trained weight to use for the compute.
+        settings: Chunking, tracking, output and execution settings. Defaults to
+            `VideoSettings.from_environment()`.
+        concurrency: Requested stage concurrency. See `py_sam.concurrency.resolve`.
+
+        Returns:
+            A summary row for each video chunk.
+
+        """
+        filesystem = FbrSam.filesystem(source_data_path)
+        videos = list_videos(source_data_path, filesystem)
+        log.info(f"Source videos under {source_data_path}: {len(videos)}")
+        if not videos:
+            return []
+
+        settings = settings or VideoSettings.from_environment()
+        num_cpus = os.environ.get("PY_SAM__NUM_CPUS")
+        num_gpus = os.environ.get("PY_SAM__NUM_GPUS")
+        stage_concurrency = py_sam.concurrency.resolve(
+            concurrency,
+            num_cpus=float(num_cpus) if num_cpus else None,
+            num_gpus=float(num_gpus) if num_gpus else None,
+        )
+        log.info(f"Stage concurrency - {stage_concurrency}")
+
+        dataset = ray.data.from_items([{"path": video} for video in videos], override_num_blocks=len(videos)).flat_map(
+            video_chunks,
+            fn_kwargs={"chunk_frames": settings.chunk_frames},
+            concurrency=stage_concurrency.read,
+            # Fractional CPUs keep the probe tasks from fusing into the actor pool.
+            num_cpus=py_sam.discovery.LISTING_NUM_CPUS,
+        )
+        dataset = dataset.map(
+            VideoSam,
+            fn_constructor_kwargs={
+                "output_path": output_path,
+                "source_data_path": source_data_path,
+                "model": model,
+                "settings": settings,
+            },
+            num_cpus=int(num_cpus) if num_cpus else None,
+            num_gpus=int(num_gpus) if num_gpus else None,
+            concurrency=stage_concurrency.inference,
+        )
+
+        summary = sorted(dataset.take_all(), key=lambda row: (row["path"], int(row["start"])))
+        for row in summary:
+            log.info(
+                f"Video {row['path']} frames {row['start']}-{int(row['stop']) - 1}: "
+                f"{row['frames']} frame(s) | {row['objects']} object(s) | "
+                f"{row['seconds']:.2f}s"
+            )
+
+        return cast(list[dict[str, Any]], summary)
@@ -1,10 +1,12 @@
 """Global fixture arrangement."""
 
+from collections.abc import Generator
 from pathlib import Path
-from typing import Generator
+from typing import Any
 
 import pytest
 import ray
+from sam2.build_sam import build_sam2  # type: ignore[import-untyped]
 
 
 @pytest.fixture(scope="session")
@@ -16,6 +18,15 @@ def data_dir() -> Path:
 @pytest.fixture(scope="session")
 def ray_session() -> Generator[None, None, None]:
     """Create a Ray session."""
-    ray.init(runtime_env={"env_vars": {"PYTORCH_ENABLE_MPS_FALLBACK": "1"}})
+    ray.init(
+        runtime_env={"env_vars": {"PYTORCH_ENABLE_MPS_FALLBACK": "1"}},
+        ignore_reinit_error=True,
+    )
     yield None
     ray.shutdown()
+
+
+@pytest.fixture(scope="session")
+def sam2_tiny() -> Any:
+    """SAM 2 Hiera Tiny model with randomly initialised weights (no checkpoint download)."""
+    return build_sam2("sam2_hiera_t.yaml", None, device="cpu", apply_postprocessing=False)
@@ -0,0 +1,80 @@
+"""Pre-trained weight download unit tests."""
+
+import hashlib
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+import py_sam.model.model
+from py_sam.model import ChecksumError
+from py_sam.model.hiera import HieraTiny
+from py_sam.model.model import verify_checksum
+
+CHECKPOINT = b"sam2 checkpoint"
+
+
+@pytest.fixture
+def hub(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> list[str]:
+    """Hugging Face Hub double that records each download into the staging directory."""
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    downloads: list[str] = []
+
+    def hf_hub_download(repo_id: str, filename: str, local_dir: str) -> str:
+        downloads.append(local_dir)
+        time.sleep(0.2)
+        path = Path(local_dir) / filename
+        path.write_bytes(CHECKPOINT)
+        return str(path)
+
+    monkeypatch.setattr(py_sam.model.model, "hf_hub_download", hf_hub_download)
+    monkeypatch.setattr(HieraTiny, "sha256", lambda self: hashlib.sha256(CHECKPOINT).hexdigest())
+
+    return downloads
+
+
+def test_download(hub: list[str], tmp_path: Path) -> None:
+    """Checkpoints are staged, verified and renamed into the model cache."""
+    # Given an empty model cache
+    model = HieraTiny()
+
+    # when I download the checkpoint
+    model.download()
+
+    # then the checkpoint should be in the model cache
+    assert model.checkpoint.read_bytes() == CHECKPOINT
+
+    # and the staging directory should be removed
+    assert Path(hub[0]).parent == tmp_path
+    assert not Path(hub[0]).exists()
+
+
+def test_concurrent_download(hub: list[str]) -> None:
+    """Concurrent downloads of a checkpoint fetch it once."""
+    # Given several workers on a cold node
+    model = HieraTiny()
+    workers = [threading.Thread(target=HieraTiny().download) for _ in range(4)]
+
+    # when they all download the checkpoint
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # then the checkpoint should have been downloaded once
+    assert len(hub) == 1
+    assert model.checkpoint.read_bytes() == CHECKPOINT
+
+
+def test_verify_checksum_mismatch(tmp_path: Path) -> None:
+    """Corrupt downloads are rejected."""
+    # Given a downloaded file
+    path = tmp_path / "sam2_hiera_tiny.pt"
+    path.write_bytes(CHECKPOINT)
+
+    # when I verify it against another checksum
+    # then I should receive an error
+    verify_checksum(path, hashlib.sha256(CHECKPOINT).hexdigest())
+    with pytest.raises(ChecksumError):
+        verify_checksum(path, hashlib.sha256(b"other").hexdigest())
@@ -0,0 +1,140 @@
+"""Pipeline benchmark unit tests."""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import py_sam.output
+from py_sam.bench import (
+    STAGES,
+    encode_source,
+    load_sources,
+    peak_rss,
+    run,
+    synthetic_image,
+)
+from py_sam.decode import decode_image
+from py_sam.fbr_sam import FbrSam
+from py_sam.model.hiera import HieraTiny
+
+
+def test_synthetic_image() -> None:
+    """Synthetic images are reproducible."""
+    # Given a synthetic image size
+    size = 64
+
+    # when I build the synthetic image twice
+    image = synthetic_image(size)
+
+    # then I should get the same RGB image
+    assert image.shape == (size, size, 3)
+    assert image.dtype == np.uint8
+    np.testing.assert_array_equal(image, synthetic_image(size))
+
+    # and a different seed should give a different image
+    assert not np.array_equal(image, synthetic_image(size, seed=1))
+
+
+def test_encode_source_resolution() -> None:
+    """Source images are encoded with the longer side at the benchmark resolution."""
+    # Given a landscape source image
+    image = np.zeros((300, 600, 3), dtype=np.uint8)
+
+    # when I encode it at a benchmark resolution
+    data = encode_source(image, 256)
+
+    # then the decoded image should have the longer side at that resolution
+    decoded, height, width = decode_image(data)
+    assert (height, width) == (128, 256)
+    assert decoded.shape == (128, 256, 3)
+
+
+def test_load_sources(data_dir: Path) -> None:
+    """Source images are loaded from a directory or synthesised."""
+    # Given a directory of source images
+    # when I load the benchmark sources
+    sources = load_sources(str(data_dir / "png"))
+
+    # then I should get every image in the directory
+    assert [name for name, _ in sources] == sorted(path.name for path in (data_dir / "png").iterdir())
+
+    # and a synthetic image when there is no directory
+    assert [name for name, _ in load_sources()] == ["synthetic"]
+
+
+def test_load_sources_empty(tmp_path: Path) -> None:
+    """A directory without source images is rejected."""
+    # Given an empty directory
+    # when I load the benchmark sources
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        load_sources(str(tmp_path))
+
+
+def test_peak_rss() -> None:
+    """Peak RSS is reported in bytes."""
+    # Given a running process with a buffer of at least 64 MB
+    buffer = np.ones(64 * 2**20, dtype=np.uint8)
+
+    # when I check the peak RSS
+    # then it should cover the buffer
+    assert peak_rss() > buffer.nbytes
+
+
+@pytest.mark.skipif(
+    not HieraTiny().checkpoint.exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+def test_run_report() -> None:
+    """The benchmark report covers every stage at each resolution."""
+    # Given the Hiera Tiny pre-trained weight
+    # when I run the benchmark in process
+    report = run(
+        [HieraTiny],
+        resolutions=(128, 256),
+        isolate=False,
+        output_mode="coco_rle",
+        mask_settings={"points_per_side": 4},
+    )
+
+    # then I should get a JSON serialisable report
+    json.dumps(report)
+    (result,) = report["models"]
+    assert result["model_type"] == "hiera_t"
+    assert result["build_seconds"] > 0
+    assert result["peak_rss_bytes"] > 0
+
+    # with the stage timings and throughput at each resolution
+    assert [item["resolution"] for item in result["resolutions"]] == [128, 256]
+    for item in result["resolutions"]:
+        assert tuple(item["seconds"]) == STAGES
+        assert item["images_per_second"] > 0
+
+
+def test_run_overlay_encode(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The overlay encode stage times the image file encoding rather than a second render."""
+    # Given an encode stage that must not render the overlay again
+    calls = []
+    monkeypatch.setattr(FbrSam, "encode", lambda *_: pytest.fail("Overlay rendered twice"))
+    encode_overlay = py_sam.output.encode_overlay
+    monkeypatch.setattr(
+        py_sam.output,
+        "encode_overlay",
+        lambda *args, **kwargs: calls.append(args[1]) or encode_overlay(*args, **kwargs),
+    )
+
+    # when I run the benchmark in overlay output mode with JPEG files
+    report = run(
+        [HieraTiny],
+        resolutions=(128,),
+        isolate=False,
+        file_format="JPEG",
+        output_mode="overlay",
+        mask_settings={"points_per_side": 4},
+    )
+
+    # then the overlay should have been encoded as a JPEG file
+    assert calls == ["JPEG"]
+    assert report["settings"]["file_format"] == "JPEG"
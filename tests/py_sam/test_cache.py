@@ -0,0 +1,126 @@
+"""Content-addressed SAM 2 mask result cache unit tests."""
+
+import os
+from pathlib import Path
+
+import fsspec
+import numpy as np
+import pytest
+
+from py_sam.cache import MaskCache
+
+
+def _masks() -> list[dict]:
+    """Build a SAM 2 mask record with a binary mask segmentation."""
+    segmentation = np.zeros((3, 4), dtype=bool)
+    segmentation[1:, :2] = True
+
+    return [
+        {
+            "segmentation": segmentation,
+            "area": 4,
+            "bbox": [0.0, 1.0, 2.0, 2.0],
+            "predicted_iou": 0.9,
+            "point_coords": [[1.0, 1.5]],
+            "stability_score": 0.95,
+            "crop_box": [0.0, 0.0, 4.0, 3.0],
+        }
+    ]
+
+
+def test_mask_cache_key() -> None:
+    """Cache keys depend on the image content, model type and settings."""
+    # Given an image
+    image = np.zeros((3, 4, 3), dtype=np.uint8)
+    key = MaskCache.key(image, "hiera_t", {"pred_iou_thresh": 0.8})
+
+    # the same inputs should give the same key
+    assert key == MaskCache.key(image.copy(), "hiera_t", {"pred_iou_thresh": 0.8})
+
+    # and any change should give a different key
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+    assert key != MaskCache.key(changed, "hiera_t", {"pred_iou_thresh": 0.8})
+    assert key != MaskCache.key(image, "hiera_l", {"pred_iou_thresh": 0.8})
+    assert key != MaskCache.key(image, "hiera_t", {"pred_iou_thresh": 0.7})
+
+
+def test_mask_cache_get_put(tmp_path: Path) -> None:
+    """Round trip mask records through the cache."""
+    # Given a mask cache
+    cache = MaskCache(str(tmp_path), fsspec.filesystem("file"))
+
+    # when I look up a key that has not been stored
+    # then I should get a miss
+    assert cache.get("abc123") is None
+
+    # when I store and look up the mask records
+    cache.put("abc123", _masks())
+    cached = cache.get("abc123")
+
+    # then the segmentation should come back as an uncompressed RLE
+    assert cached is not None
+    assert cached[0]["segmentation"] == {"size": [3, 4], "counts": [1, 2, 1, 2, 6]}
+    assert cached[0]["area"] == _masks()[0]["area"]
+
+    # and the counters should record one hit and one miss
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_mask_cache_evict(tmp_path: Path) -> None:
+    """Evict the least recently used entries beyond the size limit."""
+    # Given a mask cache with three entries
+    cache = MaskCache(str(tmp_path), fsspec.filesystem("file"))
+    for age, key in enumerate(("aa01", "bb02", "cc03")):
+        cache.put(key, _masks())
+        os.utime(cache.path(key), (1000 + age, 1000 + age))
+
+    # and the oldest entry recently used
+    bounded = MaskCache(
+        str(tmp_path),
+        fsspec.filesystem("file"),
+        max_bytes=2 * os.path.getsize(cache.path("aa01")),
+    )
+    bounded.get("aa01")
+
+    # when I evict down to the size of two entries
+    evicted = bounded.evict()
+
+    # then only the least recently used entry should be removed
+    assert evicted == 1
+    assert bounded.get("bb02") is None
+    assert bounded.get("aa01") is not None
+    assert bounded.get("cc03") is not None
+
+
+def test_mask_cache_put_evicts_every_interval(tmp_path: Path) -> None:
+    """Check the cache size on every write with an eviction interval of 1."""
+    # Given a mask cache bounded to the size of one entry that checks on every write
+    probe = MaskCache(str(tmp_path / "probe"), fsspec.filesystem("file"))
+    probe.put("aa01", _masks())
+    cache = MaskCache(
+        str(tmp_path / "cache"),
+        fsspec.filesystem("file"),
+        max_bytes=os.path.getsize(probe.path("aa01")),
+        evict_interval=1,
+    )
+
+    # when I store two entries
+    cache.put("aa01", _masks())
+    os.utime(cache.path("aa01"), (1000, 1000))
+    cache.put("bb02", _masks())
+
+    # then the older entry should be evicted on the second write
+    assert not os.path.exists(cache.path("aa01"))
+    assert os.path.exists(cache.path("bb02"))
+
+
+def test_mask_cache_rejects_evict_interval(tmp_path: Path) -> None:
+    """Reject eviction intervals below 1."""
+    # Given a filesystem
+    filesystem = fsspec.filesystem("file")
+
+    # when I create a cache that never checks its size
+    # then it should be rejected
+    with pytest.raises(ValueError, match="at least 1"):
+        MaskCache(str(tmp_path), filesystem, max_bytes=1, evict_interval=0)
@@ -0,0 +1,72 @@
+"""Memory mapped checkpoint unit tests."""
+
+import threading
+from pathlib import Path
+from typing import Any
+
+import pytest
+import torch
+
+from py_sam.checkpoint import build_mmap, export
+from py_sam.model.hiera import HieraTiny
+
+
+def test_build_mmap(sam2_tiny: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Weights are memory mapped from a copy of the checkpoint in the model cache."""
+    # Given a Hiera Tiny checkpoint in the model cache
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    model = HieraTiny()
+    torch.save({"model": sam2_tiny.state_dict()}, model.checkpoint)
+
+    # when I build the memory mapped model
+    sam = build_mmap(model)
+
+    # then the memory mappable copy should be cached next to the checkpoint
+    assert model.mmap_checkpoint == tmp_path / "sam2_hiera_tiny.mmap.pt"
+
+    # and the weights should be mapped from the copy
+    with open("/proc/self/maps", encoding="utf-8") as maps:
+        assert str(model.mmap_checkpoint) in maps.read()
+
+    # and the model should match the checkpoint
+    expected = sam2_tiny.state_dict()
+    for name, tensor in sam.state_dict().items():
+        torch.testing.assert_close(tensor, expected[name])
+
+
+def test_export_skips_existing(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The memory mappable copy is made once."""
+    # Given a cached memory mappable copy without the checkpoint
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    model = HieraTiny()
+    torch.save({}, model.mmap_checkpoint)
+
+    # when I export the copy
+    export(model)
+
+    # then the checkpoint should not be needed
+    assert not model.checkpoint.exists()
+
+
+def test_concurrent_export(sam2_tiny: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Concurrent exports of a checkpoint save the memory mappable copy once."""
+    # Given a Hiera Tiny checkpoint in the model cache
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    model = HieraTiny()
+    torch.save({"model": sam2_tiny.state_dict()}, model.checkpoint)
+
+    # and a count of the copies saved
+    saved = []
+    save = torch.save
+    monkeypatch.setattr(torch, "save", lambda obj, path: saved.append(path) or save(obj, path))
+
+    # when several workers on a cold node all export the copy
+    workers = [threading.Thread(target=export, args=(HieraTiny(),)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # then the copy should have been saved once
+    assert len(saved) == 1
+    assert model.mmap_checkpoint.is_file()
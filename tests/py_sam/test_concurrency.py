@@ -0,0 +1,90 @@
+"""Pipeline stage concurrency unit tests."""
+
+import pytest
+
+import py_sam.concurrency
+from py_sam.concurrency import ConcurrencySettings, StageConcurrency, auto_size, resolve
+
+
+def test_stage_concurrency_fixed_pool() -> None:
+    """Inference runs in a fixed size pool without a max."""
+    # Given a stage concurrency without an inference max
+    inference_min = 2
+    concurrency = StageConcurrency(read=4, inference_min=inference_min, write=3)
+
+    # then the inference actor pool should have a fixed size
+    assert concurrency.inference == inference_min
+    assert (concurrency.read, concurrency.write) == (4, 3)
+
+
+def test_stage_concurrency_autoscaling_pool() -> None:
+    """Inference runs in an autoscaling pool with a max."""
+    # Given a stage concurrency with an inference max
+    concurrency = StageConcurrency(inference_min=1, inference_max=8)
+
+    # then the inference actor pool should autoscale between min and max
+    assert concurrency.inference == (1, 8)
+
+
+@pytest.mark.parametrize("kwargs", [{"read": 0}, {"write": 0}, {"inference_min": 4, "inference_max": 2}])
+def test_stage_concurrency_invalid(kwargs: dict) -> None:
+    """Invalid stage concurrency is rejected."""
+    # Given an invalid stage concurrency
+    # when I initialise a StageConcurrency
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        StageConcurrency(**kwargs)
+
+
+def test_auto_size_cpu_cluster() -> None:
+    """CPU clusters set a quarter of the CPUs aside for I/O."""
+    # Given a 16 CPU cluster
+    resources = {"CPU": 16.0, "memory": 2.0**35}
+
+    # when I size the stage concurrency with 2 CPUs per inference actor
+    concurrency = auto_size(resources, num_cpus=2)
+
+    # then I/O should get a quarter of the CPUs and inference the rest
+    assert (concurrency.read, concurrency.write) == (4, 4)
+    assert concurrency.inference == (1, 6)
+
+
+def test_auto_size_gpu_cluster() -> None:
+    """GPU clusters scale the inference actor pool with the GPUs."""
+    # Given an 8 CPU, 4 GPU cluster
+    resources = {"CPU": 8.0, "GPU": 4.0}
+
+    # when I size the stage concurrency
+    concurrency = auto_size(resources)
+
+    # then inference should scale up to one actor per GPU
+    assert concurrency.inference == (1, 4)
+    assert (concurrency.read, concurrency.write) == (4, 4)
+
+
+def test_resolve_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Stage concurrency falls back to the environment."""
+    # Given per stage environment variables over a shared concurrency
+    monkeypatch.setenv("PY_SAM__CONCURRENCY", "2")
+    monkeypatch.setenv("PY_SAM__READ_CONCURRENCY", "6")
+    monkeypatch.setenv("PY_SAM__INFERENCE_MAX_CONCURRENCY", "5")
+
+    # when I resolve the stage concurrency with an explicit write concurrency
+    concurrency = resolve(ConcurrencySettings(write=3))
+
+    # then each stage should take the most specific setting
+    assert (concurrency.read, concurrency.write) == (6, 3)
+    assert concurrency.inference == (2, 5)
+
+
+def test_resolve_auto(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Unset stages are sized from the cluster resources."""
+    # Given an 8 CPU cluster
+    monkeypatch.setattr(py_sam.concurrency.ray, "cluster_resources", lambda: {"CPU": 8.0})
+
+    # when I resolve the stage concurrency with auto sizing and a read concurrency
+    concurrency = resolve(ConcurrencySettings(read=4, auto=True))
+
+    # then the unset stages should be sized from the cluster
+    assert (concurrency.read, concurrency.write) == (4, 2)
+    assert concurrency.inference == (1, 6)
@@ -0,0 +1,54 @@
+"""Resolution-aware source image decoding unit tests."""
+
+from pathlib import Path
+
+import pytest
+
+from py_sam.decode import decode_image, decode_row, scaled_size
+
+SCALED_SIZE_ARGS: tuple = (
+    (2560, 2560, 1024, (1024, 1024)),
+    (510, 1020, 256, (128, 256)),
+    (373, 295, 1024, (373, 295)),
+)
+
+
+@pytest.mark.parametrize("height,width,max_side,expected", SCALED_SIZE_ARGS)
+def test_scaled_size(height: int, width: int, max_side: int, expected: tuple[int, int]) -> None:
+    """Cap the longer side and preserve the aspect ratio."""
+    # Given a source image size and a max side
+
+    # when I scale the size
+    size = scaled_size(height, width, max_side)
+
+    # then I should receive the capped size
+    assert size == expected
+
+
+def test_decode_image_jpeg_reduced(data_dir: Path) -> None:
+    """Decode a JPEG at reduced resolution."""
+    # Given a 2560x2560 JPEG source image
+    data = (data_dir / "jpeg" / "3da0b873-fdde-4faf-9a85-021248c7dacf.jpg").read_bytes()
+
+    # when I decode the image with a max side
+    image, height, width = decode_image(data, max_side=600)
+
+    # then the image should be decoded at the capped size in RGB
+    assert image.shape == (600, 600, 3)
+
+    # and the source image size should be preserved
+    assert (height, width) == (2560, 2560)
+
+
+def test_decode_row_full_resolution(data_dir: Path) -> None:
+    """Decode a Ray binary file row at full resolution."""
+    # Given a Ray binary file row for an RGBA PNG
+    row = {"path": "cat.png", "bytes": (data_dir / "png" / "cat.png").read_bytes()}
+
+    # when I decode the row without a max side
+    decoded = decode_row(row)
+
+    # then the image should replace the bytes at full resolution in RGB
+    assert "bytes" not in decoded
+    assert decoded["image"].shape == (373, 295, 3)
+    assert (decoded["original_height"], decoded["original_width"]) == (373, 295)
@@ -0,0 +1,102 @@
+"""Near-duplicate image grouping unit tests."""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from py_sam.dedup import DuplicateIndex, distance, phash
+
+# Hamming distances that separate near-duplicates from different images.
+NEAR_DISTANCE = 4
+FAR_DISTANCE = 16
+
+
+@pytest.fixture
+def cat(data_dir: Path) -> np.ndarray:
+    """RGB cat test image."""
+    return cv2.cvtColor(cv2.imread(str(data_dir / "png" / "cat.png")), cv2.COLOR_BGR2RGB)
+
+
+def noisy(image: np.ndarray, seed: int) -> np.ndarray:
+    """Copy of `image` with sensor noise added."""
+    noise = np.random.default_rng(seed).integers(-6, 7, image.shape)
+
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def test_phash_near_duplicates(cat: np.ndarray) -> None:
+    """Near-duplicate images hash within a few bits of each other."""
+    # Given an image, a noisy copy of it and a different image
+    other = cv2.rotate(cat, cv2.ROTATE_180)
+
+    # when I hash the images
+    cat_hash = phash(cat)
+
+    # then the noisy copy should be near the image
+    assert distance(cat_hash, phash(noisy(cat, 0))) <= NEAR_DISTANCE
+
+    # and the different image should be far from it
+    assert distance(cat_hash, phash(other)) > FAR_DISTANCE
+
+
+def test_group_within_batch(cat: np.ndarray) -> None:
+    """Near-duplicates in a batch are grouped under the first image."""
+    # Given a batch of a frame, its noisy copy and a different frame
+    images = [cat, noisy(cat, 1), cv2.rotate(cat, cv2.ROTATE_180)]
+    names = ["frame_0.png", "frame_1.png", "frame_2.png"]
+    index = DuplicateIndex(max_distance=6)
+
+    # when I group the batch
+    leaders, duplicates = index.group(images, names, [0, 1, 2])
+
+    # then masks should only be generated for the first and the different frame
+    assert list(leaders) == [0, 2]
+    assert leaders[0] == phash(cat)
+    assert duplicates[1].leader == 0
+    assert duplicates[1].representative == "frame_0.png"
+    assert index.duplicates == 1
+
+
+def test_group_with_held_representatives(cat: np.ndarray) -> None:
+    """Near-duplicates of a representative held reuse its masks."""
+    # Given an index holding the masks of a frame
+    index = DuplicateIndex(max_distance=6)
+    masks = [{"area": 10}]
+    index.add(cat, "frame_0.png", masks)
+
+    # when I group its noisy copy and the same frame at another size
+    resized = cv2.resize(cat, (cat.shape[1] // 2, cat.shape[0] // 2))
+    leaders, duplicates = index.group([noisy(cat, 2), resized], ["frame_1.png", "frame_2.png"], [0, 1])
+
+    # then the noisy copy should reuse the masks
+    assert duplicates[0].masks is masks
+
+    # and images of another size should not be grouped
+    assert list(leaders) == [1]
+
+
+def test_window_evicts_least_recently_matched(cat: np.ndarray) -> None:
+    """Only the most recently matched representatives are held."""
+    # Given an index holding one representative
+    index = DuplicateIndex(max_distance=6, window=1)
+    index.add(cat, "frame_0.png", [])
+
+    # when I hold another representative
+    index.add(cv2.rotate(cat, cv2.ROTATE_180), "frame_1.png", [])
+
+    # then the first should be evicted
+    leaders, _ = index.group([cat], ["frame_2.png"], [0])
+    assert len(index) == 1
+    assert list(leaders) == [0]
+
+
+@pytest.mark.parametrize("max_distance, window", [(-1, 8), (65, 8), (6, 0)])
+def test_duplicate_index_invalid(max_distance: int, window: int) -> None:
+    """Out of range settings are rejected."""
+    # Given out of range settings
+    # when I build an index
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        DuplicateIndex(max_distance, window=window)
@@ -0,0 +1,172 @@
+"""Streaming source image discovery unit tests."""
+
+from pathlib import Path
+from typing import Any
+
+import fsspec
+import pyarrow as pa
+import pytest
+from s3fs import S3FileSystem  # type: ignore[import-untyped]
+
+from py_sam.discovery import (
+    SourceSettings,
+    iter_image_pages,
+    load_row,
+    pending_batch,
+    read_image_paths,
+    read_input_manifest,
+    s3_pages,
+)
+from py_sam.fbr_sam import FbrSam, ImageFilenameProvider
+
+
+class ListObjectsV2:
+    """S3 filesystem double that serves `list_objects_v2` pages of a key listing."""
+
+    def __init__(self, keys: list[str]) -> None:
+        """Initialise a ListObjectsV2 instance."""
+        self.keys = keys
+        self.calls: list[dict[str, Any]] = []
+
+    def call_s3(self, method: str, **kwargs: Any) -> dict[str, Any]:
+        """Serve one listing page."""
+        self.calls.append(kwargs)
+        start = int(kwargs.get("ContinuationToken", 0))
+        end = start + kwargs["MaxKeys"]
+        response: dict[str, Any] = {
+            "Contents": [{"Key": key} for key in self.keys[start:end]],
+            "IsTruncated": end < len(self.keys),
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(end)
+
+        return response
+
+
+def test_s3_pages() -> None:
+    """S3 prefixes are listed one page at a time."""
+    # Given a prefix of five objects
+    filesystem = ListObjectsV2([f"images/{index}.png" for index in range(5)])
+
+    # when I page through the listing two keys at a time
+    pages = s3_pages(filesystem, "bucket/images", page_size=2)  # type: ignore[arg-type]
+
+    # then the first page should be served before the rest of the listing
+    assert next(pages) == ["bucket/images/0.png", "bucket/images/1.png"]
+    assert len(filesystem.calls) == 1
+
+    # and the remaining pages should follow the continuation token
+    assert list(pages) == [
+        ["bucket/images/2.png", "bucket/images/3.png"],
+        ["bucket/images/4.png"],
+    ]
+    assert filesystem.calls[0]["Prefix"] == "images/"
+    assert filesystem.calls[-1]["ContinuationToken"] == "4"
+
+
+def test_iter_image_pages(data_dir: Path) -> None:
+    """Image files under a prefix are streamed in pages."""
+    # Given a source data path of four images
+    source_data_path = str(data_dir)
+
+    # when I stream the images three at a time
+    pages = list(iter_image_pages(source_data_path, fsspec.filesystem("file"), page_size=3))
+
+    # then I should receive every image in pages of at most three
+    assert [len(page) for page in pages] == [3, 1]
+    assert sorted(Path(path).name for page in pages for path in page) == [
+        "3da0b873-fdde-4faf-9a85-021248c7dacf.jpg",
+        "augsburg_000000_000000_leftImg8bit.png",
+        "cat.png",
+        "dog.png",
+    ]
+
+
+def test_iter_image_pages_s3_object(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A source that names a single S3 object is streamed as that object."""
+    # Given an S3 filesystem holding one image object
+    filesystem = S3FileSystem(anon=True, skip_instance_cache=True)
+    monkeypatch.setattr(filesystem, "isfile", lambda path: path == "bucket/dir/cat.png")
+    monkeypatch.setattr(filesystem, "call_s3", ListObjectsV2([]).call_s3)
+
+    # when I stream the images of the object URI
+    pages = list(iter_image_pages("s3://bucket/dir/cat.png", filesystem))
+
+    # then I should receive the object
+    assert pages == [["s3://bucket/dir/cat.png"]]
+
+
+def test_read_image_paths(ray_session: None, data_dir: Path) -> None:
+    """The image listing is a Ray dataset of paths."""
+    # Given a source data path
+    source_data_path = str(data_dir / "png")
+
+    # when I read the image paths
+    dataset = read_image_paths(source_data_path, fsspec.filesystem("file"))
+
+    # then I should receive a path row per image
+    assert sorted(Path(row["path"]).name for row in dataset.take_all()) == [
+        "augsburg_000000_000000_leftImg8bit.png",
+        "cat.png",
+        "dog.png",
+    ]
+
+
+def test_read_text_input_manifest(ray_session: None, data_dir: Path, tmp_path: Path) -> None:
+    """Text input manifests list one image URI per line."""
+    # Given a text input manifest with blank lines and comments
+    manifest = tmp_path / "images.txt"
+    manifest.write_text(f"# source images\n{data_dir / 'png' / 'cat.png'}\n\n{data_dir / 'png' / 'dog.png'}\n")
+
+    # when I read the input manifest
+    dataset = read_input_manifest(str(manifest), fsspec.filesystem("file"))
+
+    # then I should receive a path row per image URI
+    assert [Path(row["path"]).name for row in dataset.take_all()] == [
+        "cat.png",
+        "dog.png",
+    ]
+
+
+def test_pending_batch(data_dir: Path) -> None:
+    """Discovered images with a result are filtered out."""
+    # Given a block of discovered image URIs, one of which is complete
+    cat, dog = (f"file://{data_dir / 'png' / name}" for name in ("cat.png", "dog.png"))
+    batch = pa.table({"path": [cat, dog]})
+
+    # when I filter the block
+    pending = pending_batch(
+        batch,
+        completed={str(data_dir / "png" / "cat.png")},
+        existing_outputs=set(),
+        filename_provider=ImageFilenameProvider(file_extension="json"),
+        flatten_output=True,
+    )
+
+    # then only the incomplete image URI should remain
+    assert pending.column("path").to_pylist() == [dog]
+
+
+def test_load_row(data_dir: Path) -> None:
+    """Path rows are read and decoded."""
+    # Given a path row
+    path = str(data_dir / "png" / "cat.png")
+
+    # when I load the row
+    max_side = 64
+    row = load_row({"path": f"file://{path}"}, FbrSam.filesystem, max_side=max_side)
+
+    # then I should receive the decoded RGB image under the scheme-less path
+    assert row["path"] == path
+    assert max(row["image"].shape[:2]) == max_side
+    assert row["image"].shape[2] == len("RGB")
+    assert (row["original_height"], row["original_width"]) > (max_side, max_side)
+
+
+def test_source_settings_requires_one_input() -> None:
+    """Batch runs read either a source data path or an input manifest."""
+    # Given both a source data path and an input manifest
+    # when I initialise the source settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        SourceSettings("images/", input_manifest="images.txt")
@@ -0,0 +1,99 @@
+"""SAM 2 model execution mode unit tests."""
+
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from py_sam.execution import (
+    BF16,
+    FP32,
+    ExecutionSettings,
+    compile_image_encoder,
+    execution_context,
+    time_image_encoder,
+)
+
+
+def test_execution_context_bf16_inference_mode() -> None:
+    """Run under bfloat16 autocast and inference mode."""
+    # Given a CPU execution context with bf16 precision and inference mode
+    # when I run a matrix multiply in the context
+    with execution_context("cpu", BF16, inference_mode=True):
+        output = torch.ones(2, 2) @ torch.ones(2, 2)
+
+        # then inference mode should be enabled
+        assert torch.is_inference_mode_enabled()
+
+    # and the output computed in bfloat16
+    assert output.dtype == torch.bfloat16
+
+
+def test_execution_context_default() -> None:
+    """The default execution context leaves float32 eager execution untouched."""
+    # Given the default CPU execution context
+    # when I run a matrix multiply in the context
+    with execution_context("cpu"):
+        output = torch.ones(2, 2) @ torch.ones(2, 2)
+        assert not torch.is_inference_mode_enabled()
+
+    # then the output should be float32
+    assert output.dtype == torch.float32
+
+
+def test_execution_context_invalid_precision() -> None:
+    """Unknown precisions are rejected."""
+    # Given an unknown precision
+    # when I enter the execution context
+    # then I should receive an error
+    with pytest.raises(ValueError), execution_context("cpu", "fp8"):
+        pass
+
+
+def test_execution_settings_from_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Unset execution modes fall back to the environment."""
+    # Given a bf16 precision and a list of quantized models in the environment
+    monkeypatch.setenv("PY_SAM__PRECISION", BF16)
+    monkeypatch.setenv("PY_SAM__QUANTIZE", "hiera_b, hiera_l")
+
+    # when I resolve the execution settings with an inference mode override
+    settings = ExecutionSettings.from_environment("hiera_l", inference_mode=True, quantize=None)
+
+    # then the override should take precedence over the environment
+    assert settings == ExecutionSettings(precision=BF16, inference_mode=True, quantize=True)
+
+
+def test_compile_image_encoder() -> None:
+    """Compile the image encoder forward and keep its output."""
+    # Given a model with a small image encoder
+    encoder = torch.nn.Conv2d(3, 4, kernel_size=3, padding=1)
+    sam = SimpleNamespace(image_size=8, image_encoder=encoder)
+    image = torch.rand(1, 3, 8, 8)
+    with torch.no_grad():
+        expected = encoder(image)
+
+    # when I compile the image encoder
+    compile_image_encoder(sam, "cpu", FP32, inference_mode=True)  # type: ignore[arg-type]
+
+    # then the encoder forward should be compiled
+    assert sam.image_encoder is encoder
+    assert "forward" in vars(encoder)
+
+    # and produce the same output
+    with torch.no_grad():
+        torch.testing.assert_close(encoder(image), expected)
+
+
+def test_time_image_encoder() -> None:
+    """The image encoder is timed over several runs."""
+    # Given a model with an image encoder that counts its runs
+    runs = []
+    sam = SimpleNamespace(image_encoder=runs.append)
+
+    # when I time the image encoder
+    iterations = 4
+    seconds = time_image_encoder(sam, torch.zeros(1), "cpu", iterations=iterations)  # type: ignore[arg-type]
+
+    # then the encoder should run once per iteration
+    assert len(runs) == iterations
+    assert seconds >= 0
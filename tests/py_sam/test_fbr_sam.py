@@ -1,11 +1,20 @@
 """Segment Anything Model 2 (SAM 2) unit tests."""
 
+import json
 from pathlib import Path
+from typing import Any, cast
 
+import cv2
 import numpy as np
 import pytest
 import ray
-from py_sam.fbr_sam import FbrSam, ImageFilenameProvider
+
+from py_sam.dedup import DedupSettings
+from py_sam.discovery import SourceSettings
+from py_sam.fbr_sam import FbrSam, FbrSamSettings, ImageFilenameProvider
+from py_sam.model.hiera import HieraTiny
+from py_sam.output import COCO_RLE, OutputSettings
+from py_sam.profiles import BALANCED
 
 
 def test_fbr_sam_init() -> None:
@@ -17,6 +26,32 @@ def test_fbr_sam_init() -> None:
     assert isinstance(sam, FbrSam), "Object is not a FbrSam instance"
 
 
+def test_fbr_sam_profile() -> None:
+    """The mask generation profile name is not shadowed by the profiling context."""
+    # Given an initialised FbrSam with the default profile
+    sam = FbrSam()
+
+    # when I get the profile
+    # then I should receive the profile name
+    assert sam.settings.profile == BALANCED
+
+
+@pytest.mark.skipif(
+    not (Path.home() / ".cache" / "py-sam" / "models" / "sam2_hiera_large.pt").exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+def test_mask_generator_built_once() -> None:
+    """SAM 2 model and mask generator are built once per FbrSam instance."""
+    # Given an initialised a FbrSam
+    sam = FbrSam()
+
+    # when I access the mask generator more than once
+    mask_generator = sam.mask_generator
+
+    # then I should receive the same mask generator instance
+    assert sam.mask_generator is mask_generator, "Mask generator was rebuilt"
+
+
 @pytest.mark.skipif(
     not (Path.home() / ".cache" / "py-sam" / "models" / "sam2_hiera_large.pt").exists(),
     reason="Unable to find SAM 2 pre-trained weights.",
@@ -30,6 +65,49 @@ def test_generate_masks(data_dir: Path) -> None:
     sam.generate_masks(image=source_image, image_name=source_image.name)
 
 
+@pytest.mark.skipif(
+    not HieraTiny().checkpoint.exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+def test_generate_batch_masks_near_duplicates(data_dir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Near-duplicate images share one mask generation."""
+    # Given an image and its copy with one pixel changed
+    image = cv2.cvtColor(cv2.imread(str(data_dir / "png" / "cat.png")), cv2.COLOR_BGR2RGB)
+    copy = image.copy()
+    copy[0, 0] = 255 - copy[0, 0]
+
+    # and a FbrSam that groups near-duplicates, counting the images it generates masks for
+    sam = FbrSam(
+        model=HieraTiny,
+        settings=FbrSamSettings(output_mode=COCO_RLE, mask_settings={"points_per_side": 4}, dedup=DedupSettings(4)),
+    )
+    generated: list[int] = []
+    generate = sam.mask_generator.generate
+
+    def count_generate(image: np.ndarray) -> list[dict[str, Any]]:
+        generated.append(1)
+        return generate(image)
+
+    monkeypatch.setattr(sam.mask_generator, "generate", count_generate)
+
+    # when I generate the masks of both images in one batch
+    images = [image, copy]
+    outputs = sam.generate_batch_masks(images=images, image_names=["frame_0.png", "frame_1.png"])
+
+    # then the masks should be generated once
+    assert len(generated) == 1
+    assert sam.dedup is not None and sam.dedup.duplicates == 1
+
+    # and each image should receive its own output, with the same masks
+    assert len(outputs) == len(images)
+    documents = [json.loads(cast(bytes, output)) for output in outputs]
+    assert [document["image"]["file_name"] for document in documents] == [
+        "frame_0.png",
+        "frame_1.png",
+    ]
+    assert documents[0]["annotations"] == documents[1]["annotations"]
+
+
 FILENAME_FORMAT_ARGS: tuple = (
     "PNG",
     "JPEG",
@@ -41,19 +119,15 @@ FILENAME_FORMAT_ARGS: tuple = (
     reason="Unable to find SAM 2 pre-trained weights.",
 )
 @pytest.mark.parametrize("filename_format_args", FILENAME_FORMAT_ARGS)
-def test_ray_process(
-    data_dir: Path, tmp_path: Path, filename_format_args: str, ray_session: None
-) -> None:
+def test_ray_process(data_dir: Path, tmp_path: Path, filename_format_args: str, ray_session: None) -> None:
     """Ray SAM 2 batch processing."""
     # Given a source directory path
     source_data_path = str(data_dir / filename_format_args.lower())
 
     # when I batch process the SAM 2 mask generation
     FbrSam.process(
-        source_data_path=source_data_path,
-        output_path=f"file://{tmp_path}",
-        flatten_output=True,
-        file_format=filename_format_args,
+        SourceSettings(source_data_path),
+        OutputSettings(f"file://{tmp_path}", flatten=True, file_format=filename_format_args),
     )
 
 
@@ -63,14 +137,10 @@ def test_image_convert_from_ray_ingest(data_dir: Path) -> None:
     dset = ray.data.read_images(data_dir, include_paths=True)
 
     # when I attempt to standardise the input image sources as Numpy arrays
-    converted_images = [
-        FbrSam.image_convert(image=row.get("image")) for row in dset.iter_rows()
-    ]
+    converted_images = [FbrSam.image_convert(image=row.get("image")) for row in dset.iter_rows()]
 
     # then the images should remain as Numpy arrays
-    assert all(
-        isinstance(x, np.ndarray) for x in converted_images
-    ), "Converted images are not all Numpy arrays."
+    assert all(isinstance(x, np.ndarray) for x in converted_images), "Converted images are not all Numpy arrays."
 
 
 def test_image_convert_from_image_path_ingest(data_dir: Path) -> None:
@@ -82,9 +152,7 @@ def test_image_convert_from_image_path_ingest(data_dir: Path) -> None:
     converted_image = FbrSam.image_convert(image=source_image)
 
     # then the images should be converted into a Numpy array
-    assert isinstance(
-        converted_image, np.ndarray
-    ), "Converted images not a Numpy array."
+    assert isinstance(converted_image, np.ndarray), "Converted images not a Numpy array."
 
 
 def test_image_filename_provider_init() -> None:
@@ -93,9 +161,29 @@ def test_image_filename_provider_init() -> None:
     filename_provider = ImageFilenameProvider()
 
     # I should get a FbrSam instance
-    assert isinstance(
-        filename_provider, ImageFilenameProvider
-    ), "Object is not a ImageFilenameProvider instance"
+    assert isinstance(filename_provider, ImageFilenameProvider), "Object is not a ImageFilenameProvider instance"
+
+
+FILENAME_PROVIDER_ARGS: tuple = (
+    ({}, "images/abc/myimage_masks.png"),
+    ({"file_extension": ".json"}, "images/abc/myimage_masks.json"),
+    ({"file_extension": ".npz", "mask_symbol": "sam"}, "images/abc/myimage_sam.npz"),
+)
+
+
+@pytest.mark.parametrize("filename_provider_kwargs,filename_expected", FILENAME_PROVIDER_ARGS)
+def test_image_filename_provider_file_extension(filename_provider_kwargs: dict, filename_expected: str) -> None:
+    """Customised filename generator with file extension override."""
+    # Given an initialised ImageFilenameProvider
+    filename_provider = ImageFilenameProvider(**filename_provider_kwargs)
+
+    # when I generate the filename for a row
+    filename = filename_provider.get_filename_for_row(
+        {"path": "tester/images/abc/myimage.png", "flatten_output": False}, 0, 0, 0
+    )
+
+    # then I should receive the masked filename with the expected extension
+    assert filename == filename_expected
 
 
 FILENAME_SPLITTER_ARGS: tuple = (
@@ -132,9 +220,7 @@ FILENAME_SPLITTER_ARGS: tuple = (
 )
 
 
-@pytest.mark.parametrize(
-    "filename_splitter_kwargs,filename_splitter_expected", FILENAME_SPLITTER_ARGS
-)
+@pytest.mark.parametrize("filename_splitter_kwargs,filename_splitter_expected", FILENAME_SPLITTER_ARGS)
 def test_filename_splitter(
     filename_splitter_kwargs: dict,
     filename_splitter_expected: tuple[str, str, list],
@@ -148,3 +234,16 @@ def test_filename_splitter(
 
     # then I should receive the individual file components.
     assert filename_parts == filename_splitter_expected
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"output_mode": "png"}, {"profile": "fastest"}, {"mask_settings": {"points_per_sides": 4}}],
+)
+def test_fbr_sam_settings_invalid(kwargs: dict) -> None:
+    """Invalid settings are rejected before any model is built."""
+    # Given an unsupported output mode, profile or mask generator setting
+    # when I initialise the FbrSam settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        FbrSamSettings(**kwargs)
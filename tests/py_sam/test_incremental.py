@@ -0,0 +1,107 @@
+"""Incremental (resumable) batch run unit tests."""
+
+from pathlib import Path
+
+import fsspec
+import pandas as pd
+import pyarrow as pa
+import ray
+
+from py_sam.fbr_sam import ImageFilenameProvider
+from py_sam.incremental import (
+    Manifest,
+    ManifestDatasink,
+    list_images,
+    list_outputs,
+    pending_images,
+)
+from py_sam.output import MaskDatasink
+
+
+def test_list_images(data_dir: Path) -> None:
+    """List the image files under a prefix."""
+    # Given a source data path
+    source_data_path = str(data_dir)
+
+    # when I list the images
+    paths = list_images(source_data_path, fsspec.filesystem("file"))
+
+    # then I should receive all of the image files
+    assert [Path(path).name for path in paths] == [
+        "3da0b873-fdde-4faf-9a85-021248c7dacf.jpg",
+        "augsburg_000000_000000_leftImg8bit.png",
+        "cat.png",
+        "dog.png",
+    ]
+
+
+def test_manifest_append(tmp_path: Path) -> None:
+    """Record completed input paths across manifest shards."""
+    # Given a manifest
+    manifest = Manifest(f"file://{tmp_path}/_manifest", fsspec.filesystem("file"))
+
+    # when I append completed paths over more than one shard
+    manifest.append(["a/cat.png", "a/dog.png"])
+    manifest.append(["a/cat.png", "b/fish.png"])
+    manifest.append([])
+
+    # then the completed paths should be the union of the shards
+    assert manifest.completed() == {"a/cat.png", "a/dog.png", "b/fish.png"}
+
+
+def test_pending_images(tmp_path: Path) -> None:
+    """Filter out input images in the manifest or with an existing output."""
+    # Given an output location with an existing result
+    (tmp_path / "cat_masks.json").write_text("{}")
+    existing_outputs = list_outputs(str(tmp_path), fsspec.filesystem("file"))
+
+    # when I filter the source images
+    pending = pending_images(
+        ["in/cat.png", "in/dog.png", "in/fish.png"],
+        completed={"in/dog.png"},
+        existing_outputs=existing_outputs,
+        filename_provider=ImageFilenameProvider(file_extension=".json"),
+        flatten_output=True,
+    )
+
+    # then only the unprocessed images should remain
+    assert pending == ["in/fish.png"]
+
+
+def test_manifest_datasink(tmp_path: Path, ray_session: None) -> None:
+    """Record the input paths of written rows in the manifest."""
+    # Given a dataset of encoded masks
+    dataset = ray.data.from_items([
+        {"path": f"in/{name}.png", "flatten_output": True, "masks": b"{}"} for name in ("cat", "dog")
+    ])
+
+    # and a manifest
+    manifest = Manifest(str(tmp_path / "_manifest"), fsspec.filesystem("file"))
+
+    # when I write the dataset through the manifest datasink
+    dataset.write_datasink(
+        ManifestDatasink(
+            MaskDatasink(
+                str(tmp_path),
+                filename_provider=ImageFilenameProvider(file_extension=".json"),
+            ),
+            manifest,
+        )
+    )
+
+    # then the outputs should be written
+    assert {"cat_masks.json", "dog_masks.json"} <= list_outputs(str(tmp_path), fsspec.filesystem("file"))
+
+    # and the input paths recorded in the manifest
+    assert manifest.completed() == {"in/cat.png", "in/dog.png"}
+
+
+def test_manifest_datasink_paths() -> None:
+    """Input paths are read from Arrow and pandas blocks."""
+    # Given blocks of decoded images
+    rows = {"path": ["in/cat.png", "in/dog.png"], "image": [b"\x00" * 8] * 2}
+
+    # when I read the input paths of the blocks
+    # then only the paths should be returned
+    for block in (pa.table(rows), pd.DataFrame(rows)):
+        assert ManifestDatasink.paths(block) == ["in/cat.png", "in/dog.png"]
@@ -0,0 +1,97 @@
+"""SAM 2 batched automatic mask generation unit tests."""
+
+from pathlib import Path
+from typing import Any
+
+import cv2
+import pytest
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator  # type: ignore[import-untyped]
+from sam2.utils.amg import area_from_rle  # type: ignore[import-untyped]
+
+from py_sam.mask_generator import BatchedMaskGenerator
+
+
+def test_generate_batch_matches_generate(data_dir: Path, sam2_tiny: Any) -> None:
+    """Batched image encoder masks match the single image masks."""
+    # Given a batched mask generator
+    mask_generator = BatchedMaskGenerator(sam2_tiny, points_per_side=4, pred_iou_thresh=0.0, stability_score_thresh=0.0)
+
+    # and a batch of images of different sizes
+    images = [
+        cv2.cvtColor(cv2.imread(str(data_dir / "png" / name)), cv2.COLOR_BGR2RGB) for name in ("cat.png", "dog.png")
+    ]
+
+    # when I generate the masks over the batch
+    batch_masks = mask_generator.generate_batch(images)
+
+    # then the masks should match the masks generated one image at a time
+    for image, masks in zip(images, batch_masks, strict=True):
+        expected = mask_generator.generate(image)
+        assert [mask["area"] for mask in masks] == [mask["area"] for mask in expected], (
+            "Batched mask areas do not match single image mask areas"
+        )
+
+
+def test_generate_matches_sam2(data_dir: Path, sam2_tiny: Any) -> None:
+    """Stacked post-processing masks match the SAM 2 automatic mask generator masks."""
+    # Given a batched and a SAM 2 automatic mask generator
+    settings: dict[str, Any] = {
+        "points_per_side": 4,
+        "pred_iou_thresh": 0.0,
+        "stability_score_thresh": 0.0,
+        "output_mode": "uncompressed_rle",
+    }
+    mask_generator = BatchedMaskGenerator(sam2_tiny, **settings)
+    sam2_generator = SAM2AutomaticMaskGenerator(sam2_tiny, **settings)
+
+    # and an image
+    image = cv2.cvtColor(cv2.imread(str(data_dir / "png" / "cat.png")), cv2.COLOR_BGR2RGB)
+
+    # when I generate the masks
+    masks = mask_generator.generate(image)
+
+    # then they should match the SAM 2 masks, largest first
+    expected = sorted(sam2_generator.generate(image), key=lambda mask: mask["area"], reverse=True)
+    assert [mask["segmentation"] for mask in masks] == [mask["segmentation"] for mask in expected]
+    assert [mask["bbox"] for mask in masks] == [mask["bbox"] for mask in expected]
+    assert [mask["crop_box"] for mask in masks] == [mask["crop_box"] for mask in expected]
+
+
+@pytest.mark.parametrize("min_mask_region_area", [500, 50000])
+def test_generate_filters_small_regions_at_full_resolution(
+    data_dir: Path, sam2_tiny: Any, min_mask_region_area: int
+) -> None:
+    """Small regions are filtered at full resolution, as by `postprocess_small_regions`.
+
+    This is not SAM 2 `generate` behaviour, which filters the low resolution masks instead.
+
+    """
+    # Given a batched and a SAM 2 automatic mask generator that filter small regions (up
+    # to regions larger than most masks, which keep their largest island)
+    settings: dict[str, Any] = {
+        "points_per_side": 4,
+        "pred_iou_thresh": 0.0,
+        "stability_score_thresh": 0.0,
+        "output_mode": "uncompressed_rle",
+        "min_mask_region_area": min_mask_region_area,
+    }
+    mask_generator = BatchedMaskGenerator(sam2_tiny, **settings)
+    sam2_generator = SAM2AutomaticMaskGenerator(sam2_tiny, **settings)
+
+    # and an image
+    image = cv2.cvtColor(cv2.imread(str(data_dir / "png" / "cat.png")), cv2.COLOR_BGR2RGB)
+
+    # when I generate the masks
+    masks = mask_generator.generate(image)
+
+    # then they should match the unfiltered SAM 2 masks after the SAM 2 full resolution
+    # small region helper (which SAM 2 `generate` does not run), largest first
+    mask_data = sam2_generator.postprocess_small_regions(
+        sam2_generator._generate_masks(image),
+        min_mask_region_area,
+        sam2_generator.box_nms_thresh,
+    )
+    expected = sorted(mask_data["rles"], key=area_from_rle, reverse=True)
+    assert masks
+    assert [mask["segmentation"] for mask in masks] == expected
+    assert [mask["area"] for mask in masks] == [area_from_rle(rle) for rle in expected]
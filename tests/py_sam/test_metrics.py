@@ -0,0 +1,111 @@
+"""Pipeline metrics unit tests."""
+
+from typing import Any
+
+import pytest
+
+import py_sam.metrics
+from py_sam.metrics import (
+    INFERENCE,
+    PipelineMetrics,
+    record_duplicate,
+    record_image,
+    stage,
+)
+
+
+class Recorder:
+    """Stand-in for PipelineMetrics that keeps the recorded values."""
+
+    def __init__(self) -> None:
+        """Initialise a Recorder instance."""
+        self.stages: list[tuple[str, float, str]] = []
+        self.failures: list[tuple[str, str]] = []
+        self.images: list[tuple[int, str]] = []
+        self.duplicates: list[str] = []
+
+    def observe_stage(self, name: str, seconds: float, model_type: str) -> None:
+        """Keep a stage latency."""
+        self.stages.append((name, seconds, model_type))
+
+    def record_failure(self, name: str, model_type: str) -> None:
+        """Keep a stage failure."""
+        self.failures.append((name, model_type))
+
+    def record_image(self, mask_count: int, model_type: str) -> None:
+        """Keep an image mask count."""
+        self.images.append((mask_count, model_type))
+
+    def record_duplicate(self, model_type: str) -> None:
+        """Keep a near-duplicate image."""
+        self.duplicates.append(model_type)
+
+
+@pytest.fixture
+def recorder(monkeypatch: pytest.MonkeyPatch) -> Recorder:
+    """Record the pipeline metrics in place of the process metrics."""
+    recorder = Recorder()
+    monkeypatch.setattr(py_sam.metrics, "metrics", lambda: recorder)
+
+    return recorder
+
+
+def test_stage_latency(recorder: Recorder) -> None:
+    """Stage latency is recorded on success."""
+    # Given a pipeline stage
+    # when the stage completes
+    with stage(INFERENCE, "hiera_t", image="cat.png"):
+        pass
+
+    # then the stage latency should be recorded
+    ((name, seconds, model_type),) = recorder.stages
+    assert (name, model_type) == (INFERENCE, "hiera_t")
+    assert seconds >= 0
+    assert not recorder.failures
+
+
+def test_stage_failure(recorder: Recorder) -> None:
+    """Stage failures are counted and re-raised."""
+    # Given a pipeline stage
+    # when the stage raises
+    # then the error should propagate
+    with pytest.raises(RuntimeError), stage(INFERENCE, "hiera_t"):
+        raise RuntimeError("boom")
+
+    # and the failure should be counted instead of the latency
+    assert recorder.failures == [(INFERENCE, "hiera_t")]
+    assert not recorder.stages
+
+
+def test_record_image(recorder: Recorder) -> None:
+    """Images are counted with their masks."""
+    # Given an image with masks
+    # when I record the image
+    record_image(3, "hiera_t", image="cat.png")
+
+    # then the image mask count should be recorded
+    assert recorder.images == [(3, "hiera_t")]
+
+
+def test_record_duplicate(recorder: Recorder) -> None:
+    """Near-duplicate images are counted."""
+    # Given a near-duplicate image
+    # when I record the near-duplicate
+    record_duplicate("hiera_t", image="cat_1.png", representative="cat_0.png")
+
+    # then the near-duplicate should be counted
+    assert recorder.duplicates == ["hiera_t"]
+
+
+def test_pipeline_metrics_outside_ray() -> None:
+    """Ray metrics can be recorded without a Ray session."""
+    # Given the pipeline metrics
+    metrics: Any = PipelineMetrics()
+
+    # when I record each metric
+    # then there should be no error
+    metrics.observe_stage(INFERENCE, 0.5, "hiera_t")
+    metrics.record_failure(INFERENCE, "hiera_t")
+    metrics.record_image(0, "hiera_t")
+    metrics.record_image(3, "hiera_t")
+    metrics.record_duplicate("hiera_t")
@@ -0,0 +1,141 @@
+"""ONNX Runtime backend unit tests."""
+
+import threading
+import time
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+import torch
+
+from py_sam.execution import ExecutionSettings
+from py_sam.fbr_sam import FbrSam
+from py_sam.mask_generator import EmbeddingImagePredictor
+from py_sam.model.hiera import HieraTiny
+from py_sam.onnx_backend import GRAPHS, OnnxImagePredictor, PredictorModel, build_predictor_model, export
+
+pytest.importorskip("onnxruntime")
+
+# Maximum fraction of mask pixels that differ between ONNX Runtime and torch.
+MASK_MISMATCH = 1e-3
+
+
+@pytest.fixture(scope="module")
+def onnx_graphs(sam2_tiny: Any, tmp_path_factory: pytest.TempPathFactory) -> Generator[dict[str, Path], None, None]:
+    """ONNX graphs exported from a Hiera Tiny checkpoint of the random weights."""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("MODEL_CACHE", str(tmp_path_factory.mktemp("models")))
+        model = HieraTiny()
+        torch.save({"model": sam2_tiny.state_dict()}, model.checkpoint)
+
+        yield export(model)
+
+
+def test_export_graphs(onnx_graphs: dict[str, Path]) -> None:
+    """The ONNX graphs are exported next to the checkpoint and reused."""
+    # Given the exported ONNX graphs
+    # then each graph should be cached next to the checkpoint
+    assert sorted(onnx_graphs) == sorted(GRAPHS)
+    for graph, path in onnx_graphs.items():
+        assert path.name == f"sam2_hiera_tiny.{graph}.onnx"
+        assert path.is_file()
+
+    # and a second export should skip the existing graphs
+    mtimes = {graph: path.stat().st_mtime_ns for graph, path in onnx_graphs.items()}
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("MODEL_CACHE", str(onnx_graphs[GRAPHS[0]].parent))
+        assert export(HieraTiny()) == onnx_graphs
+    assert mtimes == {graph: path.stat().st_mtime_ns for graph, path in onnx_graphs.items()}
+
+
+@pytest.mark.parametrize("filename", ["cat.png", "dog.png"])
+def test_onnx_predictor_matches_torch(
+    sam2_tiny: Any, onnx_graphs: dict[str, Path], data_dir: Path, filename: str
+) -> None:
+    """ONNX Runtime embeddings and masks match the torch predictor."""
+    # Given a test image, and a torch and an ONNX Runtime predictor (that builds no torch
+    # modules of the SAM 2 model)
+    image = FbrSam.image_convert(data_dir / "png" / filename)
+    expected = EmbeddingImagePredictor(sam2_tiny)
+    predictor = OnnxImagePredictor(build_predictor_model(HieraTiny()), onnx_graphs)
+
+    # when I set the image on each predictor
+    expected.set_image(image)
+    predictor.set_image(image)
+
+    # then the image embeddings should match
+    torch.testing.assert_close(
+        predictor.get_image_embedding(),
+        expected.get_image_embedding(),
+        atol=1e-4,
+        rtol=1e-4,
+    )
+
+    # and point, box and mask prompts should predict the same masks
+    points = torch.tensor([[[100.0, 100.0]], [[50.0, 150.0]]])
+    labels = torch.ones(2, 1, dtype=torch.int)
+    for kwargs in (
+        {"multimask_output": True},
+        {"multimask_output": False},
+        {"boxes": torch.tensor([[10.0, 10.0, 200.0, 200.0]]).repeat(2, 1)},
+    ):
+        masks, iou_predictions, low_res = predictor._predict(points, labels, return_logits=True, **kwargs)
+        expected_masks, expected_iou, expected_low_res = expected._predict(points, labels, return_logits=True, **kwargs)
+        torch.testing.assert_close(masks, expected_masks, atol=1e-3, rtol=1e-3)
+        torch.testing.assert_close(iou_predictions, expected_iou, atol=1e-4, rtol=1e-4)
+
+    masks, _, _ = predictor._predict(points, labels, mask_input=low_res[:, :1], multimask_output=False)
+    expected_masks, _, _ = expected._predict(points, labels, mask_input=expected_low_res[:, :1], multimask_output=False)
+    assert np.mean((masks != expected_masks).numpy()) < MASK_MISMATCH
+
+
+def test_concurrent_export(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Concurrent exports of the ONNX graphs export them once."""
+    # Given a checkpoint in the model cache
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    HieraTiny().checkpoint.touch()
+
+    # and an export that takes a while
+    exported = []
+
+    def export_graphs(model: Any, paths: dict[str, Path]) -> None:
+        exported.append(model)
+        time.sleep(0.2)
+        for path in paths.values():
+            path.touch()
+
+    monkeypatch.setattr("py_sam.onnx_backend._export_graphs", export_graphs)
+
+    # when several workers on a cold node all export the graphs
+    workers = [threading.Thread(target=export, args=(HieraTiny(),)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # then the graphs should have been exported once
+    assert len(exported) == 1
+
+
+def test_build_predictor_model(sam2_tiny: Any) -> None:
+    """The ONNX predictor model holds the input size of the pre-trained weight only."""
+    # Given a pre-trained weight
+    # when I build the ONNX predictor model
+    model = build_predictor_model(HieraTiny())
+
+    # then it should hold the SAM 2 input size on the CPU, without any torch modules
+    assert isinstance(model, PredictorModel)
+    assert model.image_size == sam2_tiny.image_size
+    assert model.device == torch.device("cpu")
+    assert not list(model.parameters())
+
+
+def test_onnx_engine_rejects_torch_execution_modes() -> None:
+    """The onnx engine runs fp32 graphs only."""
+    # Given the onnx engine with the quantized execution mode
+    # when I initialise the execution settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        ExecutionSettings(engine="onnx", quantize=True)
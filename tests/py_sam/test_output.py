@@ -0,0 +1,193 @@
+"""Raw SAM 2 mask output encoder unit tests."""
+
+import io
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+import ray
+from PIL import Image
+
+from py_sam.fbr_sam import ImageFilenameProvider
+from py_sam.output import (
+    OverlayDatasink,
+    crop_to_rle,
+    explode_records,
+    mask_records,
+    rle_to_mask,
+    rle_to_string,
+    to_coco_json,
+    to_npz,
+    upscale_masks,
+)
+
+
+def _mask() -> dict:
+    """Build a SAM 2 mask record with an uncompressed RLE segmentation."""
+    # 3x4 mask with the first two columns set in rows 1 and 2 (column-major runs).
+    return {
+        "segmentation": {"size": [3, 4], "counts": [1, 2, 1, 2, 6]},
+        "area": 4,
+        "bbox": [0.0, 1.0, 2.0, 2.0],
+        "predicted_iou": 0.9,
+        "stability_score": 0.95,
+        "point_coords": [[1.0, 1.5]],
+        "crop_box": [0.0, 0.0, 4.0, 3.0],
+    }
+
+
+RLE_TO_STRING_ARGS: tuple = (
+    ([1, 2, 1, 2, 6], "12105"),
+    ([0, 12], "0<"),
+    ([100, 50, 100], "T3b1T3"),
+)
+
+
+@pytest.mark.parametrize("counts,expected", RLE_TO_STRING_ARGS)
+def test_rle_to_string(counts: list[int], expected: str) -> None:
+    """COCO compressed RLE string encoding."""
+    # Given uncompressed RLE counts
+    # counts
+
+    # when I compress the counts
+    compressed = rle_to_string(counts)
+
+    # then I should receive the pycocotools string encoding
+    assert compressed == expected
+
+
+def test_rle_to_mask() -> None:
+    """Decode an uncompressed RLE."""
+    # Given an uncompressed RLE
+    rle = _mask()["segmentation"]
+
+    # when I decode the RLE
+    mask = rle_to_mask(rle)
+
+    # then I should receive the binary mask in row-major order
+    expected = np.zeros((3, 4), dtype=bool)
+    expected[1:, :2] = True
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_crop_to_rle() -> None:
+    """Encode a mask crop as an RLE of the full image."""
+    # Given a mask crop and its offset in a larger image
+    mask = np.random.default_rng(0).integers(2, size=(7, 9), dtype=bool)
+    full = np.zeros((12, 15), dtype=bool)
+    full[3:10, 4:13] = mask
+
+    # when I encode the crop
+    rle = crop_to_rle(mask, 4, 3, 12, 15)
+
+    # then the RLE should decode to the full image mask
+    assert rle["size"] == [12, 15]
+    assert sum(rle["counts"]) == full.size
+    np.testing.assert_array_equal(rle_to_mask(rle), full)
+
+
+def test_upscale_masks() -> None:
+    """Scale masks from a downscaled image back to the source image size."""
+    # Given a mask record generated from a 3x4 downscale of a 6x8 source image
+    mask = _mask()
+
+    # when I upscale the mask record
+    upscaled = upscale_masks([mask], (3, 4), (6, 8))
+
+    # then the segmentation should be the nearest neighbour upscale
+    expected = np.zeros((6, 8), dtype=bool)
+    expected[2:, :4] = True
+    np.testing.assert_array_equal(rle_to_mask(upscaled[0]["segmentation"]), expected)
+
+    # and the mask geometry should be in source image coordinates
+    assert upscaled[0]["area"] == int(expected.sum())
+    assert upscaled[0]["bbox"] == [0.0, 2.0, 3.0, 3.0]
+    assert upscaled[0]["point_coords"] == [[2.0, 3.0]]
+    assert upscaled[0]["crop_box"] == [0.0, 0.0, 8.0, 6.0]
+
+
+def test_to_coco_json() -> None:
+    """Encode masks as COCO-style compressed RLE JSON."""
+    # Given the masks of an image
+    masks = [_mask()]
+
+    # when I encode the masks as COCO RLE JSON
+    document = json.loads(to_coco_json(masks, "cat.png", 3, 4, metadata={"profile": "fast"}))
+
+    # then the image attributes and compressed annotations should be present
+    assert document["image"] == {"file_name": "cat.png", "height": 3, "width": 4}
+    assert document["annotations"][0]["segmentation"] == {
+        "size": [3, 4],
+        "counts": "12105",
+    }
+
+    # and the run metadata should be in the info section
+    assert document["info"] == {"profile": "fast"}
+
+
+def test_to_npz() -> None:
+    """Encode masks as a compressed NPZ with bit-packed masks."""
+    # Given the masks of an image
+    masks = [_mask(), _mask()]
+
+    # when I encode the masks as NPZ
+    archive = np.load(io.BytesIO(to_npz(masks, 3, 4, metadata={"profile": "fast"})))
+
+    # then the bit-packed masks should unpack to the original masks
+    unpacked = np.unpackbits(archive["masks"], axis=1, count=12).reshape(-1, 3, 4)
+    np.testing.assert_array_equal(unpacked[0], rle_to_mask(masks[0]["segmentation"]))
+
+    # and the mask scores should be kept
+    assert archive["area"].tolist() == [4, 4]
+    assert archive["bbox"].shape == (2, 4)
+
+    # and the run metadata should be a JSON string
+    assert json.loads(str(archive["metadata"])) == {"profile": "fast"}
+
+
+def test_explode_records() -> None:
+    """Flatten an image row into per-mask rows."""
+    # Given a row with mask records
+    row = {"path": "images/cat.png", "masks": mask_records([_mask(), _mask()])}
+
+    # when I explode the row
+    records = explode_records(row)
+
+    # then I should receive one row per mask
+    assert [(r["path"], r["mask_index"]) for r in records] == [
+        ("images/cat.png", 0),
+        ("images/cat.png", 1),
+    ]
+
+
+def test_overlay_datasink_original_size(tmp_path: Path, ray_session: None) -> None:
+    """Overlays decoded at reduced resolution are written at the source image size."""
+    # Given a dataset with a downscaled overlay and its source image size
+    dataset = ray.data.from_items([
+        {
+            "path": "in/cat.png",
+            "flatten_output": True,
+            "image": np.zeros((30, 40, 3), dtype=np.uint8),
+            "original_height": 300,
+            "original_width": 400,
+            "metadata": '{"profile": "fast"}',
+        }
+    ])
+
+    # when I write the dataset through the overlay datasink
+    dataset.write_datasink(
+        OverlayDatasink(
+            str(tmp_path),
+            "image",
+            "PNG",
+            filename_provider=ImageFilenameProvider(),
+        )
+    )
+
+    # then the overlay should be written at the source image size
+    with Image.open(tmp_path / "cat_masks.png") as image:
+        assert image.size == (400, 300)
+
+        # and carry the run metadata
+        assert json.loads(image.text["py_sam"]) == {"profile": "fast"}
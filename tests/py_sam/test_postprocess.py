@@ -0,0 +1,186 @@
+"""Tensor-native SAM 2 mask post-processing unit tests."""
+
+import pytest
+import torch
+from sam2.utils.amg import batched_mask_to_box, mask_to_rle_pytorch  # type: ignore[import-untyped]
+
+import py_sam.postprocess
+from py_sam.postprocess import (
+    boxes_to_xywh,
+    component_areas,
+    mask_areas,
+    mask_boxes,
+    masks_to_rles,
+    pack_masks,
+    postprocess,
+    propagate_small_components,
+    remove_small_regions,
+    small_components,
+    unpack_masks,
+)
+
+# Blur level above which the random noise is part of a mask.
+MASK_LEVEL = 0.5
+
+# Area below which a connected component is small.
+MIN_AREA = 6
+
+
+@pytest.fixture
+def masks() -> torch.Tensor:
+    """Random blobby masks of an odd size, with an empty mask."""
+    generator = torch.Generator().manual_seed(0)
+    noise = torch.rand((5, 1, 9, 13), generator=generator)
+    masks = torch.nn.functional.avg_pool2d(noise, 3, stride=1, padding=1)[:, 0] > MASK_LEVEL
+    masks[2] = False
+
+    return masks
+
+
+def test_pack_masks_round_trip(masks: torch.Tensor) -> None:
+    """Packed masks unpack to the same masks."""
+    # Given masks whose pixel count is not a multiple of 8
+    # when I pack the masks
+    packed = pack_masks(masks)
+
+    # then they should take a bit a pixel
+    assert packed.shape == (5, 15)
+    assert packed.dtype == torch.uint8
+
+    # and unpack to the same masks
+    assert torch.equal(unpack_masks(packed, 9, 13), masks)
+
+
+def test_mask_areas_and_boxes(masks: torch.Tensor) -> None:
+    """Mask areas and boxes match the SAM 2 mask utilities."""
+    # Given masks with an empty mask
+    # when I measure the masks
+    areas = mask_areas(masks)
+    boxes = mask_boxes(masks)
+
+    # then they should match the SAM 2 areas and boxes
+    assert areas.tolist() == masks.flatten(1).sum(1).tolist()
+    assert torch.equal(boxes, batched_mask_to_box(masks))
+    assert boxes_to_xywh(boxes[:1]) == [
+        [
+            float(boxes[0, 0]),
+            float(boxes[0, 1]),
+            float(boxes[0, 2] - boxes[0, 0]),
+            float(boxes[0, 3] - boxes[0, 1]),
+        ]
+    ]
+
+
+def test_masks_to_rles_matches_sam2(masks: torch.Tensor) -> None:
+    """Stacked RLE encoding matches the SAM 2 mask by mask encoding."""
+    # Given masks starting both on and off
+    masks[0, 0, 0] = True
+    masks[1, 0, 0] = False
+
+    # when I encode the masks
+    rles = masks_to_rles(masks)
+
+    # then the RLEs should match the SAM 2 RLEs
+    assert rles == mask_to_rle_pytorch(masks)
+
+
+def test_component_areas_match_opencv(masks: torch.Tensor, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Batched label propagation finds the same small components as OpenCV."""
+    # Given masks of several components, labelled two masks at a time
+    monkeypatch.setattr(py_sam.postprocess, "COMPONENT_CHUNK_MASKS", 2)
+
+    # and a mask of only small components, the first two equally large
+    masks[3] = False
+    masks[3, 0, 0:2] = masks[3, 4, 4:6] = masks[3, 8, 12] = True
+
+    # when I find the small components with label propagation
+    areas = component_areas(masks)
+    small, found = propagate_small_components(masks, MIN_AREA)
+    islands, _ = propagate_small_components(masks, MIN_AREA, keep_largest=True)
+
+    # then they should match the OpenCV components
+    assert areas.dtype == torch.int32
+    assert torch.equal(small, masks & (areas < MIN_AREA))
+    expected, expected_found = small_components(masks, MIN_AREA)
+    assert torch.equal(small, expected)
+    assert torch.equal(found, expected_found)
+
+    # and keeping the largest should leave the first of the largest components
+    expected, _ = small_components(masks, MIN_AREA, keep_largest=True)
+    assert torch.equal(islands, expected)
+    assert not islands[3, 0, 0:2].any()
+    assert islands[3, 4, 4:6].all()
+
+
+def test_remove_small_regions() -> None:
+    """Small holes are filled and small islands removed."""
+    # Given a square with a one pixel hole and a two pixel island
+    masks = torch.zeros((2, 12, 12), dtype=torch.bool)
+    masks[0, 2:8, 2:8] = True
+    masks[0, 4, 4] = False
+    masks[0, 10, 9:11] = True
+
+    # and a square without small regions
+    masks[1, 1:5, 1:5] = True
+
+    # when I remove the regions of under 3 pixels
+    filtered, changed = remove_small_regions(masks, 3)
+
+    # then the hole should be filled and the island removed
+    expected = torch.zeros((12, 12), dtype=torch.bool)
+    expected[2:8, 2:8] = True
+    assert torch.equal(filtered[0], expected)
+
+    # and only the first mask should have changed
+    assert changed.tolist() == [True, False]
+    assert torch.equal(filtered[1], masks[1])
+
+
+def test_remove_small_regions_keeps_largest_island() -> None:
+    """The largest island of a mask of only small islands is kept."""
+    # Given a mask of a two pixel and a one pixel island
+    masks = torch.zeros((1, 8, 8), dtype=torch.bool)
+    masks[0, 1, 1:3] = True
+    masks[0, 5, 5] = True
+
+    # when I remove the islands of under 3 pixels
+    filtered, changed = remove_small_regions(masks, 3)
+
+    # then only the largest island should be kept
+    expected = torch.zeros((1, 8, 8), dtype=torch.bool)
+    expected[0, 1, 1:3] = True
+    assert torch.equal(filtered, expected)
+    assert changed.tolist() == [True]
+
+
+def test_postprocess_sorts_by_area() -> None:
+    """Masks are returned largest first, without empty masks."""
+    # Given a small, a large and a medium square, and an empty mask
+    masks = torch.zeros((4, 16, 16), dtype=torch.bool)
+    masks[0, 0:2, 0:2] = True
+    masks[1, 0:8, 8:16] = True
+    masks[2, 10:14, 2:6] = True
+
+    # when I post-process the masks with a 5 pixel minimum region area
+    keep, kept, areas, boxes = postprocess(masks, min_area=5)
+
+    # then the empty mask should be dropped and the others sorted by area (the small
+    # square is its own largest island)
+    assert keep.tolist() == [1, 2, 0]
+    assert areas.tolist() == [64, 16, 4]
+    assert torch.equal(kept, masks[[1, 2, 0]])
+    assert boxes.tolist() == [[8, 0, 15, 7], [2, 10, 5, 13], [0, 0, 1, 1]]
+
+
+def test_postprocess_no_masks() -> None:
+    """Images without masks post-process to empty stacks."""
+    # Given no masks
+    masks = torch.zeros((0, 9, 13), dtype=torch.bool)
+
+    # when I pack and post-process the masks
+    masks = unpack_masks(pack_masks(masks), 9, 13)
+    keep, kept, areas, boxes = postprocess(masks, min_area=4)
+
+    # then nothing should be kept
+    assert len(keep) == len(kept) == len(areas) == len(boxes) == 0
+    assert not masks_to_rles(kept)
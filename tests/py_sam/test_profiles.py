@@ -0,0 +1,85 @@
+"""SAM 2 mask generation performance profile unit tests."""
+
+import inspect
+
+import pytest
+from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator  # type: ignore[import-untyped]
+
+from py_sam.profiles import BALANCED_SETTINGS, FAST, PROFILES, parse_overrides, resolve
+
+
+def test_balanced_matches_library_defaults() -> None:
+    """The balanced profile is the SAM 2 automatic mask generator default."""
+    # Given the SAM 2 automatic mask generator defaults
+    defaults = {
+        name: param.default for name, param in inspect.signature(SAM2AutomaticMaskGenerator.__init__).parameters.items()
+    }
+
+    # when I compare the balanced profile settings
+    # then each setting should be the library default
+    for name, value in BALANCED_SETTINGS.items():
+        assert defaults[name] == pytest.approx(value), name
+
+
+def test_profiles_are_complete() -> None:
+    """Every profile defines the same mask generator settings."""
+    # Given the named profiles
+    # when I compare their setting names
+    # then they should all match
+    for settings in PROFILES.values():
+        assert set(settings) == set(BALANCED_SETTINGS)
+
+
+def test_resolve_overrides() -> None:
+    """Explicit overrides replace the profile values, coerced to the setting type."""
+    # Given the fast profile and an override
+    overrides = {"points_per_side": 8.0, "pred_iou_thresh": 0.5}
+
+    # when I resolve the settings
+    settings = resolve(FAST, overrides)
+
+    # then the overrides should be applied
+    assert settings["points_per_side"] == int(overrides["points_per_side"])
+    assert isinstance(settings["points_per_side"], int)
+    assert settings["pred_iou_thresh"] == overrides["pred_iou_thresh"]
+
+    # and the remaining fast profile settings preserved
+    assert settings["points_per_batch"] == PROFILES[FAST]["points_per_batch"]
+
+
+RESOLVE_ERROR_ARGS: tuple = (
+    ("turbo", None),
+    (FAST, {"points_per_second": 4}),
+)
+
+
+@pytest.mark.parametrize("profile,overrides", RESOLVE_ERROR_ARGS)
+def test_resolve_invalid(profile: str, overrides: dict | None) -> None:
+    """Unknown profiles and settings are rejected."""
+    # Given an unknown profile or setting
+    # when I resolve the settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        resolve(profile, overrides)
+
+
+def test_parse_overrides() -> None:
+    """Parse NAME=VALUE overrides from the CLI."""
+    # Given NAME=VALUE overrides
+    values = ["points_per_side=16", "use_m2m=true", "box_nms_thresh=0.6"]
+
+    # when I parse the overrides
+    overrides = parse_overrides(values)
+
+    # then I should receive typed settings
+    assert overrides == {"points_per_side": 16, "use_m2m": True, "box_nms_thresh": 0.6}
+
+
+@pytest.mark.parametrize("value", ["points_per_side", "unknown=1"])
+def test_parse_overrides_invalid(value: str) -> None:
+    """Malformed and unknown overrides are rejected."""
+    # Given a malformed or unknown override
+    # when I parse the override
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        parse_overrides([value])
@@ -0,0 +1,88 @@
+"""Actor profiling unit tests."""
+
+import json
+import pstats
+from pathlib import Path
+
+import fsspec
+import pytest
+import torch
+
+from py_sam.profiling import CPROFILE, TORCH, ProfilerSettings, TraceProfiler, actor_name, trace_name
+
+
+def test_trace_name() -> None:
+    """Trace names are file name safe source image stems."""
+    # Given a source image reference
+    # when I build the trace name
+    # then only the file name safe stem should be kept
+    assert trace_name("s3://bucket/images/cat.png") == "cat"
+    assert trace_name("images/my image (1).jpg") == "my_image__1_"
+
+
+def test_torch_profile(tmp_path: Path) -> None:
+    """torch.profiler traces are written for the first images only."""
+    # Given a torch profiler with a budget of one image
+    profiler = TraceProfiler(str(tmp_path), fsspec.filesystem("file"), profiler=TORCH, max_images=1)
+
+    # when I profile two images
+    for image_name in ("cat.png", "dog.png"):
+        with profiler.profile([image_name]):
+            torch.ones(8, 8) @ torch.ones(8, 8)
+
+    # then only the first image should have a Chrome trace and an operator summary
+    prefix = f"{actor_name()}-cat"
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"{prefix}.json",
+        f"{prefix}.txt",
+    ]
+    assert "traceEvents" in json.loads((tmp_path / f"{prefix}.json").read_text())
+    assert "aten::mm" in (tmp_path / f"{prefix}.txt").read_text()
+
+
+def test_cprofile_profile(tmp_path: Path) -> None:
+    """Write cProfile statistics per image batch."""
+    # Given a cProfile profiler with a budget of two images
+    max_images = 2
+    profiler = TraceProfiler(
+        str(tmp_path / "profiles"),
+        fsspec.filesystem("file"),
+        profiler=CPROFILE,
+        max_images=max_images,
+    )
+
+    # when I profile a batch of two images, then another image
+    with profiler.profile(["cat.png", "dog.png"]):
+        sorted(range(1000), reverse=True)
+    with profiler.profile(["bird.png"]):
+        sorted(range(1000))
+
+    # then only the batch should have been profiled
+    prefix = f"{actor_name()}-cat-batch2"
+    assert profiler.profiled == max_images
+    assert sorted(path.name for path in (tmp_path / "profiles").iterdir()) == [
+        f"{prefix}.prof",
+        f"{prefix}.txt",
+    ]
+    stats = pstats.Stats(str(tmp_path / "profiles" / f"{prefix}.prof"))
+    assert stats.total_calls > 0  # type: ignore[attr-defined]
+
+
+def test_invalid_profiler(tmp_path: Path) -> None:
+    """Unknown profilers are rejected."""
+    # Given an unknown profiler
+    # when I initialise a TraceProfiler
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        TraceProfiler(str(tmp_path), fsspec.filesystem("file"), profiler="perf")
+
+
+def test_profiler_settings_requires_path(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Profiling needs a trace location."""
+    # Given a profiler without a profile path
+    monkeypatch.delenv("PY_SAM__PROFILE_PATH", raising=False)
+
+    # when I resolve the profiler settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        ProfilerSettings.from_environment(TORCH)
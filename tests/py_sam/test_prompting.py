@@ -0,0 +1,114 @@
+"""Prompted SAM 2 segmentation unit tests."""
+
+from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+from py_sam.mask_generator import EmbeddingImagePredictor
+from py_sam.prompting import EmbeddingCache, PromptedPredictor, Prompts
+
+
+def features(nbytes: int) -> dict:
+    """Image embeddings double of `nbytes` bytes."""
+    return {
+        "image_embed": torch.zeros(nbytes // 4, dtype=torch.float32),
+        "high_res_feats": [],
+    }
+
+
+def test_embedding_cache_evicts_least_recently_used() -> None:
+    """Embeddings beyond the memory budget are evicted least recently used first."""
+    # Given an embedding cache with room for two images
+    entry_bytes = 100
+    capacity = 2
+    cache = EmbeddingCache(max_bytes=capacity * entry_bytes)
+    cache.put("cat", features(entry_bytes), (1, 1))
+    cache.put("dog", features(entry_bytes), (1, 1))
+
+    # when I use the first image and add a third
+    assert cache.get("cat") is not None
+    cache.put("bird", features(entry_bytes), (1, 1))
+
+    # then the least recently used image should be evicted
+    assert cache.get("dog") is None
+    assert cache.get("cat") is not None
+    assert len(cache) == capacity
+    assert cache.nbytes == capacity * entry_bytes
+
+
+def test_embedding_cache_skips_oversized() -> None:
+    """Embeddings larger than the memory budget are not cached."""
+    # Given an embedding cache
+    cache = EmbeddingCache(max_bytes=100)
+
+    # when I add embeddings beyond its budget
+    cache.put("cat", features(400), (1, 1))
+
+    # then the cache should stay empty
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_prompts_from_document() -> None:
+    """Prompts are parsed from JSON documents, with foreground points by default."""
+    # Given a prompts document
+    document = {"points": [[10, 20], [30, 40]], "box": [0, 0, 50, 60]}
+
+    # when I parse the prompts
+    prompts = Prompts.from_document(document)
+
+    # then the points should be foreground points
+    assert prompts.point_coords == ((10.0, 20.0), (30.0, 40.0))
+    assert prompts.point_labels == (1, 1)
+    assert prompts.box == (0.0, 0.0, 50.0, 60.0)
+
+    # and scaling should apply to the points and the box
+    assert prompts.scale(0.5, 0.25).box == (0.0, 0.0, 25.0, 15.0)
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {},
+        {"points": [[10, 20]], "labels": [1, 0]},
+        {"points": [[10, 20]], "labels": [2]},
+        {"box": [0, 0, 10]},
+        {"points": "10,20"},
+    ],
+)
+def test_prompts_from_document_invalid(document: dict) -> None:
+    """Malformed prompts are rejected."""
+    # Given a malformed prompts document
+    # when I parse the prompts
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        Prompts.from_document(document)
+
+
+def test_predict_reuses_embeddings(data_dir: Path, sam2_tiny: Any) -> None:
+    """Repeated prompts against an image only run the mask decoder."""
+    # Given a prompted predictor
+    predictor = PromptedPredictor(EmbeddingImagePredictor(sam2_tiny), output_mode="uncompressed_rle")
+    image = cv2.cvtColor(cv2.imread(str(data_dir / "png" / "cat.png")), cv2.COLOR_BGR2RGB)
+    encoder_calls: list[int] = []
+    hook = sam2_tiny.image_encoder.register_forward_hook(lambda *_: encoder_calls.append(1))
+
+    # when I prompt the image twice
+    try:
+        first = predictor.predict(image, Prompts(point_coords=((100.0, 150.0),)))
+        second = predictor.predict(image, Prompts(point_coords=((100.0, 150.0),), point_labels=(1,)))
+    finally:
+        hook.remove()
+
+    # then the image encoder should run once
+    assert len(encoder_calls) == 1
+    assert predictor.cache.hits == 1
+
+    # and the cached embeddings should give the same masks
+    assert [mask["predicted_iou"] for mask in first] == [mask["predicted_iou"] for mask in second]
+    assert first[0]["segmentation"]["size"] == list(image.shape[:2])
+    assert np.all(np.diff([mask["predicted_iou"] for mask in first]) <= 0)
@@ -0,0 +1,152 @@
+"""Dynamic INT8 quantization unit tests."""
+
+import copy
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+import torch
+
+from py_sam.execution import ExecutionSettings
+from py_sam.fbr_sam import FbrSam, FbrSamSettings
+from py_sam.mask_generator import BatchedMaskGenerator
+from py_sam.model.hiera import HieraTiny
+from py_sam.quantization import build_quantized, mask_agreement, quantize
+
+# Minimum cosine similarity of the quantized and float image embeddings.
+EMBEDDING_SIMILARITY = 0.99
+
+# Minimum area weighted agreement of the quantized and float masks.
+MASK_AGREEMENT = 0.8
+
+
+def _embeddings(sam: Any, image: np.ndarray) -> torch.Tensor:
+    """Image embeddings of `image`."""
+    predictor = BatchedMaskGenerator(sam).predictor
+    predictor.set_image(image)
+
+    return predictor.get_image_embedding()
+
+
+def test_quantize_linear_layers(sam2_tiny: Any) -> None:
+    """Linear layers of the image encoder and mask decoder are quantized."""
+    # Given a float SAM 2 model
+    sam = copy.deepcopy(sam2_tiny)
+
+    # when I quantize the model
+    quantize(sam)
+
+    # then the image encoder and mask decoder should have no float linear layers left
+    for module in (sam.image_encoder, sam.sam_mask_decoder):
+        kinds = {type(layer) for layer in module.modules()}
+        assert torch.nn.Linear not in kinds
+        assert torch.ao.nn.quantized.dynamic.Linear in kinds
+
+
+@pytest.mark.parametrize("filename", ["cat.png", "dog.png"])
+def test_quantized_embeddings_agree(sam2_tiny: Any, data_dir: Path, filename: str) -> None:
+    """Quantized image embeddings track the float model on the test images."""
+    # Given a test image, and a float and a quantized SAM 2 model
+    image = FbrSam.image_convert(data_dir / "png" / filename)
+    quantized = quantize(copy.deepcopy(sam2_tiny))
+
+    # when I compute the image embeddings with each model
+    expected = _embeddings(sam2_tiny, image)
+    embeddings = _embeddings(quantized, image)
+
+    # then the embeddings should agree
+    similarity = torch.nn.functional.cosine_similarity(expected.flatten(), embeddings.flatten(), dim=0)
+    assert similarity > EMBEDDING_SIMILARITY
+
+
+def test_build_quantized_caches_state(sam2_tiny: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The quantized state is cached next to the checkpoint and reused."""
+    # Given a Hiera Tiny checkpoint in the model cache
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    model = HieraTiny()
+    torch.save({"model": sam2_tiny.state_dict()}, model.checkpoint)
+
+    # when I build the quantized model
+    first = build_quantized(model)
+
+    # then the quantized state should be cached next to the checkpoint
+    assert model.quantized_checkpoint == tmp_path / "sam2_hiera_tiny.int8.pt"
+    assert model.quantized_checkpoint.stat().st_size < model.checkpoint.stat().st_size
+
+    # and a rebuild from the cache should produce the same model without the checkpoint
+    model.checkpoint.unlink()
+    second = build_quantized(model)
+    image = torch.rand(1, 3, second.image_size, second.image_size)
+    with torch.inference_mode():
+        torch.testing.assert_close(
+            second.image_encoder(image)["vision_features"],
+            first.image_encoder(image)["vision_features"],
+        )
+
+
+def test_concurrent_build_quantized(sam2_tiny: Any, tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Concurrent builds of an uncached quantized state quantize it once."""
+    # Given a Hiera Tiny checkpoint in the model cache
+    monkeypatch.setenv("MODEL_CACHE", str(tmp_path))
+    model = HieraTiny()
+    torch.save({"model": sam2_tiny.state_dict()}, model.checkpoint)
+
+    # and a count of the quantized states saved
+    saved = []
+    save = torch.save
+    monkeypatch.setattr(torch, "save", lambda obj, path: saved.append(path) or save(obj, path))
+
+    # when several workers on a cold node all build the quantized model
+    workers = [threading.Thread(target=build_quantized, args=(HieraTiny(),)) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # then the quantized state should have been saved once
+    assert len(saved) == 1
+    assert model.quantized_checkpoint.is_file()
+
+
+def test_mask_agreement() -> None:
+    """Area weighted best IoU agreement between two sets of masks."""
+    # Given a reference set of masks
+    large = np.zeros((10, 10), dtype=bool)
+    large[:, :6] = True
+    small = np.zeros((10, 10), dtype=bool)
+    small[8:, 8:] = True
+    reference = [
+        {"segmentation": large, "area": 60},
+        {"segmentation": small, "area": 4},
+    ]
+
+    # and a candidate set that finds the large mask only
+    candidate = [{"segmentation": large.copy(), "area": 60}]
+
+    # when I compute the agreement
+    agreement = mask_agreement(reference, candidate)
+
+    # then the large mask should dominate the agreement
+    assert agreement == pytest.approx(60 / 64)
+
+
+@pytest.mark.skipif(
+    not HieraTiny().checkpoint.exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+@pytest.mark.parametrize("filename", ["cat.png", "dog.png"])
+def test_quantized_mask_accuracy(data_dir: Path, filename: str) -> None:
+    """Quantized masks agree with the float model masks on the test images."""
+    # Given a test image
+    image = FbrSam.image_convert(data_dir / "png" / filename)
+
+    # when I generate the masks with the float and the quantized model
+    float_masks = FbrSam(model=HieraTiny).predict([image], [filename])[0]
+    quantized_masks = FbrSam(
+        model=HieraTiny, settings=FbrSamSettings(execution=ExecutionSettings(quantize=True))
+    ).predict([image], [filename])[0]
+
+    # then the quantized masks should agree with the float masks
+    assert mask_agreement(float_masks, quantized_masks) > MASK_AGREEMENT
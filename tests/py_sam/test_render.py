@@ -0,0 +1,84 @@
+"""Vectorised SAM 2 mask compositing unit tests."""
+
+import numpy as np
+
+from py_sam.output import mask_to_rle
+from py_sam.render import composite, label_map, palette
+
+
+def _masks() -> list[dict]:
+    """Two overlapping mask records."""
+    large = np.zeros((4, 6), dtype=bool)
+    large[:, :4] = True
+    small = np.zeros((4, 6), dtype=bool)
+    small[1:3, 2:5] = True
+
+    return [
+        {"segmentation": small, "area": int(small.sum())},
+        {"segmentation": large, "area": int(large.sum())},
+    ]
+
+
+def test_label_map_area_order() -> None:
+    """Smaller masks are painted over larger masks."""
+    # Given a set of overlapping masks
+    masks = _masks()
+
+    # when I build the label map
+    labels = label_map(masks, (4, 6))
+
+    # then the larger mask should be label 1 and the smaller mask label 2
+    expected = np.zeros((4, 6), dtype=np.uint16)
+    expected[:, :4] = 1
+    expected[1:3, 2:5] = 2
+    np.testing.assert_array_equal(labels, expected)
+
+
+def test_label_map_rle_segmentations() -> None:
+    """RLE segmentations paint the same label map as binary masks."""
+    # Given a set of overlapping masks with RLE segmentations
+    masks = _masks()
+    rle_masks = [{**mask, "segmentation": mask_to_rle(mask["segmentation"])} for mask in masks]
+
+    # when I build the label maps
+    labels = label_map(rle_masks, (4, 6))
+
+    # then the RLE label map should match the binary mask label map
+    np.testing.assert_array_equal(labels, label_map(masks, (4, 6)))
+
+
+def test_composite_matches_float_blend() -> None:
+    """uint8 compositing matches a float alpha blend of the label colours."""
+    # Given an image and a set of masks
+    image = np.random.default_rng(0).integers(0, 256, size=(4, 6, 3), dtype=np.uint8)
+    masks = _masks()
+
+    # when I composite the masks with a fixed palette
+    output = composite(image, masks, rng=np.random.default_rng(1))
+
+    # then the output should preserve the image resolution
+    assert output.shape == image.shape and output.dtype == np.uint8
+
+    # and match a float alpha blend to within rounding
+    labels = label_map(masks, (4, 6))
+    lut = palette(len(masks), np.random.default_rng(1)).astype(np.float64)
+    expected = image.astype(np.float64)
+    foreground = labels != 0
+    expected[foreground] = expected[foreground] * 0.65 + lut[labels[foreground]] * 0.35
+    assert np.abs(output.astype(np.float64) - expected).max() <= 1.0
+
+    # and leave the unmasked pixels untouched
+    np.testing.assert_array_equal(output[~foreground], image[~foreground])
+
+
+def test_composite_no_masks() -> None:
+    """No masks returns a copy of the source image."""
+    # Given an image
+    image = np.zeros((2, 2, 3), dtype=np.uint8)
+
+    # when I composite an empty set of masks
+    output = composite(image, [])
+
+    # then I should get the image back as a new array
+    np.testing.assert_array_equal(output, image)
+    assert output is not image
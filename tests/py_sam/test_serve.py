@@ -0,0 +1,190 @@
+"""Segmentation service unit tests."""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+pytest.importorskip("ray.serve")
+
+from ray import serve
+
+from py_sam.fbr_sam import FbrSamSettings
+from py_sam.model.hiera import HieraTiny
+from py_sam.serve import (
+    RequestError,
+    SegmentationService,
+    ServiceSettings,
+    read_request_image,
+    read_request_prompts,
+    uri_within,
+)
+
+IMAGE = Path("tests/data/resources/images/png/cat.png")
+
+# Longest side of the decoded request images.
+MAX_SIDE = 64
+
+
+def test_read_request_image_upload() -> None:
+    """Uploaded images are decoded from the request body."""
+    # Given an image upload
+    body = IMAGE.read_bytes()
+
+    # when I read the request image
+    name, image, original_size = read_request_image(body, "image/png", "cat.png")
+
+    # then the image should be decoded at source size
+    assert name == "cat.png"
+    assert image.shape == (*original_size, 3)
+
+
+def test_read_request_image_uri() -> None:
+    """JSON requests read the image at the `uri` under the service root."""
+    # Given a JSON request
+    body = json.dumps({"uri": str(IMAGE)}).encode()
+
+    # when I read the request image capped at the longest side
+    name, image, original_size = read_request_image(
+        body, "application/json; charset=utf-8", max_side=MAX_SIDE, uri_root=str(IMAGE.parent)
+    )
+
+    # then the image should be read from the uri
+    assert name == str(IMAGE)
+    assert max(image.shape[:2]) == MAX_SIDE
+    assert max(original_size) > MAX_SIDE
+
+
+@pytest.mark.parametrize(
+    "body, content_type",
+    [
+        (b'{"url": "cat.png"}', "application/json"),
+        (f'{{"uri": "{IMAGE.parent}/missing.png"}}'.encode(), "application/json"),
+        (b"not an image", "image/png"),
+        (b"", "image/png"),
+    ],
+)
+def test_read_request_image_invalid(body: bytes, content_type: str) -> None:
+    """Malformed requests are rejected."""
+    # Given a malformed request
+    # when I read the request image
+    # then I should receive an error
+    with pytest.raises(RequestError):
+        read_request_image(body, content_type, uri_root=str(IMAGE.parent))
+
+
+@pytest.mark.parametrize(
+    "uri, uri_root",
+    [
+        (str(IMAGE), None),
+        ("/etc/passwd", str(IMAGE.parent)),
+        (f"{IMAGE.parent}/../png/../../../../../etc/passwd", str(IMAGE.parent)),
+        ("s3://bucket/private/cat.png", "s3://bucket/images"),
+        ("s3://bucket/images-private/cat.png", "s3://bucket/images"),
+        ("s3://other/images/cat.png", "s3://bucket/images"),
+    ],
+)
+def test_read_request_image_uri_outside_root(uri: str, uri_root: str | None) -> None:
+    """Image URIs are only read under the service root."""
+    # Given a JSON request for an image outside the service root
+    body = json.dumps({"uri": uri}).encode()
+
+    # when I read the request image
+    # then I should receive an error that does not tell whether it exists
+    with pytest.raises(RequestError, match=r"not enabled|outside the service root"):
+        read_request_image(body, "application/json", uri_root=uri_root)
+
+
+def test_uri_within() -> None:
+    """URIs under a directory or prefix are within it."""
+    # Given a local directory and an S3 prefix
+    # when I check URIs under them
+    # then they should be within the root
+    assert uri_within(str(IMAGE), str(IMAGE.parent))
+    assert uri_within(f"file://{IMAGE.resolve()}", f"{IMAGE.parent.resolve()}/")
+    assert uri_within("s3://bucket/images/a/cat.png", "s3://bucket/images/")
+    assert not uri_within("s3://bucket/images/../cat.png", "s3://bucket/images")
+
+
+def test_read_request_prompts() -> None:
+    """Prompts are read from JSON requests and the upload query parameter."""
+    # Given a JSON request and an upload with prompts
+    body = json.dumps({"uri": str(IMAGE), "points": [[10, 20]], "labels": [0]})
+    query = json.dumps({"box": [0, 0, 50, 60]})
+
+    # when I read the request prompts
+    json_prompts = read_request_prompts(body.encode(), "application/json")
+    upload_prompts = read_request_prompts(IMAGE.read_bytes(), "image/png", query)
+
+    # then the prompts should be parsed
+    assert json_prompts is not None
+    assert json_prompts.point_labels == (0,)
+    assert upload_prompts is not None
+    assert upload_prompts.box == (0.0, 0.0, 50.0, 60.0)
+
+    # and requests without prompts should generate all masks
+    assert read_request_prompts(b'{"uri": "cat.png"}', "application/json") is None
+    assert read_request_prompts(IMAGE.read_bytes(), "image/png") is None
+
+    # and malformed prompts should be rejected
+    with pytest.raises(RequestError):
+        read_request_prompts(b"", "image/png", '{"points": [[10]]}')
+
+
+@pytest.mark.skipif(
+    not HieraTiny().checkpoint.exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+def test_segmentation_service_batches_concurrent_requests(ray_session: None) -> None:
+    """Concurrent requests go through the image encoder in one batch."""
+
+    # Given a segmentation service replica that waits for batches to fill (defined here, so
+    # the replica receives the class by value rather than importing the test module)
+    class RecordingService(SegmentationService.func_or_class):  # type: ignore[attr-defined,name-defined,misc]
+        """Segmentation service replica that records the image names of each batch."""
+
+        def __init__(self, **kwargs: Any) -> None:
+            """Initialise a RecordingService replica."""
+            super().__init__(**kwargs)
+            self.batches: list[list[str]] = []
+            generate_batch_masks = self.fbr_sam.generate_batch_masks
+
+            def record_batch(**batch: Any) -> list:
+                self.batches.append(batch["image_names"])
+                return generate_batch_masks(**batch)
+
+            self.fbr_sam.generate_batch_masks = record_batch
+
+        def recorded_batches(self) -> list[list[str]]:
+            """Image names of each batch segmented so far."""
+            return self.batches
+
+    handle = serve.run(
+        serve.deployment(RecordingService, max_ongoing_requests=8).bind(
+            model=HieraTiny,
+            settings=FbrSamSettings(output_mode="coco_rle", profile="fast", mask_settings={"points_per_side": 4}),
+            service=ServiceSettings(max_batch_size=4, batch_wait_timeout_s=1.0, max_side=MAX_SIDE),
+        ),
+        name="test-batching",
+        route_prefix=None,
+    )
+
+    # when I send three concurrent requests
+    body = IMAGE.read_bytes()
+    responses = [handle.segment.remote(read_request_image(body, "image/png", f"cat_{idx}.png")) for idx in range(3)]
+    masks = [response.result() for response in responses]
+    batches = handle.recorded_batches.remote().result()
+    serve.delete("test-batching")
+
+    # then the images should be segmented in one batch
+    assert len(batches) == 1
+    assert sorted(batches[0]) == ["cat_0.png", "cat_1.png", "cat_2.png"]
+
+    # and each request should receive its own masks
+    documents = [json.loads(mask) for mask in masks]
+    assert [document["image"]["file_name"] for document in documents] == [
+        "cat_0.png",
+        "cat_1.png",
+        "cat_2.png",
+    ]
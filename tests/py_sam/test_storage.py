@@ -0,0 +1,83 @@
+"""Tuned S3 filesystem unit tests."""
+
+import pytest
+
+from py_sam.fbr_sam import FbrSam
+from py_sam.storage import (
+    DEFAULT_MAX_POOL_CONNECTIONS,
+    DEFAULT_MULTIPART_THRESHOLD,
+    DEFAULT_READ_BLOCK_SIZE,
+    DEFAULT_RETRY_MAX_ATTEMPTS,
+    DEFAULT_RETRY_MODE,
+    MIB,
+    S3Settings,
+    TunedS3FileSystem,
+    s3_filesystem,
+)
+
+MAX_CONCURRENCY = 16
+
+
+def test_s3_settings_defaults(monkeypatch: pytest.MonkeyPatch) -> None:
+    """S3 transfer settings default to pooled, retried transfers."""
+    # Given no S3 transfer settings in the environment
+    for name in ("PY_SAM__S3_MAX_POOL_CONNECTIONS", "PY_SAM__S3_RETRY_MODE"):
+        monkeypatch.delenv(name, raising=False)
+
+    # when I read the S3 settings
+    settings = S3Settings.from_environment()
+
+    # then I should receive the defaults
+    assert settings.max_pool_connections == DEFAULT_MAX_POOL_CONNECTIONS
+    assert settings.read_block_size == DEFAULT_READ_BLOCK_SIZE
+    assert settings.multipart_threshold == DEFAULT_MULTIPART_THRESHOLD
+    assert (settings.retry_max_attempts, settings.retry_mode) == (DEFAULT_RETRY_MAX_ATTEMPTS, DEFAULT_RETRY_MODE)
+
+
+def test_s3_settings_environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    """S3 transfer settings are read from the environment."""
+    # Given S3 transfer settings in the environment
+    monkeypatch.setenv("PY_SAM__S3_MAX_POOL_CONNECTIONS", "128")
+    monkeypatch.setenv("PY_SAM__S3_READ_BLOCK_SIZE", str(2 * MIB))
+    monkeypatch.setenv("PY_SAM__S3_MULTIPART_THRESHOLD", str(64 * MIB))
+    monkeypatch.setenv("PY_SAM__S3_MAX_CONCURRENCY", str(MAX_CONCURRENCY))
+    monkeypatch.setenv("PY_SAM__S3_RETRY_MAX_ATTEMPTS", "10")
+    monkeypatch.setenv("PY_SAM__S3_RETRY_MODE", "adaptive")
+
+    # when I build the S3 filesystem
+    filesystem = s3_filesystem(S3Settings.from_environment())
+
+    # then the filesystem should be tuned with the settings
+    assert isinstance(filesystem, TunedS3FileSystem)
+    assert filesystem.config_kwargs == {
+        "max_pool_connections": 128,
+        "retries": {"max_attempts": 10, "mode": "adaptive"},
+    }
+    assert filesystem.default_block_size == 2 * MIB
+    assert filesystem.multipart_threshold == 64 * MIB
+    assert filesystem.max_concurrency == MAX_CONCURRENCY
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"multipart_threshold": MIB},
+        {"retry_mode": "eventually"},
+        {"max_pool_connections": 0},
+    ],
+)
+def test_s3_settings_invalid(kwargs: dict) -> None:
+    """Invalid S3 transfer settings are rejected."""
+    # Given invalid S3 transfer settings
+    # when I initialise the S3Settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        S3Settings(**kwargs)
+
+
+def test_filesystem_reused() -> None:
+    """S3 filesystems are built once per process."""
+    # Given two S3 URIs
+    # when I get their filesystems
+    # then the same filesystem should be shared
+    assert FbrSam.filesystem("s3://bucket/images") is FbrSam.filesystem("s3://bucket/masks")
@@ -0,0 +1,216 @@
+"""Tiled SAM 2 automatic mask generation unit tests."""
+
+from itertools import pairwise
+from typing import Any
+
+import numpy as np
+import pytest
+
+from py_sam.output import rle_to_mask
+from py_sam.tiling import (
+    TileSettings,
+    generate_tiled,
+    overlapping_tiles,
+    stitch,
+    tile_boxes,
+    tile_masks,
+)
+
+BRIGHT = 127
+
+TILE_SIZE = 128
+
+
+class ThresholdMaskGenerator:
+    """Mask generator stand-in that returns the bright pixels of each tile as one mask."""
+
+    def __init__(self) -> None:
+        """Initialise a ThresholdMaskGenerator instance."""
+        self.tile_shapes: list[tuple[int, ...]] = []
+
+    def generate(self, image: np.ndarray) -> list[dict[str, Any]]:
+        """Bright pixel mask record."""
+        self.tile_shapes.append(image.shape)
+        segmentation = image[..., 0] > BRIGHT
+        if not segmentation.any():
+            return []
+
+        return [
+            {
+                "segmentation": segmentation,
+                "area": int(segmentation.sum()),
+                "predicted_iou": 0.9,
+                "stability_score": 0.95,
+                "point_coords": [[0.0, 0.0]],
+            }
+        ]
+
+    def generate_batch(self, images: list[np.ndarray]) -> list[list[dict[str, Any]]]:
+        """Bright pixel mask records for each image."""
+        return [self.generate(image) for image in images]
+
+
+TILE_BOXES_ARGS: tuple = (
+    (100, 100, 128, 16, 1),
+    (300, 200, 128, 32, 6),
+    (1000, 1000, 256, 64, 25),
+)
+
+
+@pytest.mark.parametrize("height,width,tile_size,overlap,expected", TILE_BOXES_ARGS)
+def test_tile_boxes(height: int, width: int, tile_size: int, overlap: int, expected: int) -> None:
+    """Tiles cover the image and overlap their neighbours."""
+    # Given an image size, tile size and overlap
+
+    # when I split the image into tiles
+    boxes = tile_boxes(height, width, tile_size, overlap)
+
+    # then I should receive the expected number of tiles
+    assert len(boxes) == expected
+
+    # and every pixel should be covered
+    covered = np.zeros((height, width), dtype=bool)
+    for x0, y0, x1, y1 in boxes:
+        assert x1 - x0 <= tile_size and y1 - y0 <= tile_size
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+    # and neighbouring tiles should share at least the overlap
+    x_starts = sorted({box[0] for box in boxes})
+    for left, right in pairwise(x_starts):
+        assert right - left <= tile_size - overlap
+
+
+def test_tile_settings_overlap_too_large() -> None:
+    """Tile settings overlap must be smaller than the tile size."""
+    # Given an overlap as large as the tile size
+    # when I create the tile settings
+    # then I should receive an error
+    with pytest.raises(ValueError, match="must be less than tile size"):
+        TileSettings(32, overlap=32)
+
+
+def test_tile_boxes_overlap_too_large() -> None:
+    """Tile overlap must be smaller than the tile size."""
+    # Given an overlap as large as the tile size
+    # when I split an image into tiles
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        tile_boxes(100, 100, 32, 32)
+
+
+def test_generate_tiled_stitches_across_tiles() -> None:
+    """An object that spans several tiles is returned as a single mask."""
+    # Given an image with one bright object across the tile borders
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    image[40:170, 30:260] = 255
+    generator = ThresholdMaskGenerator()
+
+    # when I generate the masks over tiles
+    masks = generate_tiled(generator, image, TileSettings(TILE_SIZE, overlap=32))  # type: ignore[arg-type]
+
+    # then no tile should be larger than the tile size
+    assert max(max(shape[:2]) for shape in generator.tile_shapes) <= TILE_SIZE
+
+    # and the tile masks should be stitched into one full image mask
+    assert len(masks) == 1
+    expected = image[..., 0] > BRIGHT
+    np.testing.assert_array_equal(rle_to_mask(masks[0]["segmentation"]), expected)
+    assert masks[0]["area"] == int(expected.sum())
+    assert masks[0]["bbox"] == [30.0, 40.0, 229.0, 129.0]
+
+
+def test_generate_tiled_separate_objects() -> None:
+    """Objects in different tiles that do not touch are kept apart."""
+    # Given an image with two bright objects far apart
+    image = np.zeros((100, 300, 3), dtype=np.uint8)
+    image[10:40, 10:40] = 255
+    image[60:90, 250:290] = 255
+
+    # when I generate the masks over tiles, several tiles per encoder pass
+    masks = generate_tiled(
+        ThresholdMaskGenerator(),  # type: ignore[arg-type]
+        image,
+        TileSettings(TILE_SIZE, overlap=32, batch_size=2),
+    )
+
+    # then I should receive one mask per object, largest first
+    assert [mask["area"] for mask in masks] == [1200, 900]
+
+
+def test_stitch_keeps_nested_masks_apart() -> None:
+    """A part and the whole that contains it across tiles are not merged."""
+    # Given two overlapping tiles that each find an object and a part of it
+    image = np.zeros((64, 224), dtype=bool)
+    whole = image.copy()
+    whole[10:50, 60:180] = True
+    part = image.copy()
+    part[20:40, 100:120] = True
+    masks = []
+    for tile in ((0, 0, 128, 64), (96, 0, 224, 64)):
+        x0, y0, x1, y1 = tile
+        records = [
+            {
+                "segmentation": segmentation[y0:y1, x0:x1],
+                "predicted_iou": 0.9,
+                "stability_score": 0.95,
+                "point_coords": [[0.0, 0.0]],
+            }
+            for segmentation in (whole, part)
+        ]
+        masks.extend(tile_masks(records, tile))
+
+    # when I stitch the tile masks
+    stitched = stitch(masks)
+
+    # then the object and its part should each be joined across the tiles
+    assert sorted(int(mask.crop.sum()) for mask in stitched) == [400, 4800]
+
+
+def test_stitch_keeps_part_from_matching_whole_across_tiles() -> None:
+    """A part does not join its whole in the same tile through a match across tiles."""
+    # Given two overlapping tiles that both find an object, where only the first tile
+    # also finds a part of it that matches the object in the second tile
+    image = np.zeros((64, 224), dtype=bool)
+    whole = image.copy()
+    whole[10:50, 60:180] = True
+    part = image.copy()
+    part[10:40, 90:128] = True
+    masks = []
+    for tile, segmentations in (((0, 0, 128, 64), (whole, part)), ((96, 0, 224, 64), (whole,))):
+        x0, y0, x1, y1 = tile
+        records = [
+            {
+                "segmentation": segmentation[y0:y1, x0:x1],
+                "predicted_iou": 0.9,
+                "stability_score": 0.95,
+                "point_coords": [[0.0, 0.0]],
+            }
+            for segmentation in segmentations
+        ]
+        masks.extend(tile_masks(records, tile))
+
+    # when I stitch the tile masks
+    stitched = stitch(masks)
+
+    # then the object should be joined across the tiles and the part kept apart
+    assert sorted(int(mask.crop.sum()) for mask in stitched) == [int(part.sum()), int(whole.sum())]
+
+
+def test_overlapping_tiles() -> None:
+    """Only tiles that share a region are paired."""
+    # Given the tiles of a large image
+    tiles = tile_boxes(2000, 3000, tile_size=512, overlap=64)
+
+    # when I pair the overlapping tiles
+    pairs = overlapping_tiles(tiles)
+
+    # then each pair should share a region
+    assert all(a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3] for a, b in pairs)
+
+    # and every overlapping pair should be found once
+    expected = {
+        (a, b) for a in tiles for b in tiles if a < b and a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+    }
+    assert set(pairs) == expected
+    assert len(pairs) == len(expected)
@@ -0,0 +1,248 @@
+"""SAM 2 video segmentation unit tests."""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import cv2
+import fsspec  # type: ignore[import-untyped]
+import numpy as np
+import pytest
+import torch
+from sam2.build_sam import build_sam2_video_predictor  # type: ignore[import-untyped]
+
+import py_sam.video
+from py_sam.model.hiera import HieraTiny
+from py_sam.output import COCO_RLE
+from py_sam.video import (
+    FrameStream,
+    StreamingVideoPredictor,
+    VideoSam,
+    VideoSettings,
+    chunk_ranges,
+    frame_records,
+    list_videos,
+    open_video,
+    video_chunks,
+)
+
+FRAMES = 12
+
+# Frames of memory that SAM 2 Hiera Tiny conditions on while propagating.
+MEMORY_HORIZON = 6
+
+
+@pytest.fixture
+def video(tmp_path: Path) -> Path:
+    """Motion JPEG video of a square moving across a dark background."""
+    path = tmp_path / "videos" / "square.avi"
+    path.parent.mkdir()
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), 10, (96, 64))
+    for idx in range(FRAMES):
+        frame = np.full((64, 96, 3), 20, dtype=np.uint8)
+        frame[16:40, 8 + 4 * idx : 32 + 4 * idx] = (40, 200, 240)
+        writer.write(frame)
+    writer.release()
+
+    return path
+
+
+def test_chunk_ranges() -> None:
+    """Videos split into consecutive chunks of up to the chunk size."""
+    # Given a 1050 frame video
+    # when I split it into chunks of 500 frames
+    chunks = chunk_ranges(1050, 500)
+
+    # then the last chunk should hold the remainder
+    assert chunks == [(0, 500), (500, 1000), (1000, 1050)]
+
+
+def test_list_videos(video: Path) -> None:
+    """Only video files are listed."""
+    # Given a directory with a video and an image
+    (video.parent / "cat.png").write_bytes(b"")
+
+    # when I list the videos
+    videos = list_videos(str(video.parent), fsspec.filesystem("file"))
+
+    # then only the video should be listed
+    assert videos == [str(video)]
+
+
+def test_frame_stream_decodes_in_order(video: Path) -> None:
+    """Frames are decoded in order, seeking only for frames out of the window."""
+    # Given a frame stream over the video with a two frame window
+    frames = FrameStream(str(video), start=2, image_size=64, window=2)
+    first = frames.frame(0).copy()
+
+    # when I read the frames in order
+    tensors = [frames[idx] for idx in range(len(frames))]
+
+    # then the stream should not seek
+    assert len(frames) == FRAMES - 2
+    assert frames.seeks == 0
+    assert tensors[0].shape == (3, 64, 64)
+    assert tensors[0].dtype == torch.float32
+
+    # and reading back past the window should seek to the same frame
+    assert np.array_equal(frames.frame(0), first)
+    assert frames.seeks == 1
+    frames.close()
+
+
+def test_frame_stream_decodes_forward_on_inexact_seeks(video: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Seeks that do not land on their frame decode forward to it."""
+
+    # Given a video whose seeks fail, as for some variable frame rate videos
+    class InexactCapture:
+        def __init__(self, capture: cv2.VideoCapture) -> None:
+            self.capture = capture
+
+        def __getattr__(self, name: str) -> Any:
+            return getattr(self.capture, name)
+
+        def set(self, prop: int, value: float) -> bool:
+            return False
+
+    monkeypatch.setattr(py_sam.video, "open_video", lambda uri: InexactCapture(open_video(uri)))
+    expected = FrameStream(str(video), start=0, window=1)
+    expected_frames = [expected.frame(idx).copy() for idx in range(len(expected))]
+    expected.close()
+
+    # when I read the frames of a chunk after the first, and back past the window
+    frames = FrameStream(str(video), start=4, window=1)
+    first = frames.frame(0).copy()
+    frames.frame(1)
+
+    # then the frames should match those decoded in order
+    assert np.array_equal(first, expected_frames[4])
+    assert np.array_equal(frames.frame(0), expected_frames[4])
+    assert frames.seeks == 1
+    frames.close()
+
+
+def test_frame_stream_ends_at_last_frame(video: Path) -> None:
+    """Reading past the last frame of a video ends the stream."""
+    # Given a frame stream that reaches past the end of the video, as from an overstated
+    # frame count
+    frames = FrameStream(str(video), start=FRAMES - 2, stop=FRAMES + 3, window=2)
+
+    # when I read the frames
+    # then the frames in the video should decode
+    assert frames.frame(1).shape == (64, 96, 3)
+
+    # and the next frame should end the stream
+    with pytest.raises(EOFError, match=f"ends before frame {FRAMES}"):
+        frames.frame(2)
+    frames.close()
+
+
+def test_streaming_predictor_releases_past_outputs(video: Path) -> None:
+    """Propagation only keeps the outputs of frames within the memory horizon."""
+    # Given a streaming predictor with a six frame memory horizon
+    predictor = build_sam2_video_predictor(
+        "sam2_hiera_t.yaml",
+        None,
+        device="cpu",
+        hydra_overrides_extra=[
+            "++model._target_=py_sam.video.StreamingVideoPredictor",
+            "++model.image_size=256",
+            "++model.max_obj_ptrs_in_encoder=2",
+        ],
+    )
+    assert isinstance(predictor, StreamingVideoPredictor)
+    assert predictor.memory_horizon == MEMORY_HORIZON
+
+    # and an object seeded on the first frame
+    frames = FrameStream(str(video), image_size=predictor.image_size)
+    state = predictor.init_state(frames)
+    mask = np.zeros((64, 96), dtype=bool)
+    mask[16:40, 8:32] = True
+    predictor.add_new_mask(state, frame_idx=0, obj_id=1, mask=mask)
+
+    # when I propagate through the video
+    propagated = []
+    retained = []
+    shapes = set()
+    for frame_idx, _obj_ids, masks in predictor.propagate_in_video(state):
+        propagated.append(frame_idx)
+        retained.append(len(state["output_dict_per_obj"][0]["non_cond_frame_outputs"]))
+        shapes.add(masks.shape)
+    frames.close()
+
+    # then every frame should be propagated at video resolution
+    assert propagated == list(range(FRAMES))
+    assert shapes == {(1, 1, 64, 96)}
+
+    # and the outputs past the memory horizon should be released (counted before the
+    # release that follows each yielded frame)
+    assert max(retained) == predictor.memory_horizon + 2
+    assert retained[-1] == retained[-2]
+    assert min(state["output_dict_per_obj"][0]["non_cond_frame_outputs"]) == (FRAMES - 1 - predictor.memory_horizon)
+
+
+def test_frame_records() -> None:
+    """Frame records carry the object IDs and seed scores, without empty masks."""
+    # Given the masks of two tracked objects, one of which left the frame
+    masks = np.zeros((2, 4, 6), dtype=bool)
+    masks[0, 1:3, 2:5] = True
+    tracked, left = 7, 8
+    seeds = {
+        tracked: {"predicted_iou": 0.9, "stability_score": 0.95, "point_coords": [[3, 2]]},
+        left: {"predicted_iou": 0.8, "stability_score": 0.9, "point_coords": [[1, 1]]},
+    }
+
+    # when I build the frame records
+    records = frame_records([tracked, left], masks, seeds, "uncompressed_rle")
+
+    # then only the object in frame should be recorded
+    assert len(records) == 1
+    assert records[0]["object_id"] == tracked
+    assert records[0]["area"] == masks[0].sum()
+    assert records[0]["bbox"] == [2.0, 1.0, 2.0, 1.0]
+    assert records[0]["predicted_iou"] == seeds[tracked]["predicted_iou"]
+    assert records[0]["segmentation"]["size"] == [4, 6]
+
+
+@pytest.mark.skipif(
+    not HieraTiny().checkpoint.exists(),
+    reason="Unable to find SAM 2 pre-trained weights.",
+)
+def test_video_sam_segments_chunks(video: Path, tmp_path: Path) -> None:
+    """Each chunk of a video is segmented and written frame by frame."""
+    # Given the chunks of the video, shorter than the video
+    rows = video_chunks({"path": str(video)}, chunk_frames=5)
+    assert [(row["start"], row["stop"]) for row in rows] == [(0, 5), (5, 10), (10, 12)]
+
+    # and a last chunk that reaches past the end, as from an overstated frame count
+    rows[-1]["stop"] = FRAMES + 3
+
+    # when I segment the chunks
+    video_sam = VideoSam(
+        str(tmp_path / "masks"),
+        str(video.parent),
+        model=HieraTiny,
+        settings=VideoSettings(output_mode=COCO_RLE, max_objects=2, mask_settings={"points_per_side": 4}),
+    )
+    summary = [video_sam(row) for row in rows]
+
+    # then the last chunk should end at the end of the video
+    assert [row["frames"] for row in summary] == [5, 5, 2]
+
+    # and every frame should be written once, with its chunk
+    frame_paths = sorted((tmp_path / "masks" / "square").iterdir())
+    assert [path.name for path in frame_paths] == [f"{idx:06d}.json" for idx in range(FRAMES)]
+    frame = 7
+    document = json.loads(frame_paths[frame].read_bytes())
+    assert document["info"]["frame"] == frame
+    assert document["info"]["chunk"] == [5, 10]
+
+
+@pytest.mark.parametrize("kwargs", [{"output_mode": "parquet"}, {"precision": "fp16"}, {"profile": "fastest"}])
+def test_video_settings_invalid(kwargs: dict) -> None:
+    """Invalid settings are rejected before any video predictor is built."""
+    # Given an unsupported output mode, precision or seed frame profile
+    # when I initialise the video settings
+    # then I should receive an error
+    with pytest.raises(ValueError):
+        VideoSettings(**kwargs)